@@ -1,6 +1,9 @@
 import streamlit as st
 import os
-from utils.failover import FailoverHandler
+import uuid
+from backend.utils.conversations import ConversationStore
+from backend.utils.failover import FailoverHandler
+from backend.utils.pool import provider_pool
 import asyncio
 
 # Initialize API keys with more graceful error handling
@@ -17,12 +20,21 @@ failover_handler = FailoverHandler()
 
 st.title("AI Chat with Multiple Models")
 
-# Initialize chat history
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# History lives in the conversation store (set PR_AGENT_CONVERSATION_DB to keep it across restarts)
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore()
+
+conversation_store = get_conversation_store()
+
+# The conversation id sits in the URL, so a page refresh picks the same chat back up
+if "conversation" not in st.query_params:
+    st.query_params["conversation"] = uuid.uuid4().hex
+conversation_id = st.query_params["conversation"]
+history = conversation_store.history(conversation_id)
 
 # Display chat history
-for message in st.session_state.messages:
+for message in (history["messages"] if history else []):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
@@ -34,20 +46,32 @@ model = st.selectbox(
 
 # Chat input
 if prompt := st.chat_input("What's on your mind?"):
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = {"role": "user", "content": prompt}
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Generate AI response
+    # Stream the AI response into the placeholder as tokens arrive
+    async def stream_response(placeholder):
+        response = ""
+        # Token counts and rolled-up summaries are kept with the stored conversation
+        window = conversation_store.context(conversation_id, None).window(model) + [user_message]
+        try:
+            async for delta in failover_handler.stream_with_fallback(window, {"name": model}):
+                response += delta
+                placeholder.markdown(response + "▌")
+        finally:
+            # Each turn runs on a fresh event loop; close the connection pools it opened
+            await provider_pool.aclose()
+        return response
+
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         try:
-            response = asyncio.run(failover_handler.generate_with_fallback(
-                st.session_state.messages,
-                {"name": model}
-            ))
+            response = asyncio.run(stream_response(message_placeholder))
             message_placeholder.markdown(response)
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            conversation_store.append(conversation_id, None, [
+                user_message,
+                {"role": "assistant", "content": response}
+            ])
         except Exception as e:
             message_placeholder.error(f"Error: {str(e)}") 
\ No newline at end of file
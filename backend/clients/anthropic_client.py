@@ -1,40 +1,97 @@
-from anthropic import Anthropic
+import asyncio
+import json
 import os
-from typing import Dict, List
-from ..config import ANTHROPIC_API_CONFIG
-
-class AnthropicClient:
-    def __init__(self):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        self.default_model = ANTHROPIC_API_CONFIG["default_model"]
-
-    async def generate_response(self, messages: List[Dict[str, str]], **kwargs):
-        try:
-            # Convert chat format to Anthropic format
-            prompt = "\n\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-            
-            message = self.client.messages.create(
-                model=kwargs.get('name', self.default_model),
-                max_tokens=kwargs.get('max_tokens', ANTHROPIC_API_CONFIG["max_tokens"]),
-                temperature=kwargs.get('temperature', ANTHROPIC_API_CONFIG["temperature"]),
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+from typing import Any, Dict, List, Optional
+
+from ..config import ANTHROPIC_API_CONFIG, get_model_config
+from ..utils.formatting import anthropic_usage, format_for_anthropic
+from .base import ProviderClient
+
+
+class AnthropicClient(ProviderClient):
+    name = "anthropic"
+    sdk = "anthropic"
+    supports_batch = True
+
+    def build_client(self, **common):
+        return self.sdk_module().AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), **common)
+
+    def max_completion_tokens(self, model_name: str) -> Optional[int]:
+        return ANTHROPIC_API_CONFIG["max_tokens"]
+
+    def request(self, messages: List[Dict[str, str]], model_name: str) -> Dict[str, Any]:
+        """Messages API arguments: native system blocks, alternating turns and cache breakpoints"""
+        system, turns = format_for_anthropic(
+            messages, ANTHROPIC_API_CONFIG["prompt_caching"], ANTHROPIC_API_CONFIG["min_cacheable_tokens"]
+        )
+        request = {
+            # Short aliases such as claude-3-opus resolve to the dated model id
+            "model": get_model_config(model_name)["name"],
+            "max_tokens": ANTHROPIC_API_CONFIG["max_tokens"],
+            "messages": turns
+        }
+        if system:
+            request["system"] = system
+        return request
+
+    async def generate(self, messages: List[Dict[str, str]], model_name: str,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+        async with self.pool.slot(self.name):
+            response = await self.client.messages.create(
+                **self.request(messages, model_name), **self.request_options(timeout)
             )
-            
-            return {
-                "content": message.content[0].text,
-                "model_info": {
-                    "name": kwargs.get('name', self.default_model),
-                    "provider": "anthropic"
+        return {"content": response.content[0].text, "usage": anthropic_usage(response.usage)}
+
+    async def stream(self, messages: List[Dict[str, str]], model_name: str, usage: Dict[str, int],
+                     timeout: Optional[float] = None):
+        async with self.pool.slot(self.name):
+            stream_manager = self.client.messages.stream(
+                **self.request(messages, model_name), **self.request_options(timeout)
+            )
+            async with stream_manager as stream:
+                async for text in stream.text_stream:
+                    if text:
+                        yield text
+                usage.update(anthropic_usage((await stream.get_final_message()).usage))
+
+    def _batch_requests(self, path: str, model_name: str) -> List[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as f:
+            return [
+                {"custom_id": item["custom_id"], "params": self.request(item["messages"], model_name)}
+                for item in map(json.loads, f)
+            ]
+
+    async def submit_batch(self, path: str, model_name: str) -> str:
+        # Message batches take the requests inline, so parts are kept small enough to send in one body
+        requests = await asyncio.to_thread(self._batch_requests, path, model_name)
+        batch = await self.client.messages.batches.create(requests=requests)
+        return batch.id
+
+    async def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        batch = await self.client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "state": "ended" if batch.processing_status == "ended" else "running",
+            "provider_status": batch.processing_status,
+            "completed": counts.succeeded,
+            "failed": counts.errored + counts.canceled + counts.expired,
+            "error": None
+        }
+
+    async def batch_results(self, batch_id: str):
+        async for entry in await self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                yield {
+                    "custom_id": entry.custom_id,
+                    "status": "success",
+                    "response": result.message.content[0].text,
+                    "usage": anthropic_usage(result.message.usage)
                 }
-            }
-            
-        except Exception as e:
-            raise Exception(f"Anthropic API error: {str(e)}")
+            else:
+                # Errored results carry the API error; canceled and expired ones only their type
+                error = getattr(getattr(result, "error", None), "error", None)
+                yield {"custom_id": entry.custom_id, "status": "error", "error": getattr(error, "message", None) or result.type}
 
-# Create instance
-anthropic_client = AnthropicClient()
\ No newline at end of file
+    async def cancel_batch(self, batch_id: str):
+        await self.client.messages.batches.cancel(batch_id)
@@ -0,0 +1,70 @@
+import importlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ..utils.pool import ProviderPool, provider_pool
+
+
+class ProviderClient:
+    """
+    One LLM provider behind the interface the failover layer uses.
+
+    Subclasses name their SDK module, which is imported only when the first client is
+    built, and implement generate() and stream(). Register them in PROVIDERS in
+    backend/config.py; models pick their provider through MODELS.
+    """
+
+    name: str = ""
+    sdk: str = ""
+    # Whether the provider has an asynchronous batch API (used by backend/utils/batch_jobs.py)
+    supports_batch: bool = False
+
+    def __init__(self, pool: Optional[ProviderPool] = None):
+        self.pool = pool or provider_pool
+
+    @property
+    def client(self):
+        return self.pool.client(self.name, self.sdk, self.build_client)
+
+    def sdk_module(self):
+        return importlib.import_module(self.sdk)
+
+    def build_client(self, **common):
+        """Construct the SDK client from the pool's http_client, timeout and max_retries"""
+        raise NotImplementedError
+
+    @staticmethod
+    def request_options(timeout: Optional[float]) -> Dict[str, Any]:
+        """Per-call SDK options; a timeout overrides the pool's default for this call only"""
+        return {"timeout": timeout} if timeout is not None else {}
+
+    def max_completion_tokens(self, model_name: str) -> Optional[int]:
+        """The completion cap sent with each request, or None when the provider's default applies"""
+        return None
+
+    async def generate(self, messages: List[Dict[str, str]], model_name: str,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Returns {"content": str, "usage": dict}; `timeout` is what is left of the request's budget"""
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict[str, str]], model_name: str, usage: Dict[str, int],
+               timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yields text deltas; fills in `usage` if the provider reports it on streams"""
+        raise NotImplementedError
+
+    async def submit_batch(self, path: str, model_name: str) -> str:
+        """Submit a JSONL file of {"custom_id", "messages"} lines as one batch; returns the provider's batch id"""
+        raise NotImplementedError
+
+    async def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        """
+        Returns {"state", "provider_status", "completed", "failed", "error"}. The state is "running",
+        "ended" (results can be downloaded, possibly partial) or "failed" (nothing to download).
+        """
+        raise NotImplementedError
+
+    def batch_results(self, batch_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yields {"custom_id", "status": "success", "response", "usage"} or {"custom_id", "status": "error", "error"}"""
+        raise NotImplementedError
+
+    async def cancel_batch(self, batch_id: str):
+        raise NotImplementedError
@@ -1,39 +1,24 @@
-from openai import OpenAI
 import os
-from typing import Dict, List
+from typing import Any, Dict
+
 from ..config import NVIDIA_API_CONFIG
+from .openai_client import OpenAIClient
+
+
+class NvidiaClient(OpenAIClient):
+    """NVIDIA's OpenAI-compatible endpoint"""
 
-class NvidiaClient:
-    def __init__(self):
-        self.client = OpenAI(
+    name = "nvidia"
+    api_key_env = "NVIDIA_API_KEY"
+    # The OpenAI-compatible endpoint has no batch API
+    supports_batch = False
+
+    def build_client(self, **common):
+        return self.sdk_module().AsyncOpenAI(
             base_url=NVIDIA_API_CONFIG["base_url"],
-            api_key=os.getenv("NVIDIA_API_KEY")
+            api_key=os.getenv(self.api_key_env),
+            **common
         )
-        self.model_id = NVIDIA_API_CONFIG["model_id"]
-
-    async def generate_response(self, messages: List[Dict[str, str]], **kwargs):
-        try:
-            completion = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                temperature=kwargs.get('temperature', NVIDIA_API_CONFIG["temperature"]),
-                top_p=kwargs.get('top_p', NVIDIA_API_CONFIG["top_p"]),
-                max_tokens=kwargs.get('max_tokens', NVIDIA_API_CONFIG["max_tokens"]),
-                stream=True
-            )
-            
-            response_text = ""
-            for chunk in completion:
-                if chunk.choices[0].delta.content is not None:
-                    response_text += chunk.choices[0].delta.content
 
-            return {
-                "content": response_text,
-                "model_info": {
-                    "name": self.model_id,
-                    "provider": "nvidia"
-                }
-            }
-            
-        except Exception as e:
-            raise Exception(f"NVIDIA API error: {str(e)}") 
\ No newline at end of file
+    def request_params(self, model_name: str) -> Dict[str, Any]:
+        return {"temperature": 0.5, "top_p": 1, "max_tokens": 1024}
@@ -1,68 +1,147 @@
-from openai import OpenAI
+import asyncio
+import json
 import os
-from typing import Dict, List
-from ..config import OPENAI_API_CONFIG
+import tempfile
+from typing import Any, Dict, List, Optional
 
-class OpenAIClient:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from ..utils.formatting import openai_usage
+from .base import ProviderClient
 
-    async def generate_response(self, messages: List[Dict[str, str]], **kwargs):
-        try:
-            completion = self.client.chat.completions.create(
-                model=kwargs.get('name', 'gpt-4'),
+
+class OpenAIClient(ProviderClient):
+    name = "openai"
+    sdk = "openai"
+    api_key_env = "OPENAI_API_KEY"
+    supports_batch = True
+    # Batch API statuses that end a batch; everything else is still running
+    batch_end_states = {"completed": "ended", "expired": "ended", "cancelled": "ended", "failed": "failed"}
+
+    def build_client(self, **common):
+        return self.sdk_module().AsyncOpenAI(api_key=os.getenv(self.api_key_env), **common)
+
+    def request_params(self, model_name: str) -> Dict[str, Any]:
+        """Provider-specific arguments added to every chat completion"""
+        return {}
+
+    def max_completion_tokens(self, model_name: str) -> Optional[int]:
+        return self.request_params(model_name).get("max_tokens")
+
+    async def generate(self, messages: List[Dict[str, str]], model_name: str,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+        async with self.pool.slot(self.name):
+            response = await self.client.chat.completions.create(
+                model=model_name,
                 messages=messages,
-                temperature=kwargs.get('temperature', OPENAI_API_CONFIG["temperature"]),
-                max_tokens=kwargs.get('max_tokens', OPENAI_API_CONFIG["max_tokens"]),
-                stream=True
+                **self.request_params(model_name),
+                **self.request_options(timeout)
             )
-            
-            response_text = ""
-            for chunk in completion:
-                if chunk.choices[0].delta.content is not None:
-                    response_text += chunk.choices[0].delta.content
-
-            # Return only the formatted content
-            return response_text
-            
-        except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+        return {"content": response.choices[0].message.content, "usage": openai_usage(response.usage)}
 
-    def _format_response(self, text: str) -> str:
-        """Format the response text with proper markdown"""
-        # Split into paragraphs
-        paragraphs = text.split('\n\n')
-        
-        formatted_text = ""
-        
-        for para in paragraphs:
-            # Check if it's a list item
-            if para.strip().startswith(('1.', '2.', '3.', '-', '*')):
-                formatted_text += para + "\n\n"
-            # Check if it's a heading
-            elif para.strip().startswith('#'):
-                formatted_text += para + "\n\n"
-            # Regular paragraph
-            else:
-                formatted_text += para + "\n\n"
-        
-        return formatted_text.strip()
+    async def stream(self, messages: List[Dict[str, str]], model_name: str, usage: Dict[str, int],
+                     timeout: Optional[float] = None):
+        async with self.pool.slot(self.name):
+            stream = await self.client.chat.completions.create(
+                model=model_name,
+                messages=messages,
+                stream=True,
+                # Usage only comes on streams when asked for, in a final chunk with no choices
+                stream_options={"include_usage": True},
+                **self.request_params(model_name),
+                **self.request_options(timeout)
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    if getattr(chunk, "usage", None) is not None:
+                        usage.update(openai_usage(chunk.usage))
+            finally:
+                await stream.close()
 
     async def generate_image(self, prompt: str, **kwargs):
-        try:
-            response = self.client.images.generate(
+        async with self.pool.slot(self.name):
+            response = await self.client.images.generate(
                 model=kwargs.get('name', 'dall-e-3'),
                 prompt=prompt,
                 size=kwargs.get('size', "1024x1024"),
                 quality=kwargs.get('quality', "standard"),
+                response_format=kwargs.get('response_format', "url"),
                 n=1
             )
-            return {
-                "image_url": response.data[0].url,
-                "model_info": {
-                    "name": kwargs.get('name', 'dall-e-3'),
-                    "provider": "openai"
-                }
+        return {
+            "image_url": response.data[0].url,
+            "b64_json": response.data[0].b64_json,
+            "model_info": {
+                "name": kwargs.get('name', 'dall-e-3'),
+                "provider": self.name
             }
-        except Exception as e:
-            raise Exception(f"DALL-E API error: {str(e)}")
\ No newline at end of file
+        }
+
+    def _write_batch_input(self, path: str, upload_path: str, model_name: str):
+        with open(path, encoding="utf-8") as source, open(upload_path, "w", encoding="utf-8") as upload:
+            for line in source:
+                item = json.loads(line)
+                upload.write(json.dumps({
+                    "custom_id": item["custom_id"],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": model_name, "messages": item["messages"], **self.request_params(model_name)}
+                }) + "\n")
+
+    async def submit_batch(self, path: str, model_name: str) -> str:
+        # Rewritten into the batch API's request format next to the part file, uploaded, then removed
+        fd, upload_path = tempfile.mkstemp(suffix=".jsonl", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            await asyncio.to_thread(self._write_batch_input, path, upload_path, model_name)
+            with open(upload_path, "rb") as f:
+                uploaded = await self.client.files.create(file=f, purpose="batch")
+        finally:
+            os.unlink(upload_path)
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    async def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        batch = await self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        errors = [e.message for e in (batch.errors.data or [])] if batch.errors else []
+        return {
+            "state": self.batch_end_states.get(batch.status, "running"),
+            "provider_status": batch.status,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "error": "; ".join(e for e in errors if e) or None
+        }
+
+    async def batch_results(self, batch_id: str):
+        batch = await self.client.batches.retrieve(batch_id)
+        completion_type = self.sdk_module().types.chat.ChatCompletion
+        # Successful requests are in the output file, failed and expired ones in the error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            async with self.client.files.with_streaming_response.content(file_id) as response:
+                async for line in response.iter_lines():
+                    if line.strip():
+                        yield self._batch_result(json.loads(line), completion_type)
+
+    @staticmethod
+    def _batch_result(record: Dict[str, Any], completion_type) -> Dict[str, Any]:
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or (response.get("body") or {}).get("error") or {}
+            return {"custom_id": record["custom_id"], "status": "error", "error": error.get("message") or str(error)}
+        completion = completion_type.model_validate(response["body"])
+        return {
+            "custom_id": record["custom_id"],
+            "status": "success",
+            "response": completion.choices[0].message.content,
+            "usage": openai_usage(completion.usage)
+        }
+
+    async def cancel_batch(self, batch_id: str):
+        await self.client.batches.cancel(batch_id)
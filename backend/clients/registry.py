@@ -0,0 +1,46 @@
+import importlib
+from typing import Dict, Optional
+
+from ..config import PROVIDERS, get_model_config
+from ..utils.pool import ProviderPool, provider_pool
+from .base import ProviderClient
+
+
+class ProviderRegistry:
+    """
+    Provider clients by name, loaded from PROVIDERS on first use. Neither the provider
+    module nor its SDK is imported until a request actually needs that provider.
+    """
+
+    def __init__(self, pool: Optional[ProviderPool] = None, providers: Optional[Dict[str, str]] = None):
+        self.pool = pool or provider_pool
+        self.providers = dict(providers or PROVIDERS)
+        self._clients: Dict[str, ProviderClient] = {}
+
+    def register(self, name: str, target: str):
+        """Add or replace a provider, given as "module:Class" """
+        self.providers[name] = target
+        self._clients.pop(name, None)
+
+    def get(self, name: str) -> ProviderClient:
+        client = self._clients.get(name)
+        if client is None:
+            if name not in self.providers:
+                raise ValueError(f"Unknown provider: {name}")
+            module_name, class_name = self.providers[name].split(":")
+            client_class = getattr(importlib.import_module(module_name), class_name)
+            client = self._clients[name] = client_class(self.pool)
+        return client
+
+    def for_model(self, model: str) -> ProviderClient:
+        provider = get_model_config(model).get("provider")
+        if provider is None:
+            raise ValueError(f"No provider configured for model: {model}")
+        return self.get(provider)
+
+    def loaded(self):
+        return sorted(self._clients)
+
+
+# Shared by the failover handler and the image jobs
+provider_registry = ProviderRegistry()
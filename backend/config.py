@@ -1,4 +1,5 @@
-from typing import Dict
+import os
+from typing import Dict, Optional
 
 OPENAI_API_CONFIG = {
     "base_url": "https://integrate.api.nvidia.com/v1",
@@ -9,7 +10,8 @@ OPENAI_API_CONFIG = {
 }
 
 NVIDIA_API_CONFIG = {
-    "base_url": "https://integrate.api.nvidia.com/v1",
+    # Overridable so the backend can be pointed at a local mock provider
+    "base_url": os.getenv("NVIDIA_BASE_URL", "https://integrate.api.nvidia.com/v1"),
     "model_id": "nvidia/llama-3.1-nemotron-70b-instruct",
     "max_tokens": 1024,
     "temperature": 0.7,
@@ -36,27 +38,456 @@ ANTHROPIC_API_CONFIG = {
         }
     },
     "max_tokens": 4096,
-    "temperature": 0.7
+    "temperature": 0.7,
+    # Mark the system prompts (agent prompt, summary, brand excerpts) and the conversation prefix as
+    # cache breakpoints, each only once the prompt up to it reaches Anthropic's minimum cacheable length
+    "prompt_caching": True,
+    # 1024 tokens for Opus and Sonnet; Haiku models need 2048
+    "min_cacheable_tokens": 1024
 }
 
 # Update the MODELS configuration
+# context_window is the provider's total token limit (prompt + completion)
 MODELS = {
     "nvidia-llama": {
         "name": "nvidia/llama-3.1-nemotron-70b-instruct",
         "max_tokens": 1024,
         "temperature": 0.7,
-        "provider": "nvidia"
+        "provider": "nvidia",
+        "context_window": 128000
     },
     "gpt-4": {
         "name": "gpt-4",
         "max_tokens": 2048,
         "temperature": 0.7,
-        "provider": "openai"
+        "provider": "openai",
+        "context_window": 8192
+    },
+    "gpt-3.5-turbo": {
+        "name": "gpt-3.5-turbo",
+        "max_tokens": 2048,
+        "temperature": 0.7,
+        "provider": "openai",
+        "context_window": 16385
     },
     "claude-3": {
         "name": "claude-3-opus-20240229",
         "max_tokens": 4096,
         "temperature": 0.7,
-        "provider": "anthropic"
+        "provider": "anthropic",
+        "context_window": 200000
+    },
+    "claude-3-opus": {
+        "name": "claude-3-opus-20240229",
+        "max_tokens": 4096,
+        "temperature": 0.7,
+        "provider": "anthropic",
+        "context_window": 200000
+    },
+    "claude-3-sonnet": {
+        "name": "claude-3-sonnet-20240229",
+        "max_tokens": 4096,
+        "temperature": 0.7,
+        "provider": "anthropic",
+        "context_window": 200000
+    }
+}
+
+# Provider implementations, imported the first time a model on that provider is tried
+PROVIDERS = {
+    "openai": "backend.clients.openai_client:OpenAIClient",
+    "anthropic": "backend.clients.anthropic_client:AnthropicClient",
+    "nvidia": "backend.clients.nvidia_client:NvidiaClient"
+}
+
+# Failover order; each model's provider comes from MODELS
+FALLBACK_MODELS = [
+    "gpt-4",
+    "claude-3-opus",
+    "claude-3-sonnet",
+    "nvidia/llama-3.1-nemotron-70b-instruct",
+    "gpt-3.5-turbo"
+]
+
+# Used for models that are not listed in MODELS
+DEFAULT_MODEL_CONFIG = {
+    "max_tokens": 1024,
+    "temperature": 0.7,
+    "context_window": 8192
+}
+
+def get_model_config(model: str) -> Dict:
+    """Look up a model by its MODELS key or by its provider-side name"""
+    if model in MODELS:
+        return MODELS[model]
+    for config in MODELS.values():
+        if config["name"] == model:
+            return config
+    return {"name": model, **DEFAULT_MODEL_CONFIG}
+
+# Chat models named in config/agent_config.py that are not configured here, and the model used instead
+MODEL_ALIASES = {
+    "gpt-4-turbo": "gpt-4"
+}
+
+def resolve_chat_model(model: str) -> Optional[str]:
+    """The configured chat model for a name or alias, or None for unknown and image-only models"""
+    model = MODEL_ALIASES.get(model, model)
+    if model in MODELS or model in FALLBACK_MODELS or any(c["name"] == model for c in MODELS.values()):
+        return model
+    return None
+
+# Connection pooling and concurrency limits for each provider's HTTP client
+PROVIDER_POOL_CONFIG = {
+    "openai": {
+        "max_connections": 200,
+        "max_keepalive_connections": 50,
+        "keepalive_expiry": 30.0,
+        "max_concurrency": 200,
+        "timeout": 120.0,
+        "connect_timeout": 10.0,
+        "max_retries": 0
+    },
+    "anthropic": {
+        "max_connections": 200,
+        "max_keepalive_connections": 50,
+        "keepalive_expiry": 30.0,
+        "max_concurrency": 200,
+        "timeout": 120.0,
+        "connect_timeout": 10.0,
+        "max_retries": 0
+    },
+    "nvidia": {
+        "max_connections": 100,
+        "max_keepalive_connections": 25,
+        "keepalive_expiry": 30.0,
+        "max_concurrency": 100,
+        "timeout": 120.0,
+        "connect_timeout": 10.0,
+        "max_retries": 0
     }
-} 
\ No newline at end of file
+}
+
+# End-to-end latency budget per request, in seconds. Clients may ask for another budget with the
+# `timeout` field or an X-Request-Timeout header, up to "max". Provider attempts get what is left.
+DEADLINE_CONFIG = {
+    "default": 60.0,
+    "max": 180.0,
+    "agent_budgets": {
+        "crisis_manager": 30.0,
+        "social_media": 30.0,
+        "media_relations": 60.0,
+        "visual_creator": 60.0,
+        "content_strategist": 90.0,
+        "analytics_expert": 90.0
+    },
+    # An attempt is not started with less than this left; the request fails with 504 instead
+    "min_attempt": 1.0,
+    # Same-model retries on transient errors (connection drops, 5xx), with full-jitter backoff
+    "retries": 1,
+    "retry_on": ["connection", "server_error"],
+    "backoff_base": 0.25,
+    "backoff_max": 2.0
+}
+
+# Hedged failover: start the next fallback model if the current one is slow
+HEDGING_CONFIG = {
+    "enabled": False,
+    # Seconds to wait before launching a hedge when no latency history exists
+    "delay": 3.0,
+    # Use the p95 of recent successful attempts as the delay once enough samples exist
+    "use_p95": True,
+    "min_samples": 20,
+    "window": 200,
+    "max_in_flight": 2
+}
+
+# Per-provider and per-model health tracking and circuit breakers
+HEALTH_CONFIG = {
+    "ewma_alpha": 0.3,
+    # Latency assumed for backends that have no successful samples yet
+    "default_latency": 5.0,
+    # Rolling window for the error rate
+    "window_seconds": 300,
+    "min_requests": 5,
+    "error_rate_threshold": 0.5,
+    "consecutive_failures": 5,
+    # How long a circuit stays open before a half-open probe is allowed
+    "open_seconds": 30,
+    # Minimum gap between probes while half-open
+    "probe_interval": 10,
+    # Ranking penalty per unit of error rate
+    "error_penalty": 4.0
+}
+
+# Response cache in front of the failover chain
+CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 2048,
+    "default_ttl": 3600,
+    # Seconds a cached answer stays valid per agent; 0 disables caching for that agent
+    "agent_ttls": {
+        "crisis_manager": 300,
+        "media_relations": 1800,
+        "content_strategist": 86400,
+        "social_media": 3600,
+        "analytics_expert": 600,
+        "visual_creator": 86400
+    },
+    # Optional SQLite file shared by all workers and kept across restarts
+    "sqlite_path": os.getenv("PR_AGENT_CACHE_DB"),
+    "max_disk_entries": 50000
+}
+
+# Near-duplicate answer lookup for paraphrased single-turn queries. Off unless PR_AGENT_SEMANTIC_CACHE=1:
+# queries that differ in one name or figure look alike, so a hit also needs the same numbers,
+# names and negations (see backend/utils/semantic_cache.py)
+SEMANTIC_CACHE_CONFIG = {
+    "enabled": os.getenv("PR_AGENT_SEMANTIC_CACHE") == "1",
+    "dim": 512,
+    # Maximum cached queries per agent and model; least recently used are evicted
+    "capacity": 2048,
+    # Minimum cosine similarity for a hit; agents not listed never use the semantic cache.
+    # crisis_manager is left out on purpose: its answers are specific to one incident
+    "agent_thresholds": {
+        "media_relations": 0.8
+    },
+    # Optional directory for memory-mapped vector matrices instead of heap arrays
+    "mmap_dir": os.getenv("PR_AGENT_SEMANTIC_DIR")
+}
+
+# Bulk /api/pr-agent/batch requests
+BATCH_CONFIG = {
+    "max_items": 500,
+    # Items generating at once across all batches in a worker; provider caps still apply on top
+    "max_concurrency": 16
+}
+
+# /api/pr-agent/war-room: one situation handled by several agents at once
+WAR_ROOM_CONFIG = {
+    "default_agents": ["crisis_manager", "media_relations", "content_strategist"],
+    "max_agents": 6,
+    "synthesis_prompt": (
+        "You lead a PR war room. Several specialists have each responded to the same situation. "
+        "Merge their drafts into one coordinated plan: resolve contradictions, keep the strongest "
+        "wording, and list the immediate actions in priority order."
+    )
+}
+
+# Conversation trimming to each model's context window
+CONTEXT_CONFIG = {
+    # Share of the context window kept free to absorb token estimation error
+    "safety_margin": 0.1,
+    # Share of the prompt budget the rolled-up summary of older turns may use
+    "summary_share": 0.15,
+    # Characters of each older turn kept in the summary
+    "summary_chars_per_turn": 200
+}
+
+# Client-side rate limiting in front of the providers
+SCHEDULER_CONFIG = {
+    "enabled": True,
+    # Requests and tokens (prompt estimate + completion cap sent) per minute for each provider;
+    # reservations are corrected to the reported usage once each call finishes
+    "provider_limits": {
+        "openai": {"rpm": 500, "tpm": 150000},
+        "anthropic": {"rpm": 400, "tpm": 200000},
+        "nvidia": {"rpm": 200, "tpm": 100000}
+    },
+    # Optional tighter limits for individual models
+    "model_limits": {
+        "gpt-4": {"rpm": 200, "tpm": 40000}
+    },
+    # Lower runs first; agents not listed get default_priority
+    "priorities": {
+        "crisis_manager": 0,
+        "media_relations": 1,
+        "social_media": 2,
+        "analytics_expert": 2,
+        "content_strategist": 3,
+        "visual_creator": 3
+    },
+    "default_priority": 2,
+    # Completion tokens reserved for requests that send no max_tokens (OpenAI), until the usage is known
+    "completion_estimate": 512,
+    # Worker processes sharing the account limits above; run_servers.py sets this
+    "workers": int(os.getenv("PR_AGENT_WORKERS", "1")),
+    # Longest one attempt queues for a provider's capacity before failover moves on to the next model;
+    # the client gets a 429 with Retry-After only when every model is out of capacity
+    "max_queue_wait": 2.0
+}
+
+# Server-side conversation history, so clients only send the new message each turn
+CONVERSATION_CONFIG = {
+    # Conversations kept in memory; older ones are reloaded from SQLite when they come back
+    "max_hot": 1024,
+    # Seconds without a new turn before a conversation is dropped
+    "ttl": 7 * 24 * 3600,
+    # Messages kept per conversation; the oldest are dropped beyond this
+    "max_messages": 200,
+    # SQLite file shared by all workers; unset keeps conversations in memory only
+    "sqlite_path": os.getenv("PR_AGENT_CONVERSATION_DB")
+}
+
+# Asynchronous image generation (/api/images)
+IMAGE_CONFIG = {
+    "default_model": "dall-e-3",
+    "sizes": ["1024x1024", "1792x1024", "1024x1792"],
+    "qualities": ["standard", "hd"],
+    # Images generating at once per worker, and jobs allowed to wait behind them
+    "workers": 2,
+    "max_pending": 50,
+    # Finished jobs stay pollable for this many seconds
+    "job_ttl": 3600,
+    # Content-addressed image files, keyed by prompt, model, size and quality
+    "cache_dir": os.getenv("PR_AGENT_IMAGE_DIR", "data/images")
+}
+
+# Offline bulk generation through the providers' batch APIs (POST /api/batch-jobs)
+BATCH_JOB_CONFIG = {
+    "default_agent": "content_strategist",
+    "default_model": "gpt-4",
+    # Input files larger than this are refused
+    "max_requests": 100000,
+    "max_bytes": 200 * 1024 * 1024,
+    # Requests per provider batch; bigger inputs are split into several batches
+    "part_size": {
+        "openai": 50000,
+        # Anthropic takes the requests inline in one HTTP body
+        "anthropic": 5000
+    },
+    "poll_interval": float(os.getenv("PR_AGENT_BATCH_POLL_SECONDS", "30")),
+    # A worker polling a job holds it this long, so other workers leave it alone
+    "lease_seconds": 300,
+    # Finished jobs and their files are deleted after this many seconds
+    "retention": 7 * 24 * 3600,
+    # Job table, input parts and result files
+    "directory": os.getenv("PR_AGENT_BATCH_DIR", "data/batch_jobs")
+}
+
+# Brand guides and past releases retrieved into the agents' prompts (see backend/utils/brand_index.py)
+BRAND_INDEX_CONFIG = {
+    # Directory of brand documents; retrieval is off when unset
+    "source_dir": os.getenv("PR_AGENT_BRAND_DIR"),
+    # Memory-mapped index files and per-document chunk caches
+    "index_dir": os.getenv("PR_AGENT_BRAND_INDEX_DIR", "data/brand_index"),
+    "extensions": [".md", ".markdown", ".txt", ".rst"],
+    # Chunks are windows of this many words, overlapping by chunk_overlap
+    "chunk_words": 160,
+    "chunk_overlap": 32,
+    # Snippets added to the prompt per agent; 0 turns retrieval off for that agent
+    "top_k": 3,
+    "agent_top_k": {
+        "content_strategist": 4,
+        "media_relations": 4,
+        "visual_creator": 2
+    },
+    "max_snippet_chars": 800,
+    "bm25_k1": 1.2,
+    "bm25_b": 0.75,
+    # Share of the score from hashed-vector cosine similarity, the rest from BM25; 0 skips the vectors
+    "vector_weight": 0.3,
+    "dim": 512,
+    # Best BM25 matches reranked with the vectors; keeps lookups fast on large corpora
+    "rerank_candidates": 1000,
+    # Chunks scoring below this (BM25 scaled to the best match, blended with cosine) are left out
+    "min_score": 0.1,
+    # Seconds between checks of the source directory for added, changed or removed files
+    "refresh_interval": 60,
+    # Old index generations are deleted only once no worker has used them for two refresh intervals,
+    # and the newest few are always kept
+    "keep_generations": 3
+}
+
+# Mention exports aggregated locally for the analytics agent (see backend/utils/mentions.py)
+MENTIONS_CONFIG = {
+    # Uploads are parsed in pieces of about this size, so memory stays flat whatever the file size
+    "chunk_bytes": 4 * 1024 * 1024,
+    "max_bytes": 2 * 1024 ** 3,
+    # Longest single record; more than this without a complete row usually means a quote left open
+    "max_record_bytes": 16 * 1024 * 1024,
+    # Columns (CSV) or keys (JSONL) tried in order when the request does not name them
+    "text_fields": ["text", "content", "message", "body", "snippet", "full_text", "title"],
+    "time_fields": ["timestamp", "created_at", "published_at", "date", "datetime", "time", "published"],
+    # Longer timestamp values are treated as unparseable
+    "max_time_chars": 40,
+    # Distinct terms tracked while streaming; rarer ones are dropped and may be undercounted
+    "max_terms": 50000,
+    "top_terms": 25,
+    "min_term_chars": 3,
+    # Longest volume series sent to the model; the hour, day or week buckets are picked to fit
+    "max_points": 90,
+    # Robust z-score (against the median and MAD of the series) at which a bucket is a spike
+    "spike_z": 3.5,
+    "spike_min_mentions": 10,
+    "max_spikes": 5,
+    "default_query": "Analyze this mention data: what drove volume and sentiment, what the spikes were about, "
+                     "and what the communications team should do next.",
+    # Word weights from -3 (very negative) to 3 (very positive); a negator just before a word flips it
+    "lexicon": {
+        "amazing": 3, "awesome": 3, "best": 3, "excellent": 3, "fantastic": 3, "love": 3, "loved": 3,
+        "outstanding": 3, "brilliant": 3, "perfect": 3,
+        "great": 2, "good": 2, "happy": 2, "impressive": 2, "recommend": 2, "thanks": 2, "thank": 2,
+        "win": 2, "proud": 2, "excited": 2, "reliable": 2, "innovative": 2, "helpful": 2, "congrats": 2,
+        "like": 1, "nice": 1, "fine": 1, "fast": 1, "easy": 1, "support": 1, "trust": 1, "fixed": 1,
+        "slow": -1, "issue": -1, "issues": -1, "problem": -1, "delay": -1, "delayed": -1, "confusing": -1,
+        "expensive": -1, "bug": -1, "down": -1, "outage": -2,
+        "bad": -2, "poor": -2, "broken": -2, "disappointed": -2, "disappointing": -2, "angry": -2,
+        "refund": -2, "complaint": -2, "fail": -2, "failed": -2, "failure": -2, "crash": -2, "hate": -3,
+        "lawsuit": -2, "recall": -2, "boycott": -3, "scam": -3, "fraud": -3, "terrible": -3,
+        "awful": -3, "worst": -3, "horrible": -3, "disgusting": -3, "unacceptable": -3, "lied": -3
+    },
+    "negators": ["not", "no", "never", "don", "didn", "doesn", "isn", "wasn", "aren", "won", "cannot", "hardly"]
+}
+
+# Optional per-query model routing ahead of failover (see backend/utils/router.py)
+ROUTER_CONFIG = {
+    # Requests can opt in or out with "route"; this is the default for requests that don't say
+    "enabled": False,
+    # Answer quality of each routable model, higher is better
+    "model_tiers": {
+        "gpt-3.5-turbo": 1,
+        "nvidia/llama-3.1-nemotron-70b-instruct": 2,
+        "claude-3-sonnet": 2,
+        "gpt-4": 3,
+        "claude-3-opus": 3
+    },
+    # Lowest tier each agent accepts, whatever the query
+    "agent_min_tier": {
+        "crisis_manager": 2,
+        "media_relations": 1,
+        "content_strategist": 1,
+        "social_media": 1,
+        "analytics_expert": 2,
+        "visual_creator": 1
+    },
+    # Query complexity (0-1) at or above which a tier is required
+    "complexity_tiers": [[0.66, 3], [0.33, 2]],
+    # Keyword stems that suggest a hard or an easy query
+    "complex_keywords": [
+        "strateg", "crisis", "legal", "lawsuit", "regulat", "analy", "plan", "compar", "evaluat",
+        "stakeholder", "breach", "recall", "investigat", "apolog", "risk"
+    ],
+    "simple_keywords": [
+        "rewrite", "rephrase", "shorten", "typo", "proofread", "tweet", "headline", "hashtag",
+        "translate", "summar", "title", "caption"
+    ],
+    # Logistic classifier weights; tune them offline from the routing log
+    "weights": {
+        "bias": -0.6,
+        "length": 1.8,
+        "complex_keywords": 0.7,
+        "simple_keywords": -0.9,
+        "questions": 0.3,
+        "lines": 0.8
+    },
+    # Added to the classifier input per agent
+    "agent_bias": {
+        "crisis_manager": 0.8,
+        "analytics_expert": 0.4
+    },
+    # Queries of this many estimated tokens count as fully long
+    "long_query_tokens": 400,
+    # JSONL file receiving one line per routed request; unset disables the log
+    "log_path": os.getenv("PR_AGENT_ROUTING_LOG")
+}
@@ -1,17 +1,75 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from utils.failover import FailoverHandler
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from backend.clients.registry import provider_registry
+from backend.config import (
+    BATCH_CONFIG, BATCH_JOB_CONFIG, CACHE_CONFIG, IMAGE_CONFIG, MENTIONS_CONFIG, ROUTER_CONFIG, WAR_ROOM_CONFIG,
+    resolve_chat_model
+)
+from backend.utils.batch_jobs import BatchJobError, BatchJobManager
+from backend.utils.brand_index import BrandIndex
+from backend.utils.cache import ResponseCache
+from backend.utils.coalesce import SingleFlight
+from backend.utils.deadline import Deadline
+from backend.utils.conversations import ConversationConflict, ConversationStore
+from backend.utils.failover import AllModelsFailed, FailoverHandler
+from backend.utils.images import ImageJobQueue, QueueFull
+from backend.utils.mentions import MentionDataError, render_summary, summarize_mentions
+from backend.utils.metrics import (
+    CACHE_LOOKUPS, CACHE_STATS, CIRCUIT_OPEN, COALESCED, ERRORS, REGISTRY, MetricsMiddleware
+)
+from backend.utils.pool import provider_pool
+from backend.utils.router import ModelRouter
+from backend.utils.semantic_cache import SemanticCache
+from config.agent_config import PR_AGENTS as SHARED_AGENTS
+import asyncio
+import json
+import logging
+import math
 import os
-import openai
+import time
 
 # Set your API keys
 os.environ["OPENAI_API_KEY"] = "your-openai-key"
 os.environ["ANTHROPIC_API_KEY"] = "your-anthropic-key"
 # Add NVIDIA API key setup
 
-app = FastAPI()
+logger = logging.getLogger("pr_agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pick up batch jobs still running at the providers
+    batch_jobs.resume()
+    # Builds or loads the brand index in the background, then keeps it in step with the documents
+    brand_index.start()
+    yield
+    await brand_index.aclose()
+    await batch_jobs.aclose()
+    await image_jobs.aclose()
+    semantic_cache.close()
+    # Release the keep-alive connections held by this worker
+    await provider_pool.aclose()
+
+app = FastAPI(lifespan=lifespan)
 failover_handler = FailoverHandler()
+# Routes on the same live latency and circuit state the failover ranking uses
+model_router = ModelRouter(failover_handler.health)
+response_cache = ResponseCache()
+semantic_cache = SemanticCache()
+single_flight = SingleFlight()
+conversation_store = ConversationStore()
+brand_index = BrandIndex()
+
+async def generate_image(prompt: str, **kwargs):
+    # The OpenAI client, and its SDK, load on the first image job
+    return await provider_registry.get("openai").generate_image(prompt, **kwargs)
+
+image_jobs = ImageJobQueue(generate_image)
+# Shared by every batch in this worker
+batch_limit = asyncio.Semaphore(BATCH_CONFIG["max_concurrency"])
 
 # Enable CORS
 app.add_middleware(
@@ -21,8 +79,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency, status and optional per-request timing log (PR_AGENT_TIMING_LOG)
+app.add_middleware(MetricsMiddleware)
 
 PR_AGENTS = {
+    # PR agents shared with the frontends
+    **SHARED_AGENTS,
     "reviewer": {
         "title": "Code Reviewer",
         "description": "You review code changes and provide constructive feedback."
@@ -38,23 +100,708 @@ class PRRequest(BaseModel):
     query: str
     agent_type: str
     model: str
+    # Opt in to (or out of) hedged failover; None uses HEDGING_CONFIG["enabled"]
+    hedge: Optional[bool] = None
+    # Let the router pick a model for this query; false pins `model`. None uses ROUTER_CONFIG["enabled"]
+    route: Optional[bool] = None
+    # Client-chosen id; the server keeps the history, so `query` only carries the new message
+    conversation_id: Optional[str] = Field(None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+    # Latency budget in seconds; overrides X-Request-Timeout and the agent's default in DEADLINE_CONFIG
+    timeout: Optional[float] = Field(None, gt=0)
+
+class BatchRequest(BaseModel):
+    items: List[PRRequest]
+    # Lower this batch's concurrency below BATCH_CONFIG["max_concurrency"]
+    max_concurrency: Optional[int] = None
+
+class WarRoomRequest(BaseModel):
+    query: str
+    # Agents from config/agent_config.py; defaults to WAR_ROOM_CONFIG["default_agents"]
+    agent_types: Optional[List[str]] = None
+    # One chat model for every agent; None uses each agent's configured model, through MODEL_ALIASES
+    model: Optional[str] = None
+    # Merge the agents' answers in a final pass once they have all finished
+    synthesize: bool = False
+    synthesis_model: Optional[str] = None
+    # Latency budget for each agent's answer, and separately for the synthesis
+    timeout: Optional[float] = Field(None, gt=0)
+
+class ImageRequest(BaseModel):
+    prompt: str = Field(..., min_length=1, max_length=4000)
+    model: str = IMAGE_CONFIG["default_model"]
+    size: str = IMAGE_CONFIG["sizes"][0]
+    quality: str = IMAGE_CONFIG["qualities"][0]
+
+def agent_system_prompt(agent_type: str) -> Optional[str]:
+    if agent_type not in PR_AGENTS:
+        return None
+    return f"You are a {PR_AGENTS[agent_type]['title']}. {PR_AGENTS[agent_type]['description']}"
+
+# Offline bulk generation; its requests get the same system prompts as /api/pr-agent
+batch_jobs = BatchJobManager(agent_system_prompt)
+
+def build_messages(request: PRRequest):
+    system_prompt = agent_system_prompt(request.agent_type)
+    if system_prompt is None:
+        raise HTTPException(status_code=400, detail=f"Unknown agent type: {request.agent_type}")
+    user_message = {"role": "user", "content": request.query}
+    # Brand excerpts for this query go after the stable prefix, so that prefix stays cacheable
+    grounding = brand_index.prompt_message(request.agent_type, request.query)
+    grounding = [grounding] if grounding is not None else []
+    if request.conversation_id is None:
+        return [{"role": "system", "content": system_prompt}] + grounding + [user_message]
+    try:
+        context = conversation_store.context(request.conversation_id, request.agent_type, system_prompt)
+    except ConversationConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Stored history, trimmed to the requested model's window, then the new message
+    return context.window(request.model) + grounding + [user_message]
+
+def route_request(request: PRRequest):
+    """Returns the request with the routed model, and the routing decision (None when the model is pinned)"""
+    if not (request.route if request.route is not None else ROUTER_CONFIG["enabled"]):
+        return request, None
+    decision = model_router.route(request.query, request.agent_type, request.model)
+    return request.model_copy(update={"model": decision["model"]}), decision
+
+def routing_summary(decision: dict) -> dict:
+    return {k: decision[k] for k in ("model", "requested", "complexity", "tier")}
+
+def log_route(decision: Optional[dict], started: float, status: str, **outcome):
+    """Record how a routed request went, for tuning the router offline"""
+    if decision is not None:
+        model_router.log(decision, {
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            **outcome
+        })
+
+def save_turn(request: PRRequest, content: str):
+    """Record a completed exchange in the request's conversation, if it has one"""
+    if request.conversation_id is not None:
+        conversation_store.append(request.conversation_id, request.agent_type, [
+            {"role": "user", "content": request.query},
+            {"role": "assistant", "content": content}
+        ])
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# HTTP status for each class of upstream failure once the whole failover chain is exhausted
+ERROR_STATUS = {
+    "timeout": 504,
+    "deadline_exceeded": 504,
+    "rate_limited": 429,
+    "circuit_open": 503
+}
+
+def error_response(e: Exception) -> HTTPException:
+    """Turn a generation failure into an HTTP error that says what kind of failure it was"""
+    if isinstance(e, AllModelsFailed):
+        error_class = e.error_class
+        status_code = ERROR_STATUS.get(error_class, 502)
+    else:
+        error_class = "internal"
+        status_code = 500
+    ERRORS.inc(provider="all", error_class=error_class)
+    headers = {"X-Error-Class": error_class}
+    if status_code in (429, 503) and getattr(e, "retry_after", None) is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return HTTPException(status_code=status_code, detail=str(e), headers=headers)
+
+def request_deadline(request: PRRequest, http_request: Optional[Request] = None) -> Deadline:
+    """The request's latency budget, from the body, else the X-Request-Timeout header, else the agent default"""
+    seconds = request.timeout
+    header = http_request.headers.get("x-request-timeout") if http_request is not None else None
+    if seconds is None and header:
+        try:
+            seconds = float(header)
+        except ValueError:
+            seconds = None
+        if seconds is None or not seconds > 0:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be a positive number of seconds")
+    return Deadline.for_request(request.agent_type, seconds)
+
+def request_model_config(request: PRRequest, http_request: Optional[Request] = None) -> dict:
+    """Model settings for the failover handler, including the agent's rate-limit priority and deadline"""
+    model_config = {
+        "name": request.model,
+        "priority": failover_handler.scheduler.priority_for(request.agent_type),
+        "deadline": request_deadline(request, http_request)
+    }
+    if request.hedge is not None:
+        model_config["hedge"] = request.hedge
+    return model_config
+
+def cache_lookup(request: PRRequest, messages, model_config, http_request: Request):
+    """
+    Returns (cache key, cached result). The key is None when caching is off for this request.
+    Exact matches come from the response cache, paraphrases from the semantic cache.
+    `X-Cache-Bypass: 1` or `Cache-Control: no-cache` skips the lookup but still refreshes the entry.
+    """
+    if not CACHE_CONFIG["enabled"] or response_cache.ttl_for(request.agent_type) <= 0:
+        return None, None
+    key = response_cache.make_key(messages, model_config)
+    bypass = http_request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes") or \
+        "no-cache" in http_request.headers.get("cache-control", "").lower()
+    if bypass:
+        response_cache.record_bypass()
+        CACHE_LOOKUPS.inc(outcome="bypass")
+        return key, None
+    cached = response_cache.get(key)
+    outcome = "hit"
+    # The semantic cache matches on the new message alone, so it only serves single-turn requests
+    if cached is None and sum(m["role"] != "system" for m in messages) == 1:
+        cached = semantic_cache.lookup(request.agent_type, request.model, request.query)
+        outcome = "semantic_hit" if cached is not None else "miss"
+    CACHE_LOOKUPS.inc(outcome=outcome)
+    return key, cached
+
+def cache_store(request: PRRequest, cache_key: Optional[str], result: dict):
+    if cache_key is None:
+        return
+    ttl = response_cache.ttl_for(request.agent_type)
+    payload = {"content": result["content"], "model_info": result["model_info"]}
+    response_cache.set(cache_key, payload, ttl)
+    semantic_cache.add(request.agent_type, request.model, request.query, payload, ttl)
 
 @app.post("/api/pr-agent")
-async def pr_agent(request: PRRequest):
+async def pr_agent(request: PRRequest, http_request: Request, response: Response):
+    body, cache_status = await run_pr_request(request, http_request)
+    if cache_status is not None:
+        response.headers["X-Cache"] = cache_status
+    return body
+
+async def run_pr_request(request: PRRequest, http_request: Request):
+    """Answer one PR agent request; returns the response body and the X-Cache status, if any"""
+    request, decision = route_request(request)
+    started = time.perf_counter()
     try:
-        # Your existing logic here
-        system_prompt = f"You are a {PR_AGENTS[request.agent_type]['title']}. {PR_AGENTS[request.agent_type]['description']}"
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": request.query}
-        ]
+        body, cache_status = await answer_pr_request(request, http_request)
+    except HTTPException as e:
+        log_route(decision, started, "error", error_class=(e.headers or {}).get("X-Error-Class", "bad_request"))
+        raise
+    log_route(decision, started, "success", model_info=body["model_info"], cached=body.get("cached", False))
+    if decision is not None:
+        body["routing"] = routing_summary(decision)
+    return body, cache_status
 
-        response = await failover_handler.generate_with_fallback(messages, {"name": request.model})
+async def answer_pr_request(request: PRRequest, http_request: Request):
+    messages = build_messages(request)
+    model_config = request_model_config(request, http_request)
 
-        return {
-            "response": response,
-            "status": "success"
+    cache_key, cached = cache_lookup(request, messages, model_config, http_request)
+    if cached is not None:
+        save_turn(request, cached["content"])
+        body = {
+            "response": cached["content"],
+            "status": "success",
+            "model_info": cached["model_info"],
+            "cached": True
         }
+        if "similarity" in cached:
+            body["similarity"] = cached["similarity"]
+        if request.conversation_id is not None:
+            body["conversation_id"] = request.conversation_id
+        return body, "SEMANTIC-HIT" if "similarity" in cached else "HIT"
+
+    async def generate():
+        result = await failover_handler.generate_with_details(messages, model_config)
+        cache_store(request, cache_key, result)
+        return result
 
+    # Identical requests already in flight share that generation instead of starting their own
+    flight_key = cache_key or response_cache.make_key(messages, model_config)
+    try:
+        result, coalesced = await single_flight.do(flight_key, generate)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise error_response(e)
+    save_turn(request, result["content"])
+
+    body = {
+        "response": result["content"],
+        "status": "success",
+        "model_info": result["model_info"],
+        # Includes prompt-cache reads and writes where the provider reports them
+        "usage": result.get("usage")
+    }
+    if coalesced:
+        body["coalesced"] = True
+    if "hedge" in result:
+        body["hedge"] = result["hedge"]
+    if request.conversation_id is not None:
+        body["conversation_id"] = request.conversation_id
+    return body, "MISS" if cache_key is not None else None
+
+@app.post("/api/pr-agent/batch")
+async def pr_agent_batch(batch: BatchRequest, http_request: Request):
+    """
+    Runs many PR agent requests concurrently and streams one JSON line per item, in completion order.
+    A failed item gets an error line and does not affect the others. The last line is a summary.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(batch.items) > BATCH_CONFIG["max_items"]:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_CONFIG['max_items']} items")
+    item_limit = asyncio.Semaphore(min(batch.max_concurrency or BATCH_CONFIG["max_concurrency"],
+                                       BATCH_CONFIG["max_concurrency"]))
+
+    async def run_item(index: int, item: PRRequest):
+        started = time.perf_counter()
+        async with item_limit, batch_limit:
+            try:
+                body, cache_status = await run_pr_request(item, http_request)
+                line = {"index": index, **body, "cache": cache_status}
+            except Exception as e:
+                if not isinstance(e, HTTPException):
+                    # Anything else must not end the stream and lose the items still in flight
+                    logger.exception("Batch item %d failed", index)
+                    e = error_response(e)
+                line = {
+                    "index": index,
+                    "status": "error",
+                    "detail": e.detail,
+                    "error_class": (e.headers or {}).get("X-Error-Class", "bad_request")
+                }
+                if e.headers and "Retry-After" in e.headers:
+                    line["retry_after"] = int(e.headers["Retry-After"])
+        line["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return line
+
+    async def results():
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(run_item(i, item)) for i, item in enumerate(batch.items)]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                failed += line["status"] != "success"
+                yield json.dumps(line) + "\n"
+            yield json.dumps({
+                "summary": True,
+                "total": len(tasks),
+                "succeeded": len(tasks) - failed,
+                "failed": failed,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            }) + "\n"
+        finally:
+            # Client went away: stop the items that have not finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.post("/api/pr-agent/war-room")
+async def pr_agent_war_room(request: WarRoomRequest, http_request: Request):
+    """
+    Runs one query through several agents concurrently and streams Server-Sent Events:
+    `token` events tagged with their agent as they arrive, `agent_done` or `agent_error` per agent,
+    then, if requested, a `synthesis` agent's tokens, and finally `done` with a per-agent summary.
+    """
+    agent_types = list(dict.fromkeys(request.agent_types or WAR_ROOM_CONFIG["default_agents"]))
+    unknown = [a for a in agent_types if a not in SHARED_AGENTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown agent types: {', '.join(unknown)}")
+    if not agent_types or len(agent_types) > WAR_ROOM_CONFIG["max_agents"]:
+        raise HTTPException(status_code=400, detail=f"Choose 1 to {WAR_ROOM_CONFIG['max_agents']} agents")
+    # Image agents such as visual_creator have no chat model to answer with
+    image_only = [a for a in agent_types if resolve_chat_model(SHARED_AGENTS[a]["model"]) is None]
+    if image_only:
+        raise HTTPException(status_code=400, detail=f"Agents without a chat model: {', '.join(image_only)}")
+    for model in (request.model, request.synthesis_model):
+        if model is not None and resolve_chat_model(model) is None:
+            raise HTTPException(status_code=400, detail=f"Unknown chat model: {model}")
+    items = {
+        agent: PRRequest(query=request.query, agent_type=agent,
+                         model=resolve_chat_model(request.model or SHARED_AGENTS[agent]["model"]),
+                         timeout=request.timeout)
+        for agent in agent_types
+    }
+
+    async def event_stream():
+        started = time.perf_counter()
+        events = asyncio.Queue()
+        answers = {}
+        summary = {}
+
+        async def run_agent(agent: str, item: PRRequest, messages, model_config):
+            info = {}
+            deltas = []
+            try:
+                cache_key, cached = cache_lookup(item, messages, model_config, http_request)
+                if cached is not None:
+                    deltas.append(cached["content"])
+                    await events.put(("token", {"agent": agent, "delta": cached["content"]}))
+                    info = {"model_info": cached["model_info"], "cached": True}
+                else:
+                    async for delta in failover_handler.stream_with_fallback(messages, model_config, info):
+                        deltas.append(delta)
+                        await events.put(("token", {"agent": agent, "delta": delta}))
+                    cache_store(item, cache_key, {"content": "".join(deltas), "model_info": info.get("model_info")})
+            except Exception as e:
+                error = error_response(e)
+                summary[agent] = {"status": "error", "error_class": error.headers["X-Error-Class"]}
+                await events.put(("agent_error", {
+                    "agent": agent, "detail": error.detail, "error_class": error.headers["X-Error-Class"]
+                }))
+                return
+            answers[agent] = "".join(deltas)
+            summary[agent] = {
+                "status": "success",
+                "model_info": info.get("model_info"),
+                "ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            await events.put(("agent_done", {
+                "agent": agent,
+                "model_info": info.get("model_info"),
+                "usage": info.get("usage"),
+                "ttft_ms": info.get("ttft_ms"),
+                "total_ms": info.get("total_ms"),
+                "cached": info.get("cached", False)
+            }))
+
+        # All agents start together, so the wait is the slowest agent rather than the sum
+        tasks = [
+            asyncio.create_task(run_agent(agent, item, build_messages(item), request_model_config(item, http_request)))
+            for agent, item in items.items()
+        ]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event, data = await events.get()
+                if await http_request.is_disconnected():
+                    return
+                if event != "token":
+                    remaining -= 1
+                yield sse_event(event, data)
+
+            if request.synthesize and answers:
+                async for event in synthesis_events(request, agent_types, answers, summary):
+                    if await http_request.is_disconnected():
+                        return
+                    yield event
+
+            yield sse_event("done", {
+                "status": "success" if answers else "error",
+                "agents": summary,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            })
+        finally:
+            # Client went away: stop the agents still generating
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def synthesis_events(request: WarRoomRequest, agent_types: List[str], answers: dict, summary: dict):
+    """Streams the merged plan as `token` events from the `synthesis` agent, then its `agent_done` or `agent_error`"""
+    drafts = "\n\n".join(
+        f"## {SHARED_AGENTS[agent]['title']}\n{answers[agent]}" for agent in agent_types if agent in answers
+    )
+    messages = [
+        {"role": "system", "content": WAR_ROOM_CONFIG["synthesis_prompt"]},
+        {"role": "user", "content": f"Situation:\n{request.query}\n\nSpecialist drafts:\n\n{drafts}"}
+    ]
+    model_config = {
+        "name": resolve_chat_model(request.synthesis_model or request.model or "gpt-4"),
+        # As urgent as the most urgent agent in the room
+        "priority": min(failover_handler.scheduler.priority_for(agent) for agent in agent_types),
+        "deadline": Deadline.for_request(seconds=request.timeout)
+    }
+    info = {}
+    try:
+        async for delta in failover_handler.stream_with_fallback(messages, model_config, info):
+            yield sse_event("token", {"agent": "synthesis", "delta": delta})
+    except Exception as e:
+        error = error_response(e)
+        summary["synthesis"] = {"status": "error", "error_class": error.headers["X-Error-Class"]}
+        yield sse_event("agent_error", {
+            "agent": "synthesis", "detail": error.detail, "error_class": error.headers["X-Error-Class"]
+        })
+        return
+    summary["synthesis"] = {"status": "success", "model_info": info.get("model_info")}
+    yield sse_event("agent_done", {
+        "agent": "synthesis",
+        "model_info": info.get("model_info"),
+        "usage": info.get("usage"),
+        "ttft_ms": info.get("ttft_ms"),
+        "total_ms": info.get("total_ms")
+    })
+
+@app.post("/api/pr-agent/stream")
+async def pr_agent_stream(request: PRRequest, http_request: Request):
+    """Server-Sent Events variant of /api/pr-agent: `token` events, then `done` or `error`"""
+    request, decision = route_request(request)
+    started = time.perf_counter()
+    routing = routing_summary(decision) if decision is not None else None
+    messages = build_messages(request)
+    model_config = request_model_config(request, http_request)
+    cache_key, cached = cache_lookup(request, messages, model_config, http_request)
+
+    async def event_stream():
+        if cached is not None:
+            save_turn(request, cached["content"])
+            log_route(decision, started, "success", model_info=cached["model_info"], cached=True)
+            yield sse_event("token", {"delta": cached["content"]})
+            yield sse_event("done", {
+                "status": "success",
+                "model_info": cached["model_info"],
+                "cached": True,
+                "similarity": cached.get("similarity"),
+                "conversation_id": request.conversation_id,
+                "routing": routing
+            })
+            return
+
+        # Identical requests already streaming attach to that stream and get its tokens replayed
+        flight_key = cache_key or response_cache.make_key(messages, model_config)
+        stream, info, coalesced = single_flight.stream(
+            flight_key,
+            lambda info: failover_handler.stream_with_fallback(messages, model_config, info),
+            on_complete=lambda content, info: cache_store(
+                request, cache_key, {"content": content, "model_info": info.get("model_info")}
+            )
+        )
+        deltas = []
+        try:
+            async for delta in stream:
+                if await http_request.is_disconnected():
+                    break
+                deltas.append(delta)
+                yield sse_event("token", {"delta": delta})
+            else:
+                save_turn(request, "".join(deltas))
+                log_route(decision, started, "success", model_info=info.get("model_info"), cached=False,
+                          ttft_ms=info.get("ttft_ms"))
+                yield sse_event("done", {
+                    "status": "success",
+                    "model_info": info.get("model_info"),
+                    "usage": info.get("usage"),
+                    "ttft_ms": info.get("ttft_ms"),
+                    "total_ms": info.get("total_ms"),
+                    "coalesced": coalesced,
+                    "conversation_id": request.conversation_id,
+                    "routing": routing
+                })
+        except Exception as e:
+            error = error_response(e)
+            log_route(decision, started, "error", error_class=error.headers["X-Error-Class"])
+            data = {
+                "status": "error",
+                "detail": error.detail,
+                "error_class": error.headers["X-Error-Class"]
+            }
+            if "Retry-After" in error.headers:
+                data["retry_after"] = int(error.headers["Retry-After"])
+            yield sse_event("error", data)
+        finally:
+            # Stops the upstream provider stream once no client is listening any more
+            await stream.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def image_job_body(job: dict) -> dict:
+    body = {k: v for k, v in job.items() if k != "image_key"}
+    if job["status"] == "succeeded":
+        body["image_url"] = f"/api/images/{job['image_key']}.png"
+    return body
+
+@app.post("/api/images", status_code=202)
+async def submit_image(request: ImageRequest):
+    """Queue an image generation; poll /api/images/jobs/{job_id} until it has succeeded or failed"""
+    if request.size not in IMAGE_CONFIG["sizes"] or request.quality not in IMAGE_CONFIG["qualities"]:
+        raise HTTPException(status_code=400, detail="Unsupported size or quality")
+    try:
+        job = image_jobs.submit(request.prompt, request.model, request.size, request.quality)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+    return image_job_body(job)
+
+@app.get("/api/images/jobs/{job_id}")
+async def image_job(job_id: str):
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Image job not found")
+    return image_job_body(job)
+
+@app.get("/api/images/{image_key}.png")
+async def image_file(image_key: str):
+    # Keys are sha256 hex digests; anything else could point outside the cache directory
+    if len(image_key) != 64 or any(c not in "0123456789abcdef" for c in image_key) or not image_jobs.cache.has(image_key):
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Content-addressed, so the file behind a URL never changes
+    return FileResponse(image_jobs.cache.path(image_key), media_type="image/png",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.post("/api/batch-jobs", status_code=202)
+async def submit_batch_job(http_request: Request, model: str = BATCH_JOB_CONFIG["default_model"],
+                           agent_type: str = BATCH_JOB_CONFIG["default_agent"]):
+    """
+    Queue a JSONL body (one {"query", "custom_id"?, "agent_type"?} object per line) for the provider's
+    batch API. Poll /api/batch-jobs/{job_id}; once it has completed, fetch /api/batch-jobs/{job_id}/results.
+    """
+    try:
+        job = await batch_jobs.create(http_request.stream(), model, agent_type)
+    except BatchJobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job
+
+@app.get("/api/batch-jobs")
+async def list_batch_jobs(limit: int = 50):
+    return {"jobs": batch_jobs.list(min(max(limit, 1), 500))}
+
+def find_batch_job(job_id: str) -> dict:
+    # Job ids are uuid hex and double as directory names
+    job = batch_jobs.get(job_id) if job_id.isalnum() else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@app.get("/api/batch-jobs/{job_id}")
+async def batch_job(job_id: str):
+    return find_batch_job(job_id)
+
+@app.get("/api/batch-jobs/{job_id}/results")
+async def batch_job_results(job_id: str):
+    """One JSON line per input request, in input order, with the answer or the reason it failed"""
+    job = find_batch_job(job_id)
+    if not job["results_ready"]:
+        raise HTTPException(status_code=409, detail=f"Batch job is {job['status']}, results are not ready")
+    return FileResponse(batch_jobs.output_path(job_id), media_type="application/x-ndjson",
+                        filename=f"batch-{job_id}.jsonl")
+
+@app.delete("/api/batch-jobs/{job_id}")
+async def cancel_batch_job(job_id: str):
+    find_batch_job(job_id)
+    return batch_jobs.cancel(job_id)
+
+# Content types that name the upload format when the request does not
+MENTION_FORMATS = {
+    "text/csv": "csv",
+    "text/tab-separated-values": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json": "jsonl"
+}
+
+@app.post("/api/analytics/mentions")
+async def analyze_mentions(http_request: Request, query: Optional[str] = None,
+                           model: str = SHARED_AGENTS["analytics_expert"]["model"],
+                           data_format: Optional[str] = Query(None, alias="format"),
+                           text_field: Optional[str] = None, time_field: Optional[str] = None,
+                           interval: Optional[str] = None, summary_only: bool = False):
+    """
+    Aggregate a CSV or JSONL mention export streamed as the request body (volume over time, sentiment,
+    top terms, spikes) and have the analytics agent interpret it. Only the compact summary is sent to
+    the model; summary_only=true skips the model and returns the aggregates alone.
+    """
+    if data_format is None:
+        data_format = MENTION_FORMATS.get(http_request.headers.get("content-type", "").split(";")[0].strip())
+    try:
+        summary = await summarize_mentions(http_request.stream(), data_format=data_format, text_field=text_field,
+                                           time_field=time_field, interval=interval)
+    except MentionDataError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if summary_only:
+        return {"summary": summary}
+
+    request = PRRequest(
+        query=f"{query or MENTIONS_CONFIG['default_query']}\n\n{render_summary(summary)}",
+        agent_type="analytics_expert",
+        model=model
+    )
+    body, _ = await run_pr_request(request, http_request)
+    return {**body, "summary": summary}
+
+@app.get("/api/conversations/{conversation_id}")
+async def get_conversation(conversation_id: str):
+    """Stored turns of a conversation, so a client can restore it after a reload"""
+    history = conversation_store.history(conversation_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return history
+
+@app.delete("/api/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    conversation_store.delete(conversation_id)
+    return {"status": "deleted", "conversation_id": conversation_id}
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness check used by run_servers.py; answers from the event loop without touching providers"""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/api/admin/providers")
+async def provider_health():
+    """Circuit-breaker state, EWMA latency and error rate per provider and model"""
+    return {
+        "health": failover_handler.health.snapshot(),
+        "try_order": [m["name"] for m in failover_handler.health.rank(failover_handler.fallback_models)],
+        "hedge_delay": round(failover_handler.hedge_delay(), 3),
+        "loaded_providers": failover_handler.providers.loaded()
+    }
+
+@app.get("/api/admin/scheduler")
+async def scheduler_stats():
+    """Rate-limit buckets, queue depth and how many requests were queued or turned away"""
+    return failover_handler.scheduler.snapshot()
+
+@app.get("/api/admin/cache")
+async def cache_stats():
+    """Response cache hit, miss and eviction counters"""
+    return {
+        **response_cache.snapshot(),
+        "semantic": semantic_cache.snapshot(),
+        "conversations": conversation_store.snapshot()
+    }
+
+@app.get("/api/admin/images")
+async def image_stats():
+    """Image jobs submitted, served from disk, deduplicated, generated and waiting"""
+    return image_jobs.snapshot()
+
+@app.get("/api/admin/batch-jobs")
+async def batch_job_stats():
+    """Batch jobs and their requests by status"""
+    return batch_jobs.snapshot()
+
+@app.get("/api/admin/brand-index")
+async def brand_index_stats():
+    """Documents, chunks and terms in the brand index, and how often it was rebuilt and searched"""
+    return brand_index.snapshot()
+
+@app.post("/api/admin/brand-index/reindex")
+async def reindex_brand_documents():
+    """Pick up changed brand documents now instead of at the next periodic check"""
+    if not brand_index.enabled:
+        raise HTTPException(status_code=400, detail="Set PR_AGENT_BRAND_DIR to enable the brand index")
+    changed = await asyncio.to_thread(brand_index.refresh)
+    return {"changed": changed, **brand_index.snapshot()}
+
+@app.get("/api/admin/coalescing")
+async def coalescing_stats():
+    """How many requests started a generation and how many joined one already in flight"""
+    return single_flight.snapshot()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of this worker's request, provider, cache and circuit metrics"""
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    snapshot = failover_handler.health.snapshot()
+    for kind in ("providers", "models"):
+        for name, health in snapshot[kind].items():
+            CIRCUIT_OPEN.set(states[health["state"]], kind=kind, name=name)
+    for stat, value in single_flight.snapshot().items():
+        COALESCED.set(value, kind=stat)
+    for stat, value in response_cache.snapshot().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            CACHE_STATS.set(value, stat=stat)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
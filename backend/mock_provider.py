@@ -0,0 +1,476 @@
+"""
+Local stand-in for the LLM providers, for load tests and offline development.
+
+Speaks the OpenAI-compatible chat completions API (also used for NVIDIA), the
+Anthropic messages API, streaming and non-streaming, the OpenAI images API, and the
+OpenAI and Anthropic batch APIs (batches finish after MOCK_BATCH_SECONDS), with configurable
+latency, token rate and injected errors, timeouts and 429s. Point the backend at it with:
+
+    OPENAI_BASE_URL=http://localhost:9000/v1
+    NVIDIA_BASE_URL=http://localhost:9000/v1
+    ANTHROPIC_BASE_URL=http://localhost:9000
+
+    uvicorn backend.mock_provider:app --port 9000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import struct
+import time
+import uuid
+import zlib
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+WORDS = (
+    "statement brand media release audience message campaign response stakeholders trust "
+    "launch coverage story update team community transparency impact customers commitment"
+).split()
+
+MOCK_CONFIG = {
+    # Time to first token is drawn from a lognormal distribution with this median (seconds)
+    "latency_median": float(os.getenv("MOCK_LATENCY_MEDIAN", "0.3")),
+    "latency_sigma": float(os.getenv("MOCK_LATENCY_SIGMA", "0.5")),
+    "tokens_per_second": float(os.getenv("MOCK_TOKENS_PER_SECOND", "80")),
+    "output_tokens": int(os.getenv("MOCK_OUTPUT_TOKENS", "120")),
+    # Probabilities per request of a 500, a hang until the client gives up, and a 429
+    "error_rate": float(os.getenv("MOCK_ERROR_RATE", "0")),
+    "timeout_rate": float(os.getenv("MOCK_TIMEOUT_RATE", "0")),
+    "rate_limit_rate": float(os.getenv("MOCK_RATE_LIMIT_RATE", "0")),
+    "timeout_seconds": float(os.getenv("MOCK_TIMEOUT_SECONDS", "600")),
+    "retry_after": int(os.getenv("MOCK_RETRY_AFTER", "2")),
+    # Seconds an image generation takes
+    "image_latency": float(os.getenv("MOCK_IMAGE_LATENCY", "2.0")),
+    # Seconds until a batch ends; error_rate also applies to each request in it
+    "batch_seconds": float(os.getenv("MOCK_BATCH_SECONDS", "5.0")),
+    # Per-provider overrides of any of the settings above, e.g. {"anthropic": {"error_rate": 1}}
+    "providers": json.loads(os.getenv("MOCK_PROVIDER_OVERRIDES", "{}"))
+}
+
+app = FastAPI(title="PR agent mock provider")
+stats: Dict[str, int] = {}
+
+
+def settings_for(provider: str) -> Dict[str, Any]:
+    return {**MOCK_CONFIG, **MOCK_CONFIG["providers"].get(provider, {})}
+
+
+def count(provider: str, outcome: str):
+    key = f"{provider}.{outcome}"
+    stats[key] = stats.get(key, 0) + 1
+
+
+def generate_words(settings: Dict[str, Any]):
+    n = max(1, int(random.gauss(settings["output_tokens"], settings["output_tokens"] * 0.2)))
+    return [random.choice(WORDS) for _ in range(n)]
+
+
+async def inject_faults(provider: str, settings: Dict[str, Any], error_body):
+    """Returns an error response to send instead of a completion, or None to carry on"""
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        count(provider, "rate_limited")
+        return JSONResponse(
+            error_body("rate_limit_error", "Mock rate limit"),
+            status_code=429,
+            headers={"retry-after": str(settings["retry_after"])}
+        )
+    roll -= settings["rate_limit_rate"]
+    if roll < settings["error_rate"]:
+        count(provider, "error")
+        return JSONResponse(error_body("api_error", "Mock upstream error"), status_code=500)
+    roll -= settings["error_rate"]
+    if roll < settings["timeout_rate"]:
+        count(provider, "timeout")
+        await asyncio.sleep(settings["timeout_seconds"])
+        return JSONResponse(error_body("timeout", "Mock timeout"), status_code=504)
+
+    await asyncio.sleep(random.lognormvariate(0, settings["latency_sigma"]) * settings["latency_median"])
+    return None
+
+
+def openai_error(kind: str, message: str):
+    return {"error": {"type": kind, "message": message, "code": kind}}
+
+
+def anthropic_error(kind: str, message: str):
+    return {"type": "error", "error": {"type": kind, "message": message}}
+
+
+def prompt_tokens(payload: Dict[str, Any]) -> int:
+    return len(json.dumps(payload.get("messages", []))) // 4 + len(json.dumps(payload.get("system", ""))) // 4
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    model = payload.get("model", "gpt-4")
+    provider = "nvidia" if model.startswith("nvidia/") else "openai"
+    settings = settings_for(provider)
+    failure = await inject_faults(provider, settings, openai_error)
+    if failure is not None:
+        return failure
+
+    count(provider, "success")
+    words = generate_words(settings)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    usage = {
+        "prompt_tokens": prompt_tokens(payload),
+        "completion_tokens": len(words),
+        "total_tokens": prompt_tokens(payload) + len(words)
+    }
+
+    if not payload.get("stream"):
+        await asyncio.sleep(len(words) / settings["tokens_per_second"])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+
+    async def chunks():
+        def chunk(delta, finish_reason=None, **extra):
+            body = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                **extra
+            }
+            return f"data: {json.dumps(body)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            await asyncio.sleep(1 / settings["tokens_per_second"])
+            yield chunk({"content": word if i == 0 else " " + word})
+        yield chunk({}, "stop")
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            # Like the real API: a last chunk with no choices carrying the usage
+            yield chunk(None, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    payload = await request.json()
+    model = payload.get("model", "claude-3-opus-20240229")
+    settings = settings_for("anthropic")
+    failure = await inject_faults("anthropic", settings, anthropic_error)
+    if failure is not None:
+        return failure
+
+    count("anthropic", "success")
+    words = generate_words(settings)
+    message_id = f"msg_{uuid.uuid4().hex[:12]}"
+    usage = {
+        "input_tokens": prompt_tokens(payload),
+        "output_tokens": len(words),
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0
+    }
+
+    if not payload.get("stream"):
+        await asyncio.sleep(len(words) / settings["tokens_per_second"])
+        return {
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": " ".join(words)}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage
+        }
+
+    async def events():
+        def event(name, body):
+            return f"event: {name}\ndata: {json.dumps({'type': name, **body})}\n\n"
+
+        yield event("message_start", {"message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": {**usage, "output_tokens": 0}
+        }})
+        yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for i, word in enumerate(words):
+            await asyncio.sleep(1 / settings["tokens_per_second"])
+            yield event("content_block_delta", {
+                "index": 0, "delta": {"type": "text_delta", "text": word if i == 0 else " " + word}
+            })
+        yield event("content_block_stop", {"index": 0})
+        yield event("message_delta", {
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(words)}
+        })
+        yield event("message_stop", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def prompt_color(seed: str):
+    digest = zlib.crc32(seed.encode("utf-8"))
+    return (digest >> 16) & 0xFF, (digest >> 8) & 0xFF, digest & 0xFF
+
+
+def solid_png(seed: str, width: int = 64, height: int = 64) -> bytes:
+    """A small single-colour PNG whose colour depends on the prompt"""
+    r, g, b = prompt_color(seed)
+    raw = b"".join(b"\x00" + bytes((r, g, b)) * width for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+@app.post("/v1/images/generations")
+async def image_generations(request: Request):
+    payload = await request.json()
+    settings = settings_for("openai_images")
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        count("openai_images", "rate_limited")
+        return JSONResponse(openai_error("rate_limit_error", "Mock rate limit"), status_code=429,
+                            headers={"retry-after": str(settings["retry_after"])})
+    if roll - settings["rate_limit_rate"] < settings["error_rate"]:
+        count("openai_images", "error")
+        return JSONResponse(openai_error("api_error", "Mock upstream error"), status_code=500)
+
+    await asyncio.sleep(settings["image_latency"])
+    count("openai_images", "success")
+    image = solid_png(payload.get("prompt", ""))
+    item = {"revised_prompt": payload.get("prompt")}
+    if payload.get("response_format") == "b64_json":
+        item["b64_json"] = base64.b64encode(image).decode("ascii")
+    else:
+        item["url"] = f"data:image/png;base64,{base64.b64encode(image).decode('ascii')}"
+    return {"created": int(time.time()), "data": [item]}
+
+
+files: Dict[str, bytes] = {}
+batches: Dict[str, Dict[str, Any]] = {}
+
+
+def iso(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+def batch_outcomes(provider: str, custom_ids) -> Dict[str, bool]:
+    """Which requests of a batch succeed, decided once when the batch ends"""
+    settings = settings_for(provider)
+    outcomes = {custom_id: random.random() >= settings["error_rate"] for custom_id in custom_ids}
+    for ok in outcomes.values():
+        count(f"{provider}_batch", "success" if ok else "error")
+    return outcomes
+
+
+@app.post("/v1/files")
+async def upload_file(request: Request):
+    form = await request.form()
+    upload = form["file"]
+    data = await upload.read()
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    files[file_id] = data
+    return {
+        "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+        "filename": upload.filename, "purpose": form.get("purpose", "batch"), "status": "processed"
+    }
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        return JSONResponse(openai_error("not_found", "No such file"), status_code=404)
+    return Response(files[file_id], media_type="application/octet-stream")
+
+
+def openai_batch_view(batch: Dict[str, Any]) -> Dict[str, Any]:
+    if batch["status"] == "in_progress" and time.time() >= batch["ends_at"]:
+        lines = batch.pop("requests")
+        outcomes = batch_outcomes("openai", [line["custom_id"] for line in lines])
+        output, errors = [], []
+        for line in lines:
+            if outcomes[line["custom_id"]]:
+                words = generate_words(settings_for("openai"))
+                body = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion",
+                    "created": int(time.time()), "model": line["body"].get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens(line["body"]), "completion_tokens": len(words),
+                              "total_tokens": prompt_tokens(line["body"]) + len(words)}
+                }
+                output.append({"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"],
+                               "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body},
+                               "error": None})
+            else:
+                errors.append({"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"],
+                               "response": {"status_code": 500, "request_id": uuid.uuid4().hex,
+                                            "body": openai_error("api_error", "Mock upstream error")},
+                               "error": None})
+        for key, records in (("output_file_id", output), ("error_file_id", errors)):
+            if records:
+                file_id = f"file-{uuid.uuid4().hex[:12]}"
+                files[file_id] = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+                batch[key] = file_id
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": len(lines), "completed": len(output), "failed": len(errors)}
+    return {k: v for k, v in batch.items() if k not in ("requests", "ends_at")}
+
+
+@app.post("/v1/batches")
+async def create_openai_batch(request: Request):
+    payload = await request.json()
+    if payload.get("input_file_id") not in files:
+        return JSONResponse(openai_error("invalid_request_error", "Unknown input file"), status_code=400)
+    lines = [json.loads(line) for line in files[payload["input_file_id"]].splitlines() if line.strip()]
+    now = time.time()
+    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+    batches[batch_id] = {
+        "id": batch_id, "object": "batch", "endpoint": payload.get("endpoint"), "errors": None,
+        "input_file_id": payload["input_file_id"], "completion_window": payload.get("completion_window", "24h"),
+        "status": "in_progress", "output_file_id": None, "error_file_id": None,
+        "created_at": int(now), "in_progress_at": int(now), "completed_at": None, "cancelled_at": None,
+        "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+        "requests": lines, "ends_at": now + settings_for("openai")["batch_seconds"]
+    }
+    return openai_batch_view(batches[batch_id])
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_openai_batch(batch_id: str):
+    if batch_id not in batches:
+        return JSONResponse(openai_error("not_found", "No such batch"), status_code=404)
+    return openai_batch_view(batches[batch_id])
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_openai_batch(batch_id: str):
+    batch = batches.get(batch_id)
+    if batch is None:
+        return JSONResponse(openai_error("not_found", "No such batch"), status_code=404)
+    if batch["status"] == "in_progress":
+        batch.pop("requests", None)
+        batch["status"] = "cancelled"
+        batch["cancelled_at"] = int(time.time())
+    return openai_batch_view(batch)
+
+
+def anthropic_batch_view(batch: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    if batch["processing_status"] == "in_progress" and time.time() >= batch["ends_at"]:
+        requests = batch.pop("requests")
+        outcomes = batch_outcomes("anthropic", [r["custom_id"] for r in requests])
+        results = []
+        for item in requests:
+            if outcomes[item["custom_id"]]:
+                words = generate_words(settings_for("anthropic"))
+                result = {"type": "succeeded", "message": {
+                    "id": f"msg_{uuid.uuid4().hex[:12]}", "type": "message", "role": "assistant",
+                    "model": item["params"].get("model"), "content": [{"type": "text", "text": " ".join(words)}],
+                    "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": prompt_tokens(item["params"]), "output_tokens": len(words),
+                              "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+                }}
+            else:
+                result = {"type": "errored", "error": anthropic_error("api_error", "Mock upstream error")}
+            results.append({"custom_id": item["custom_id"], "result": result})
+        batch["results"] = results
+        batch["processing_status"] = "ended"
+        batch["ended_at"] = iso(time.time())
+        batch["request_counts"] = {
+            "processing": 0, "succeeded": sum(outcomes.values()),
+            "errored": len(outcomes) - sum(outcomes.values()), "canceled": 0, "expired": 0
+        }
+    view = {k: v for k, v in batch.items() if k not in ("requests", "results", "ends_at")}
+    if batch["processing_status"] == "ended":
+        view["results_url"] = f"{base_url}v1/messages/batches/{batch['id']}/results"
+    return view
+
+
+@app.post("/v1/messages/batches")
+async def create_anthropic_batch(request: Request):
+    payload = await request.json()
+    now = time.time()
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+    batches[batch_id] = {
+        "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+        "request_counts": {"processing": len(payload["requests"]), "succeeded": 0, "errored": 0,
+                           "canceled": 0, "expired": 0},
+        "ended_at": None, "created_at": iso(now), "expires_at": iso(now + 86400), "archived_at": None,
+        "cancel_initiated_at": None, "results_url": None,
+        "requests": payload["requests"], "ends_at": now + settings_for("anthropic")["batch_seconds"]
+    }
+    return anthropic_batch_view(batches[batch_id], str(request.base_url))
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def get_anthropic_batch(batch_id: str, request: Request):
+    if batch_id not in batches:
+        return JSONResponse(anthropic_error("not_found_error", "No such batch"), status_code=404)
+    return anthropic_batch_view(batches[batch_id], str(request.base_url))
+
+
+@app.post("/v1/messages/batches/{batch_id}/cancel")
+async def cancel_anthropic_batch(batch_id: str, request: Request):
+    batch = batches.get(batch_id)
+    if batch is None:
+        return JSONResponse(anthropic_error("not_found_error", "No such batch"), status_code=404)
+    if batch["processing_status"] == "in_progress":
+        requests = batch.pop("requests")
+        batch["results"] = [{"custom_id": r["custom_id"], "result": {"type": "canceled"}} for r in requests]
+        batch["processing_status"] = "ended"
+        batch["cancel_initiated_at"] = batch["ended_at"] = iso(time.time())
+        batch["request_counts"] = {"processing": 0, "succeeded": 0, "errored": 0,
+                                   "canceled": len(requests), "expired": 0}
+    return anthropic_batch_view(batch, str(request.base_url))
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def anthropic_batch_results(batch_id: str):
+    batch = batches.get(batch_id)
+    if batch is None or "results" not in batch:
+        return JSONResponse(anthropic_error("not_found_error", "Results not available"), status_code=404)
+    return Response("".join(json.dumps(r) + "\n" for r in batch["results"]), media_type="application/x-jsonl")
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return stats
+
+
+@app.post("/mock/config")
+async def update_mock_config(request: Request):
+    """Change latency or fault injection while a benchmark is running"""
+    MOCK_CONFIG.update(await request.json())
+    return MOCK_CONFIG
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the mock LLM provider server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
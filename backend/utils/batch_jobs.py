@@ -0,0 +1,424 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from ..clients.registry import ProviderRegistry, provider_registry
+from ..config import BATCH_JOB_CONFIG
+
+# Job states; a job is "submitting" until every part has a provider batch
+SUBMITTING = "submitting"
+RUNNING = "running"
+CANCELLING = "cancelling"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE = (SUBMITTING, RUNNING, CANCELLING)
+
+# Part states
+PENDING = "pending"
+ENDED = "ended"
+
+# Both batch APIs accept these ids
+CUSTOM_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class BatchJobError(Exception):
+    """The input file or job parameters can't be turned into a batch job"""
+
+
+class BatchJobManager:
+    """
+    Offline bulk generation through the providers' asynchronous batch APIs, for traffic that can
+    wait hours and should not compete with /api/pr-agent for real-time rate limits.
+
+    An uploaded JSONL file (one {"query", "custom_id"?, "agent_type"?} object per line) is
+    validated while it streams to disk and split into parts of at most `part_size` requests.
+    A background poller submits each part as a provider batch, tracks progress in a SQLite
+    table shared by all workers (a lease keeps two workers off the same job), downloads each
+    part's results as soon as it ends, and finally joins them into one output JSONL file.
+    """
+
+    def __init__(self, system_prompt: Callable[[str], Optional[str]], providers: Optional[ProviderRegistry] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.system_prompt = system_prompt
+        self.providers = providers or provider_registry
+        self.config = config or BATCH_JOB_CONFIG
+        self.directory = self.config["directory"]
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._last_prune = 0.0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the app does not create the data directory
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.directory, "jobs.db"), check_same_thread=False,
+                                 isolation_level=None, timeout=5.0)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS batch_jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, provider TEXT NOT NULL, model TEXT NOT NULL, "
+                "agent_type TEXT NOT NULL, total INTEGER NOT NULL, completed INTEGER NOT NULL DEFAULT 0, "
+                "failed INTEGER NOT NULL DEFAULT 0, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "finished_at REAL, lease_owner TEXT, lease_until REAL NOT NULL DEFAULT 0)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS batch_parts ("
+                "job_id TEXT NOT NULL, part INTEGER NOT NULL, status TEXT NOT NULL, provider_batch_id TEXT, "
+                "provider_status TEXT, total INTEGER NOT NULL, completed INTEGER NOT NULL DEFAULT 0, "
+                "failed INTEGER NOT NULL DEFAULT 0, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (job_id, part))"
+            )
+            # Tables created before cancel_requested existed
+            if "cancel_requested" not in {row["name"] for row in db.execute("PRAGMA table_info(batch_parts)")}:
+                try:
+                    db.execute("ALTER TABLE batch_parts ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    # Another worker added it first
+                    pass
+            db.execute("CREATE INDEX IF NOT EXISTS batch_jobs_status ON batch_jobs (status)")
+            self._db = db
+        return self._db
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self.db.execute(sql, params)
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    def _part_path(self, job_id: str, part: int, kind: str) -> str:
+        return os.path.join(self._job_dir(job_id), f"{kind}-{part:04d}.jsonl")
+
+    def output_path(self, job_id: str) -> str:
+        return os.path.join(self._job_dir(job_id), "output.jsonl")
+
+    # Submission
+
+    async def create(self, chunks: AsyncIterator[bytes], model: str, agent_type: str) -> Dict[str, Any]:
+        """Store an uploaded JSONL body as a new job; returns the job. Raises BatchJobError on bad input."""
+        try:
+            client = self.providers.for_model(model)
+        except ValueError:
+            client = None
+        if client is None or not client.supports_batch:
+            raise BatchJobError(f"{model} has no batch API; use an OpenAI or Anthropic model")
+        provider = client.name
+        if self.system_prompt(agent_type) is None:
+            raise BatchJobError(f"Unknown agent type: {agent_type}")
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._job_dir(job_id))
+        try:
+            parts = await self._split_input(job_id, chunks, agent_type, self.config["part_size"][provider])
+        except BaseException:
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+            raise
+
+        now = time.time()
+        total = sum(parts)
+        self._execute(
+            "INSERT INTO batch_jobs (id, status, provider, model, agent_type, total, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, SUBMITTING, provider, model, agent_type, total, now, now)
+        )
+        for part, size in enumerate(parts):
+            self._execute(
+                "INSERT INTO batch_parts (job_id, part, status, total) VALUES (?, ?, ?, ?)",
+                (job_id, part, PENDING, size)
+            )
+        self.start()
+        self._wake.set()
+        return self.get(job_id)
+
+    async def _split_input(self, job_id: str, chunks: AsyncIterator[bytes], agent_type: str,
+                           part_size: int) -> List[int]:
+        """Validate the upload line by line and write it out as parts of {"custom_id", "messages"}"""
+        parts: List[int] = []
+        seen = set()
+        received = 0
+        buffer = bytearray()
+        out = None
+        number = 0
+
+        def write(line: bytes):
+            nonlocal out, number
+            number += 1
+            if not line.strip():
+                return
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise BatchJobError(f"Line {number} is not valid JSON")
+            if not isinstance(item, dict) or not isinstance(item.get("query"), str) or not item["query"].strip():
+                raise BatchJobError(f"Line {number} needs a non-empty \"query\" string")
+            custom_id = str(item.get("custom_id", f"line-{number}"))
+            if not CUSTOM_ID.match(custom_id):
+                raise BatchJobError(f"Line {number}: custom_id must be 1-64 letters, digits, '_' or '-'")
+            if custom_id in seen:
+                raise BatchJobError(f"Line {number}: duplicate custom_id {custom_id}")
+            seen.add(custom_id)
+            if len(seen) > self.config["max_requests"]:
+                raise BatchJobError(f"Input has more than {self.config['max_requests']} requests")
+            line_agent = item.get("agent_type", agent_type)
+            if not isinstance(line_agent, str):
+                raise BatchJobError(f"Line {number}: agent_type must be a string")
+            prompt = self.system_prompt(line_agent)
+            if prompt is None:
+                raise BatchJobError(f"Line {number}: unknown agent type {line_agent}")
+
+            if out is None or parts[-1] >= part_size:
+                if out is not None:
+                    out.close()
+                parts.append(0)
+                out = open(self._part_path(job_id, len(parts) - 1, "input"), "w", encoding="utf-8")
+            out.write(json.dumps({
+                "custom_id": custom_id,
+                "messages": [{"role": "system", "content": prompt}, {"role": "user", "content": item["query"]}]
+            }) + "\n")
+            parts[-1] += 1
+
+        def feed(chunk: bytes):
+            # Only the new bytes can hold a newline, so a long line is not rescanned on every chunk
+            start = len(buffer)
+            buffer.extend(chunk)
+            consumed = 0
+            newline = buffer.find(b"\n", start)
+            while newline >= 0:
+                write(buffer[consumed:newline])
+                consumed = newline + 1
+                newline = buffer.find(b"\n", consumed)
+            del buffer[:consumed]
+
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > self.config["max_bytes"]:
+                    raise BatchJobError(f"Input is larger than {self.config['max_bytes']} bytes")
+                # Parsing and rewriting up to max_bytes would stall the event loop, so it runs in a thread
+                await asyncio.to_thread(feed, chunk)
+            await asyncio.to_thread(write, buffer)
+        finally:
+            if out is not None:
+                out.close()
+        if not parts:
+            raise BatchJobError("Input has no requests")
+        return parts
+
+    # Lookups
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {k: row[k] for k in row.keys() if not k.startswith("lease_")}
+        job["parts"] = [
+            {k: part[k] for k in part.keys() if k != "job_id"}
+            for part in self._execute("SELECT * FROM batch_parts WHERE job_id = ? ORDER BY part", (job_id,))
+        ]
+        job["results_ready"] = job["status"] in (COMPLETED, CANCELLED) and os.path.exists(self.output_path(job_id))
+        return job
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._execute(
+            "SELECT id, status, provider, model, agent_type, total, completed, failed, created_at, finished_at "
+            "FROM batch_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        )
+        return [dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Ask the provider to stop the job's batches; results finished so far are still collected"""
+        self._execute(
+            "UPDATE batch_jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+            (CANCELLING, time.time(), job_id, SUBMITTING, RUNNING)
+        )
+        if self._wake is not None:
+            self._wake.set()
+        return self.get(job_id)
+
+    # Polling
+
+    def resume(self):
+        """Start polling at server startup if an earlier process left jobs behind"""
+        if os.path.exists(os.path.join(self.directory, "jobs.db")):
+            self.start()
+
+    def start(self):
+        # Created on first use so the poller belongs to the server's event loop
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._poll_forever())
+
+    async def _poll_forever(self):
+        while True:
+            await self.poll_once()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.config["poll_interval"])
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def poll_once(self):
+        """Move every active job this worker can lease one step forward"""
+        self._prune()
+        rows = self._execute(
+            f"SELECT id FROM batch_jobs WHERE status IN ({', '.join('?' * len(ACTIVE))})", ACTIVE
+        ).fetchall()
+        for row in rows:
+            if not self._lease(row["id"]):
+                continue
+            try:
+                await self._advance(row["id"])
+            except Exception as e:
+                # Provider or network trouble: keep the job and try again on the next poll
+                self._execute("UPDATE batch_jobs SET error = ?, updated_at = ? WHERE id = ?",
+                              (f"{type(e).__name__}: {e}", time.time(), row["id"]))
+
+    def _lease(self, job_id: str) -> bool:
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE batch_jobs SET lease_owner = ?, lease_until = ? "
+            "WHERE id = ? AND (lease_until < ? OR lease_owner = ?)",
+            (self.owner, now + self.config["lease_seconds"], job_id, now, self.owner)
+        )
+        return cursor.rowcount == 1
+
+    async def _advance(self, job_id: str):
+        job = self._execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        client = self.providers.get(job["provider"])
+        cancelling = job["status"] == CANCELLING
+        parts = self._execute("SELECT * FROM batch_parts WHERE job_id = ? ORDER BY part", (job_id,)).fetchall()
+
+        for part in parts:
+            number = part["part"]
+            if part["status"] == PENDING:
+                if cancelling:
+                    self._update_part(job_id, number, status=CANCELLED)
+                    continue
+                batch_id = await client.submit_batch(self._part_path(job_id, number, "input"), job["model"])
+                self._update_part(job_id, number, status=RUNNING, provider_batch_id=batch_id)
+            elif part["status"] == RUNNING:
+                if cancelling and not part["cancel_requested"]:
+                    # Asked once per part, then only polled until the batch ends
+                    try:
+                        await client.cancel_batch(part["provider_batch_id"])
+                    except Exception:
+                        # Usually the batch is already ending; the refusal must not stall the job
+                        pass
+                    self._update_part(job_id, number, cancel_requested=1)
+                status = await client.batch_status(part["provider_batch_id"])
+                self._update_part(job_id, number, provider_status=status["provider_status"],
+                                  completed=status["completed"], failed=status["failed"], error=status["error"])
+                if status["state"] == "ended":
+                    await self._download(client, job_id, number, part["provider_batch_id"])
+                    self._update_part(job_id, number, status=ENDED)
+                elif status["state"] == "failed":
+                    self._update_part(job_id, number, status=FAILED)
+
+        parts = self._execute("SELECT * FROM batch_parts WHERE job_id = ?", (job_id,)).fetchall()
+        states = {p["status"] for p in parts}
+        now = time.time()
+        counts = (sum(p["completed"] for p in parts), sum(p["failed"] for p in parts))
+        if states & {PENDING, RUNNING}:
+            status = job["status"] if cancelling else (SUBMITTING if PENDING in states else RUNNING)
+            self._execute("UPDATE batch_jobs SET status = ?, completed = ?, failed = ?, error = NULL, "
+                          "updated_at = ? WHERE id = ?", (status, *counts, now, job_id))
+            return
+
+        await asyncio.to_thread(self._join_results, job_id, job["model"], job["provider"], parts)
+        status = CANCELLED if cancelling else (FAILED if states == {FAILED} else COMPLETED)
+        errors = "; ".join(p["error"] for p in parts if p["error"])
+        self._execute(
+            "UPDATE batch_jobs SET status = ?, completed = ?, failed = ?, error = ?, updated_at = ?, finished_at = ?, "
+            "lease_until = 0 WHERE id = ?",
+            (status, *counts, errors or None, now, now, job_id)
+        )
+
+    def _update_part(self, job_id: str, part: int, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE batch_parts SET {assignments} WHERE job_id = ? AND part = ?",
+                      (*fields.values(), job_id, part))
+
+    async def _download(self, client, job_id: str, part: int, batch_id: str):
+        """Stream one part's results to disk; written to a temporary file first, so a retry starts clean"""
+        path = self._part_path(job_id, part, "results")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            async for result in client.batch_results(batch_id):
+                f.write(json.dumps(result) + "\n")
+        os.replace(tmp, path)
+
+    def _join_results(self, job_id: str, model: str, provider: str, parts):
+        """
+        Write output.jsonl in input order: each part's results, plus an error line for every request
+        the provider never answered (failed, cancelled or never submitted parts)
+        """
+        if os.path.exists(self.output_path(job_id)) and not os.path.exists(self._part_path(job_id, 0, "input")):
+            # Joined already by a process that stopped before marking the job finished
+            return
+        tmp = self.output_path(job_id) + ".tmp"
+        model_info = {"name": model, "provider": provider}
+        with open(tmp, "w", encoding="utf-8") as out:
+            for part in sorted(parts, key=lambda p: p["part"]):
+                answered = {}
+                results_path = self._part_path(job_id, part["part"], "results")
+                if os.path.exists(results_path):
+                    with open(results_path, encoding="utf-8") as f:
+                        for line in f:
+                            result = json.loads(line)
+                            answered[result["custom_id"]] = result
+                reason = part["error"] or f"batch {part['status']}"
+                with open(self._part_path(job_id, part["part"], "input"), encoding="utf-8") as f:
+                    for line in f:
+                        custom_id = json.loads(line)["custom_id"]
+                        result = answered.get(custom_id) or {"custom_id": custom_id, "status": "error", "error": reason}
+                        out.write(json.dumps({**result, "model_info": model_info}) + "\n")
+        os.replace(tmp, self.output_path(job_id))
+        # The output file has everything now
+        for part in parts:
+            for kind in ("input", "results"):
+                try:
+                    os.unlink(self._part_path(job_id, part["part"], kind))
+                except OSError:
+                    pass
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        cutoff = now - self.config["retention"]
+        expired = self._execute(
+            "SELECT id FROM batch_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+        ).fetchall()
+        for row in expired:
+            shutil.rmtree(self._job_dir(row["id"]), ignore_errors=True)
+            self._execute("DELETE FROM batch_parts WHERE job_id = ?", (row["id"],))
+            self._execute("DELETE FROM batch_jobs WHERE id = ?", (row["id"],))
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self._db is None and not os.path.exists(os.path.join(self.directory, "jobs.db")):
+            return {"jobs": {}, "polling": False}
+        rows = self._execute("SELECT status, COUNT(*) AS n, SUM(total) AS requests FROM batch_jobs GROUP BY status")
+        return {
+            "jobs": {row["status"]: {"jobs": row["n"], "requests": row["requests"]} for row in rows},
+            "polling": self._task is not None and not self._task.done()
+        }
@@ -0,0 +1,358 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import BRAND_INDEX_CONFIG
+from .embeddings import HashedNgramVectorizer
+from .metrics import FAST_BUCKETS, REGISTRY, Histogram, note_timing
+
+RETRIEVAL_LATENCY = REGISTRY.register(Histogram(
+    "pr_agent_retrieval_duration_seconds", "Brand index lookups per prompt", (), buckets=FAST_BUCKETS))
+
+# Too common to say anything about relevance; dropping them keeps posting lists short
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or our so that the their "
+    "this to was we were will with you your".split()
+)
+
+
+def chunk_words(text: str, size: int, overlap: int) -> List[str]:
+    """Overlapping windows of `size` words, so a passage cut at one boundary is whole in the next chunk"""
+    words = text.split()
+    step = max(1, size - overlap)
+    return [" ".join(words[i:i + size]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+
+class _Snapshot:
+    """One built generation of the index; arrays are memory-mapped, so workers share their pages"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "chunks.json"), encoding="utf-8") as f:
+            self.chunks = json.load(f)
+        with open(os.path.join(directory, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.indptr = np.load(os.path.join(directory, "indptr.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(directory, "postings.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(directory, "weights.npy"), mmap_mode="r")
+        vectors = os.path.join(directory, "vectors.npy")
+        self.vectors = np.load(vectors, mmap_mode="r") if os.path.exists(vectors) else None
+
+
+class BrandIndex:
+    """
+    Local retrieval over a directory of brand guides and past releases, so agents get a few
+    relevant excerpts instead of users pasting whole documents into every query.
+
+    Documents are split into overlapping word windows and scored with BM25 over a CSR
+    inverted index whose posting weights are precomputed at build time, so a query is a
+    handful of vectorized adds. Optionally the score is blended with the cosine similarity
+    of hashed n-gram vectors, which catches paraphrases. Chunks and vectors are cached per
+    document, so a re-index only re-reads files whose size or mtime changed; each build is
+    written to its own generation directory and memory-mapped.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or BRAND_INDEX_CONFIG
+        self.vectorizer = HashedNgramVectorizer(dim=self.config["dim"])
+        self.use_vectors = self.config["vector_weight"] > 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._files: Dict[str, Tuple[int, int]] = {}
+        self._build_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"builds": 0, "documents_reindexed": 0, "searches": 0, "last_build_seconds": None}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.get("source_dir"))
+
+    # Indexing
+
+    def _params(self) -> Dict[str, Any]:
+        """Settings that change what gets built; caches made with other settings are ignored"""
+        return {k: self.config[k] for k in ("chunk_words", "chunk_overlap", "dim", "bm25_k1", "bm25_b")} | \
+            {"vectors": self.use_vectors}
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        files = {}
+        root = self.config["source_dir"]
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if os.path.splitext(name)[1].lower() not in self.config["extensions"]:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.relpath(path, root)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def refresh(self) -> bool:
+        """Re-index if documents were added, changed or removed; returns True when a new index was loaded"""
+        if not self.enabled:
+            return False
+        with self._build_lock:
+            files = self._scan()
+            if self._snapshot is not None and files == self._files:
+                # Still in use: keeps other workers from deleting this generation
+                _touch(self._snapshot.directory)
+                return False
+            fingerprint = json.dumps([sorted(files.items()), self._params()], sort_keys=True)
+            generation = os.path.join(
+                self.config["index_dir"], "gen-" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:16]
+            )
+            self._snapshot = self._load(files, generation)
+            self._files = files
+            self._remove_old_generations(generation)
+            return True
+
+    def _load(self, files: Dict[str, Tuple[int, int]], generation: str) -> _Snapshot:
+        """Build the generation unless another worker already has, then map it"""
+        for attempt in range(2):
+            if not os.path.exists(os.path.join(generation, "meta.json")):
+                started = time.perf_counter()
+                self._build(files, generation)
+                self.stats["builds"] += 1
+                self.stats["last_build_seconds"] = round(time.perf_counter() - started, 3)
+            # Marked as in use before reading, so cleanup in other workers leaves it alone
+            _touch(generation)
+            try:
+                return _Snapshot(generation)
+            except FileNotFoundError:
+                # Removed between the check and the read by a worker that saw it unused; build it again
+                if attempt:
+                    raise
+                shutil.rmtree(generation, ignore_errors=True)
+
+    def _document(self, path: str, stamp: Tuple[int, int]):
+        """Chunks, per-chunk term counts and vectors of one document, from its cache when unchanged"""
+        key = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        cache = os.path.join(self.config["index_dir"], "docs", key)
+        try:
+            with open(cache + ".json", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["stamp"] == list(stamp) and cached["params"] == self._params():
+                vectors = np.load(cache + ".npy") if self.use_vectors else None
+                return cached["chunks"], cached["terms"], vectors
+        except (OSError, ValueError, KeyError):
+            pass
+
+        with open(os.path.join(self.config["source_dir"], path), encoding="utf-8", errors="replace") as f:
+            chunks = [c for c in chunk_words(f.read(), self.config["chunk_words"], self.config["chunk_overlap"]) if c]
+        terms = [
+            dict(Counter(t for t in self.vectorizer.tokenize(chunk) if t not in STOPWORDS))
+            for chunk in chunks
+        ]
+        vectors = self.vectorizer.transform_many(chunks) if self.use_vectors else None
+
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        if vectors is not None:
+            _save_atomic(cache + ".npy", vectors)
+        payload = {"path": path, "stamp": list(stamp), "params": self._params(), "chunks": chunks, "terms": terms}
+        _write_atomic(cache + ".json", json.dumps(payload))
+        self.stats["documents_reindexed"] += 1
+        return chunks, terms, vectors
+
+    def _build(self, files: Dict[str, Tuple[int, int]], generation: str):
+        chunks, doc_terms, vector_blocks = [], [], []
+        for path in sorted(files):
+            try:
+                texts, terms, vectors = self._document(path, files[path])
+            except OSError:
+                # Deleted or unreadable since the scan; the next refresh sees it gone
+                continue
+            chunks.extend({"source": path, "text": text} for text in texts)
+            doc_terms.extend(terms)
+            if vectors is not None:
+                vector_blocks.append(vectors)
+
+        vocab: Dict[str, int] = {}
+        term_ids, doc_ids, counts = [], [], []
+        for doc, terms in enumerate(doc_terms):
+            for term, count in terms.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc)
+                counts.append(count)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(counts, dtype=np.float32)
+
+        # Postings grouped by term (CSR), each carrying its final BM25 weight
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=indptr[1:])
+        n = max(len(chunks), 1)
+        lengths = np.bincount(doc_ids, weights=tf, minlength=len(chunks)).astype(np.float32)
+        average = float(lengths.mean()) if len(chunks) else 1.0
+        df = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        k1, b = self.config["bm25_k1"], self.config["bm25_b"]
+        norm = k1 * (1 - b + b * lengths[doc_ids] / max(average, 1e-6))
+        weights = (idf[term_ids] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+        os.makedirs(self.config["index_dir"], exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix="tmp-", dir=self.config["index_dir"])
+        try:
+            np.save(os.path.join(tmp, "indptr.npy"), indptr)
+            np.save(os.path.join(tmp, "postings.npy"), doc_ids[order])
+            np.save(os.path.join(tmp, "weights.npy"), weights[order])
+            if self.use_vectors:
+                dim = self.config["dim"]
+                np.save(os.path.join(tmp, "vectors.npy"),
+                        np.concatenate(vector_blocks) if vector_blocks else np.zeros((0, dim), dtype=np.float32))
+            with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(chunks, f)
+            with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+                json.dump(vocab, f)
+            # Written last: a generation without it is incomplete
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"chunks": len(chunks), "terms": len(vocab), "documents": len(files),
+                           "built_at": time.time()}, f)
+            os.rename(tmp, generation)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.exists(os.path.join(generation, "meta.json")):
+                raise
+
+    def _remove_old_generations(self, current: str):
+        """
+        Every worker touches the generation it uses on each refresh, so one not touched for two refresh
+        intervals has no readers left. The newest keep_generations are kept regardless, and files a
+        worker has mapped stay readable after unlinking anyway; only a worker still loading could notice.
+        """
+        cutoff = time.time() - 2 * self.config["refresh_interval"]
+        generations, partial = [], []
+        for entry in os.scandir(self.config["index_dir"]):
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if entry.name.startswith("gen-") and entry.path != current:
+                generations.append((mtime, entry.path))
+            elif entry.name.startswith("tmp-"):
+                partial.append((mtime, entry.path))
+        generations.sort(reverse=True)
+        for mtime, path in generations[max(0, self.config["keep_generations"] - 1):] + partial:
+            if mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    # Retrieval
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        """The k best chunks for a query, each with its source document and score"""
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot.chunks or k <= 0:
+            return []
+        started = time.perf_counter()
+        scores = np.zeros(len(snapshot.chunks), dtype=np.float32)
+        for term in set(self.vectorizer.tokenize(query)) - STOPWORDS:
+            term_id = snapshot.vocab.get(term)
+            if term_id is not None:
+                start, end = snapshot.indptr[term_id], snapshot.indptr[term_id + 1]
+                # Each chunk appears at most once per posting list, so a fancy-indexed add is safe
+                scores[snapshot.postings[start:end]] += snapshot.weights[start:end]
+        best = float(scores.max())
+        if best > 0:
+            scores /= best
+        ids = np.arange(len(scores))
+        if snapshot.vectors is not None:
+            weight = self.config["vector_weight"]
+            vector = self.vectorizer.transform(query)
+            if best > 0 and len(scores) > self.config["rerank_candidates"]:
+                # Rerank only the best BM25 matches; the whole matrix is scanned only when no term matched
+                ids = np.sort(np.argpartition(-scores, self.config["rerank_candidates"] - 1)
+                              [:self.config["rerank_candidates"]])
+                scores = scores[ids]
+            similarity = snapshot.vectors[ids] if len(ids) < len(snapshot.vectors) else snapshot.vectors
+            scores = (1 - weight) * scores + weight * np.maximum(similarity @ vector, 0)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = [
+            {
+                "source": snapshot.chunks[ids[i]]["source"],
+                "text": snapshot.chunks[ids[i]]["text"][:self.config["max_snippet_chars"]],
+                "score": round(float(scores[i]), 4)
+            }
+            for i in top if scores[i] >= self.config["min_score"]
+        ]
+        elapsed = time.perf_counter() - started
+        self.stats["searches"] += 1
+        RETRIEVAL_LATENCY.observe(elapsed)
+        note_timing("retrieval_ms", round(elapsed * 1000, 2))
+        return hits
+
+    def prompt_message(self, agent_type: Optional[str], query: str) -> Optional[Dict[str, str]]:
+        """A system message with the excerpts most relevant to the query, or None when there are none"""
+        k = self.config["agent_top_k"].get(agent_type, self.config["top_k"])
+        hits = self.search(query, k) if self.enabled else []
+        if not hits:
+            return None
+        excerpts = "\n\n".join(f"[{hit['source']}]\n{hit['text']}" for hit in hits)
+        return {
+            "role": "system",
+            "content": "Brand reference excerpts. Follow their voice and facts where they apply:\n\n" + excerpts
+        }
+
+    # Background refresh
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._refresh_forever())
+
+    async def _refresh_forever(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                self.stats["last_error"] = f"{type(e).__name__}: {e}"
+            await asyncio.sleep(self.config["refresh_interval"])
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        current = self._snapshot
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "documents": len(self._files),
+            "chunks": len(current.chunks) if current is not None else 0,
+            "terms": len(current.vocab) if current is not None else 0,
+            "generation": os.path.basename(current.directory) if current is not None else None
+        }
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _write_atomic(path: str, text: str):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _save_atomic(path: str, array: np.ndarray):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
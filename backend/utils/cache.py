@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ..config import CACHE_CONFIG
+
+# Model settings that change the answer and therefore belong in the cache key
+SAMPLING_PARAMS = ("temperature", "top_p", "max_tokens", "stop", "seed")
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU with per-entry TTLs, backed by an
+    optional SQLite file that survives restarts and is shared between workers.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or CACHE_CONFIG
+        self.max_entries = self.config["max_entries"]
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = self._open_db(self.config.get("sqlite_path"))
+        self._writes_since_prune = 0
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "bypasses": 0
+        }
+
+    def _open_db(self, path: Optional[str]):
+        if not path:
+            return None
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        # WAL lets several uvicorn workers read while one writes
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+        return db
+
+    @staticmethod
+    def make_key(messages: List[Dict[str, str]], model_config: Dict[str, Any]) -> str:
+        """Hash of the whitespace-normalized conversation, model and sampling params"""
+        normalized = {
+            "messages": [
+                {"role": m["role"], "content": " ".join(str(m["content"]).split())}
+                for m in messages
+            ],
+            "model": model_config.get("name"),
+            "params": {p: model_config[p] for p in SAMPLING_PARAMS if p in model_config}
+        }
+        payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, agent_type: Optional[str]) -> float:
+        return self.config["agent_ttls"].get(agent_type, self.config["default_ttl"])
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._entries[key]
+                self.stats["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._put_memory(key, value, row[1])
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+            self.stats["stores"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune_disk()
+
+    def _put_memory(self, key: str, value: Dict[str, Any], expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _prune_disk(self):
+        self._writes_since_prune = 0
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        # Keep the file bounded by dropping the entries closest to expiry
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.config["max_disk_entries"],)
+        )
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypasses"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self._db is not None
+            }
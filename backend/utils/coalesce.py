@@ -0,0 +1,165 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class StreamBroadcast:
+    """
+    Runs one upstream token stream and replays it to any number of subscribers.
+    Late subscribers first get the deltas produced so far. The upstream stream is
+    stopped once every subscriber has gone away.
+    """
+
+    def __init__(self, source: AsyncIterator[str], info: Dict[str, Any],
+                 on_complete: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.source = source
+        self.info = info
+        self.on_complete = on_complete
+        self.chunks = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump())
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self):
+        try:
+            async for delta in self.source:
+                self.chunks.append(delta)
+                self._notify()
+            if self.on_complete is not None:
+                self.on_complete("".join(self.chunks), self.info)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            await self.source.aclose()
+
+    def subscribe(self) -> "Subscription":
+        """Counted as a listener from now on, whether or not the subscriber ever starts iterating"""
+        return Subscription(self)
+
+    def _unsubscribe(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            self.task.cancel()
+
+    async def _replay(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class Subscription:
+    """
+    One subscriber's view of a StreamBroadcast. It registers on creation and unregisters exactly once,
+    when it is exhausted, fails or is closed, so a client that leaves before reading still lets the
+    upstream stream stop.
+    """
+
+    def __init__(self, broadcast: StreamBroadcast):
+        self.broadcast = broadcast
+        self.closed = False
+        self._replay = broadcast._replay()
+        broadcast.subscribers += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            return await self._replay.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self._replay.aclose()
+        finally:
+            self._release()
+
+    def _release(self):
+        if not self.closed:
+            self.closed = True
+            self.broadcast._unsubscribe()
+
+
+class SingleFlight:
+    """Deduplicates identical in-flight generations so that concurrent callers share one upstream call"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, StreamBroadcast] = {}
+        self.stats = {
+            "leaders": 0,
+            "followers": 0,
+            "stream_leaders": 0,
+            "stream_followers": 0
+        }
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await factory() once per key; callers arriving while it runs share its result or error.
+        Returns the result and whether this caller joined an existing call.
+        """
+        task = self._calls.get(key)
+        coalesced = task is not None
+        if task is None:
+            # A separate task, so a cancelled leader does not take its followers down with it
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(self._calls, key, t))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+        return await asyncio.shield(task), coalesced
+
+    def stream(self, key: str, factory: Callable[[Dict[str, Any]], AsyncIterator[str]],
+               on_complete: Optional[Callable[[str, Dict[str, Any]], None]] = None
+               ) -> Tuple[Subscription, Dict[str, Any], bool]:
+        """
+        Subscribe to the in-flight stream for key, starting factory(info) if there is none.
+        Returns the subscriber's delta iterator, the shared info dict the stream fills in,
+        and whether this caller joined an existing stream. The caller must aclose() the
+        iterator when it is done with it, even if it never read from it.
+        """
+        broadcast = self._streams.get(key)
+        coalesced = not (broadcast is None or broadcast.done or broadcast.task.cancelled())
+        if not coalesced:
+            info = {}
+            broadcast = StreamBroadcast(factory(info), info, on_complete)
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(lambda t: self._forget(self._streams, key, broadcast))
+            self.stats["stream_leaders"] += 1
+        else:
+            self.stats["stream_followers"] += 1
+        return broadcast.subscribe(), broadcast.info, coalesced
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, value: Any):
+        if registry.get(key) is value:
+            del registry[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.stats["leaders"] + self.stats["followers"]
+        stream_total = self.stats["stream_leaders"] + self.stats["stream_followers"]
+        return {
+            **self.stats,
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams),
+            "coalesced_ratio": round(self.stats["followers"] / total, 3) if total else 0.0,
+            "stream_coalesced_ratio": round(self.stats["stream_followers"] / stream_total, 3) if stream_total else 0.0
+        }
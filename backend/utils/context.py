@@ -0,0 +1,157 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ..config import CONTEXT_CONFIG, get_model_config
+
+# Role markers and separators the providers add around every message
+MESSAGE_OVERHEAD = 4
+WORD_PATTERN = re.compile(r"\w+")
+SYMBOL_PATTERN = re.compile(r"[^\w\s]")
+
+# Counts of recently seen long texts, keyed by a digest so the cache never holds the texts themselves
+TOKEN_CACHE_SIZE = 8192
+# Shorter texts are cheaper to count again than to hash
+TOKEN_CACHE_MIN_CHARS = 256
+_token_counts: "OrderedDict[bytes, int]" = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def _count_tokens(text: str) -> int:
+    words = len(WORD_PATTERN.findall(text))
+    symbols = len(SYMBOL_PATTERN.findall(text))
+    return int(words * 1.3) + symbols
+
+
+def estimate_tokens(text: str) -> int:
+    """Provider-agnostic token estimate: words count a little over one token, punctuation one each"""
+    if len(text) < TOKEN_CACHE_MIN_CHARS:
+        return _count_tokens(text)
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = _count_tokens(text)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(str(message["content"])) + MESSAGE_OVERHEAD
+
+
+class ConversationContext:
+    """
+    A conversation that fits itself into each model's context window.
+
+    Token counts are computed once per message when it is appended. For every model
+    the context remembers how many of the oldest turns it has rolled into the summary,
+    along with the size of what is left, so each new turn only costs the new delta.
+    System messages are always kept.
+    """
+
+    def __init__(self, messages: Optional[List[Dict[str, str]]] = None, config: Optional[Dict[str, Any]] = None):
+        self.config = config or CONTEXT_CONFIG
+        self.messages: List[Dict[str, str]] = []
+        self.tokens: List[int] = []
+        self.system_tokens = 0
+        self._digests: Dict[int, str] = {}
+        self._cutoffs: Dict[str, int] = {}
+        self._kept_tokens: Dict[str, int] = {}
+        for message in messages or []:
+            self.append(message)
+
+    def append(self, message: Dict[str, str]):
+        tokens = message_tokens(message)
+        self.messages.append(message)
+        self.tokens.append(tokens)
+        if message["role"] == "system":
+            self.system_tokens += tokens
+        else:
+            for model in self._kept_tokens:
+                self._kept_tokens[model] += tokens
+
+    def sync(self, messages: List[Dict[str, str]]):
+        """Append the messages that are new since the last sync; earlier ones must be unchanged"""
+        for message in messages[len(self.messages):]:
+            self.append(message)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def budget(self, model: str) -> int:
+        """Prompt tokens available for the model after the completion and safety margin"""
+        config = get_model_config(model)
+        usable = int(config["context_window"] * (1 - self.config["safety_margin"]))
+        return usable - config["max_tokens"]
+
+    def window(self, model: str) -> List[Dict[str, str]]:
+        """Messages to send to the model: system prompts, a summary of rolled-up turns, then recent turns"""
+        budget = self.budget(model) - self.system_tokens
+        if model not in self._cutoffs:
+            self._cutoffs[model] = 0
+            self._kept_tokens[model] = self.total_tokens - self.system_tokens
+        cutoff = self._cutoffs[model]
+        kept = self._kept_tokens[model]
+
+        if cutoff == 0 and kept <= budget:
+            return list(self.messages)
+
+        summary_budget = int(budget * self.config["summary_share"])
+        last = len(self.messages) - 1
+        while kept > budget - summary_budget and cutoff < last:
+            if self.messages[cutoff]["role"] != "system":
+                kept -= self.tokens[cutoff]
+            cutoff += 1
+        self._cutoffs[model] = cutoff
+        self._kept_tokens[model] = kept
+
+        system = [m for m in self.messages[:cutoff] if m["role"] == "system"]
+        recent = self.messages[cutoff:]
+        summary = self._summary(cutoff, summary_budget)
+        if summary:
+            system.append({"role": "system", "content": summary})
+        return system + recent
+
+    def _summary(self, cutoff: int, budget: int) -> str:
+        # Most recent rolled-up turns first, until the summary budget is spent
+        lines = []
+        used = 0
+        for index in range(cutoff - 1, -1, -1):
+            if self.messages[index]["role"] == "system":
+                continue
+            digest = self._digest(index)
+            cost = estimate_tokens(digest) + 2
+            if used + cost > budget:
+                break
+            lines.append(digest)
+            used += cost
+        if not lines:
+            return ""
+        return "Summary of earlier conversation:\n" + "\n".join(reversed(lines))
+
+    def _digest(self, index: int) -> str:
+        if index not in self._digests:
+            message = self.messages[index]
+            text = " ".join(str(message["content"]).split())
+            limit = self.config["summary_chars_per_turn"]
+            if len(text) > limit:
+                text = text[:limit].rsplit(" ", 1)[0] + " ..."
+            self._digests[index] = f"- {message['role']}: {text}"
+        return self._digests[index]
+
+
+def fit_messages(messages: List[Dict[str, str]], model: str) -> List[Dict[str, str]]:
+    """One-off trim of a message list to a model's budget; returns the list unchanged when it fits"""
+    budget = ConversationContext().budget(model)
+    if sum(message_tokens(m) for m in messages) <= budget:
+        return messages
+    return ConversationContext(messages).window(model)
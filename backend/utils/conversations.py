@@ -0,0 +1,231 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ..config import CONVERSATION_CONFIG
+from .context import ConversationContext
+
+
+class ConversationConflict(Exception):
+    """The conversation exists but belongs to a different agent"""
+
+
+class _Conversation:
+    def __init__(self, agent_type: Optional[str], system_prompt: Optional[str],
+                 messages: List[Dict[str, str]], next_seq: int, updated_at: float):
+        self.agent_type = agent_type
+        self.system_prompt = system_prompt
+        self.messages = messages
+        self.next_seq = next_seq
+        self.updated_at = updated_at
+        self._context: Optional[ConversationContext] = None
+
+    @property
+    def context(self) -> ConversationContext:
+        # Built once per hot conversation, then only appended to
+        if self._context is None:
+            system = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+            self._context = ConversationContext(system + self.messages)
+        return self._context
+
+    def append(self, message: Dict[str, str], max_messages: int):
+        self.messages.append(message)
+        self.next_seq += 1
+        if len(self.messages) > max_messages:
+            del self.messages[:len(self.messages) - max_messages]
+            # The context's per-model cutoffs refer to positions that just moved
+            self._context = None
+        elif self._context is not None:
+            self._context.append(message)
+
+
+class ConversationStore:
+    """
+    Conversation histories kept on the server, keyed by a client-chosen conversation id.
+
+    Turns go to an append-only SQLite table shared by all workers; recently used
+    conversations stay in an in-memory LRU together with their ConversationContext,
+    so a new turn costs only its own tokens. Conversations idle for longer than the
+    TTL are dropped, and only the newest `max_messages` turns are kept.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or CONVERSATION_CONFIG
+        self._hot: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = self._open_db(self.config.get("sqlite_path"))
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "disk_loads": 0, "created": 0, "appended": 0, "expired": 0}
+
+    def _open_db(self, path: Optional[str]):
+        if not path:
+            return None
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, agent_type TEXT, updated_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "PRIMARY KEY (conversation_id, seq)) WITHOUT ROWID"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)")
+        return db
+
+    def _expired(self, updated_at: float, now: float) -> bool:
+        return now - updated_at > self.config["ttl"]
+
+    def _load(self, conversation_id: str, now: float) -> Optional[_Conversation]:
+        conversation = self._hot.get(conversation_id)
+        if conversation is not None and self._expired(conversation.updated_at, now):
+            self._drop(conversation_id)
+            self.stats["expired"] += 1
+            return None
+        if self._db is None:
+            if conversation is not None:
+                self._hot.move_to_end(conversation_id)
+                self.stats["memory_hits"] += 1
+            return conversation
+
+        row = self._db.execute(
+            "SELECT agent_type, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return conversation
+        if conversation is not None and row[1] <= conversation.updated_at:
+            self._hot.move_to_end(conversation_id)
+            self.stats["memory_hits"] += 1
+            return conversation
+        # Not hot yet, or another worker added turns since we last saw it
+        if self._expired(row[1], now):
+            self._drop(conversation_id)
+            self.stats["expired"] += 1
+            return None
+        turns = self._db.execute(
+            "SELECT seq, role, content FROM turns WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, self.config["max_messages"])
+        ).fetchall()
+        turns.reverse()
+        system_prompt = conversation.system_prompt if conversation is not None else None
+        conversation = _Conversation(
+            row[0], system_prompt, [{"role": role, "content": content} for _, role, content in turns],
+            turns[-1][0] + 1 if turns else 0, row[1]
+        )
+        self._put_hot(conversation_id, conversation)
+        self.stats["disk_loads"] += 1
+        return conversation
+
+    def _put_hot(self, conversation_id: str, conversation: _Conversation):
+        self._hot[conversation_id] = conversation
+        self._hot.move_to_end(conversation_id)
+        while len(self._hot) > self.config["max_hot"]:
+            self._hot.popitem(last=False)
+
+    def _drop(self, conversation_id: str):
+        self._hot.pop(conversation_id, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def _check_agent(self, conversation: _Conversation, agent_type: Optional[str]):
+        if conversation.agent_type != agent_type:
+            raise ConversationConflict(f"Conversation belongs to agent {conversation.agent_type}")
+
+    def context(self, conversation_id: str, agent_type: Optional[str],
+                system_prompt: Optional[str] = None) -> ConversationContext:
+        """The conversation so far, led by the system prompt; empty for a conversation not seen before"""
+        with self._lock:
+            conversation = self._load(conversation_id, time.time())
+            if conversation is None:
+                conversation = _Conversation(agent_type, system_prompt, [], 0, time.time())
+                self._put_hot(conversation_id, conversation)
+            self._check_agent(conversation, agent_type)
+            if conversation.system_prompt != system_prompt:
+                conversation.system_prompt = system_prompt
+                conversation._context = None
+            return conversation.context
+
+    def append(self, conversation_id: str, agent_type: Optional[str], messages: List[Dict[str, str]]):
+        """Add finished turns, creating the conversation if needed"""
+        now = time.time()
+        with self._lock:
+            conversation = self._load(conversation_id, now)
+            if conversation is None:
+                conversation = _Conversation(agent_type, None, [], 0, now)
+                self._put_hot(conversation_id, conversation)
+            self._check_agent(conversation, agent_type)
+            if conversation.next_seq == 0:
+                self.stats["created"] += 1
+            first_seq = conversation.next_seq
+            for message in messages:
+                conversation.append({"role": message["role"], "content": message["content"]},
+                                    self.config["max_messages"])
+            conversation.updated_at = now
+            self.stats["appended"] += len(messages)
+            if self._db is not None:
+                self._write(conversation_id, conversation, messages, first_seq, now)
+
+    def _write(self, conversation_id: str, conversation: _Conversation, messages: List[Dict[str, str]],
+               first_seq: int, now: float):
+        self._db.execute("BEGIN")
+        try:
+            self._db.execute(
+                "INSERT INTO conversations (id, agent_type, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at",
+                (conversation_id, conversation.agent_type, now)
+            )
+            # Another worker may have appended in the meantime; continue after its last turn
+            row = self._db.execute(
+                "SELECT MAX(seq) FROM turns WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            seq = max(first_seq, row[0] + 1 if row[0] is not None else 0)
+            self._db.executemany(
+                "INSERT INTO turns (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(conversation_id, seq + i, m["role"], m["content"]) for i, m in enumerate(messages)]
+            )
+            conversation.next_seq = seq + len(messages)
+            self._db.execute(
+                "DELETE FROM turns WHERE conversation_id = ? AND seq < ?",
+                (conversation_id, conversation.next_seq - self.config["max_messages"])
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= 100:
+            self._prune_disk(now)
+
+    def _prune_disk(self, now: float):
+        self._writes_since_prune = 0
+        cutoff = now - self.config["ttl"]
+        self._db.execute(
+            "DELETE FROM turns WHERE conversation_id IN (SELECT id FROM conversations WHERE updated_at < ?)",
+            (cutoff,)
+        )
+        self._db.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,))
+
+    def history(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """The stored turns, for a client that lost its copy (e.g. after a page refresh)"""
+        with self._lock:
+            conversation = self._load(conversation_id, time.time())
+            if conversation is None:
+                return None
+            return {
+                "conversation_id": conversation_id,
+                "agent_type": conversation.agent_type,
+                "messages": list(conversation.messages)
+            }
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            self._drop(conversation_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "hot": len(self._hot), "persistent": self._db is not None}
@@ -0,0 +1,44 @@
+import random
+import time
+from typing import Any, Dict, Optional
+
+from ..config import DEADLINE_CONFIG
+
+
+class Deadline:
+    """
+    A request's end-to-end latency budget, fixed on the monotonic clock when the request arrives.
+    Every layer below asks it how much time is left instead of applying its own timeout.
+    """
+
+    def __init__(self, seconds: float, config: Optional[Dict[str, Any]] = None):
+        self.config = config or DEADLINE_CONFIG
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def for_request(cls, agent_type: Optional[str] = None, seconds: Optional[float] = None,
+                    config: Optional[Dict[str, Any]] = None) -> "Deadline":
+        """The requested budget, or the agent's default, capped at the configured maximum"""
+        config = config or DEADLINE_CONFIG
+        if seconds is None:
+            seconds = config["agent_budgets"].get(agent_type, config["default"])
+        return cls(min(seconds, config["max"]), config)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def exhausted(self) -> bool:
+        """True once too little is left to start another provider attempt"""
+        return self.remaining() < self.config["min_attempt"]
+
+    def backoff(self, retry: int) -> Optional[float]:
+        """
+        Full-jitter delay before retry number `retry` (counting from 1), or None when sleeping
+        would leave too little budget for the retry itself
+        """
+        ceiling = min(self.config["backoff_max"], self.config["backoff_base"] * 2 ** (retry - 1))
+        delay = random.uniform(0, ceiling)
+        if self.remaining() - delay < self.config["min_attempt"]:
+            return None
+        return delay
@@ -0,0 +1,57 @@
+import re
+import zlib
+from typing import Iterable, List
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class HashedNgramVectorizer:
+    """
+    CPU-only text embeddings: word and character n-grams hashed into a fixed number
+    of dimensions, sublinear term weights, L2-normalized. No vocabulary, no network.
+    crc32 is used instead of hash() so vectors are identical across processes.
+    """
+
+    def __init__(self, dim: int = 512, word_ngrams: int = 2, char_ngrams: tuple = (3, 4)):
+        self.dim = dim
+        self.word_ngrams = word_ngrams
+        self.char_ngrams = char_ngrams
+
+    def tokenize(self, text: str) -> List[str]:
+        return TOKEN_PATTERN.findall(text.lower())
+
+    def features(self, text: str) -> List[str]:
+        words = self.tokenize(text)
+        features = list(words)
+        for n in range(2, self.word_ngrams + 1):
+            features.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                features.extend("#" + padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def transform(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = self.features(text)
+        if not features:
+            return vector
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features)
+        )
+        # The top bit picks a sign so collisions tend to cancel out instead of piling up
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs)
+        vector = (np.sign(vector) * np.log1p(np.abs(vector))).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def transform_many(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = self.transform(text)
+        return matrix
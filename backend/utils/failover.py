@@ -1,81 +1,425 @@
-from typing import List, Dict, Any
-import os
-import openai
-import anthropic
-from openai import OpenAI  # Updated import for NVIDIA
+import asyncio
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator
+from ..clients.registry import ProviderRegistry, provider_registry
+from ..config import DEADLINE_CONFIG, FALLBACK_MODELS, HEDGING_CONFIG, get_model_config
+from .context import fit_messages
+from .deadline import Deadline
+from .health import CircuitOpen, HealthTracker
+from .metrics import (
+    ATTEMPTS, ATTEMPT_LATENCY, ERRORS, FAILOVER_DEPTH, TIME_TO_FIRST_TOKEN, TOKENS_PER_SECOND, WINNERS,
+    classify_error, note_attempt, note_timing
+)
+from .pool import ProviderPool
+from .scheduler import RateLimitScheduler, RateLimited
+
+class AllModelsFailed(Exception):
+    """
+    Raised when every model in the try order failed; keeps the last underlying error and,
+    when attempts were turned away by rate limits, the soonest one of them frees up
+    """
+
+    def __init__(self, last_error: Optional[BaseException], attempts: int, retry_after: Optional[float] = None):
+        super().__init__(f"All models failed. Last error: {str(last_error)}")
+        self.last_error = last_error
+        self.attempts = attempts
+        self.retry_after = retry_after
+        self.error_class = classify_error(last_error) if last_error is not None else "other"
+
+
+class DeadlineExceeded(AllModelsFailed):
+    """Raised when the request's latency budget runs out before any model answered"""
+
+    def __init__(self, budget: float, last_error: Optional[BaseException], attempts: int,
+                 retry_after: Optional[float] = None):
+        super().__init__(last_error, attempts, retry_after)
+        message = f"Request exceeded its {budget:g}s latency budget after {attempts} attempt(s)"
+        if last_error is not None:
+            # Timeouts carry no message of their own
+            message += f". Last error: {str(last_error) or type(last_error).__name__}"
+        self.args = (message,)
+        self.budget = budget
+        self.error_class = "deadline_exceeded"
+
+
+def retry_after_for(error: BaseException) -> Optional[float]:
+    """Seconds a rate-limited error says to wait, from our scheduler or the provider's Retry-After"""
+    if isinstance(error, RateLimited):
+        return error.retry_after
+    if classify_error(error) != "rate_limited":
+        return None
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _soonest(current: Optional[float], error: BaseException) -> Optional[float]:
+    retry_after = retry_after_for(error)
+    if retry_after is None:
+        return current
+    return retry_after if current is None else min(current, retry_after)
 
 class FailoverHandler:
-    def __init__(self):
-        # Initialize API clients
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        self.nvidia_client = OpenAI(
-            base_url="https://integrate.api.nvidia.com/v1",
-            api_key=os.getenv("NVIDIA_API_KEY")
-        )
+    def __init__(self, pool: Optional[ProviderPool] = None, scheduler: Optional[RateLimitScheduler] = None,
+                 providers: Optional[ProviderRegistry] = None):
+        # Provider clients and their SDKs load on first use, on the shared keep-alive pools
+        self.providers = providers or (ProviderRegistry(pool) if pool is not None else provider_registry)
+        # Request and token budgets per provider and model, queued by agent priority
+        self.scheduler = scheduler or RateLimitScheduler()
         
         self.fallback_models = [
-            {"name": "gpt-4", "provider": "openai"},
-            {"name": "claude-3-opus", "provider": "anthropic"},
-            {"name": "claude-3-sonnet", "provider": "anthropic"},
-            {"name": "nvidia/llama-3.1-nemotron-70b-instruct", "provider": "nvidia"},
-            {"name": "gpt-3.5-turbo", "provider": "openai"},
+            {"name": name, "provider": get_model_config(name)["provider"]}
+            for name in FALLBACK_MODELS
         ]
+        self.health = HealthTracker()
+        self.hedging = HEDGING_CONFIG
+        self.deadlines = DEADLINE_CONFIG
+        # Latencies of recent successful attempts, used to pick the hedge delay
+        self.recent_latencies = deque(maxlen=HEDGING_CONFIG["window"])
         
     async def generate_with_fallback(self, messages: List[Dict[str, str]], model_config: Dict[str, Any]) -> str:
         """
         Attempts to generate a response using different providers
         """
-        requested_model = model_config.get("name")
-        models_to_try = [m for m in self.fallback_models if m["name"] == requested_model] + \
-                       [m for m in self.fallback_models if m["name"] != requested_model]
-        
+        result = await self.generate_with_details(messages, model_config)
+        return result["content"]
+
+    async def generate_with_details(self, messages: List[Dict[str, str]], model_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Like generate_with_fallback, but also reports which model answered and, when hedging, the hedge cost.
+        Hedging is used when model_config["hedge"] is true, or by default when HEDGING_CONFIG enables it.
+        The whole chain runs within model_config["deadline"] (a Deadline; the default budget if absent).
+        """
+        models_to_try = self._models_to_try(model_config)
+        priority = model_config.get("priority", self.scheduler.config["default_priority"])
+        deadline = self._deadline(model_config)
+        if model_config.get("hedge", self.hedging["enabled"]):
+            return await self._generate_hedged(messages, models_to_try, priority, deadline)
+
         last_error = None
-        for model in models_to_try:
+        retry_after = None
+        made = 0
+        for attempt, model in enumerate(models_to_try, start=1):
+            retries = 0
+            while True:
+                if deadline.exhausted():
+                    raise DeadlineExceeded(deadline.budget, last_error, made, retry_after)
+                made += 1
+                try:
+                    response = await self._timed_attempt(messages, model, priority, deadline)
+                    self._record_winner(model, attempt)
+                    return {
+                        "content": response["content"],
+                        "model_info": {"name": model["name"], "provider": model["provider"]},
+                        "usage": response["usage"],
+                        "attempts": attempt
+                    }
+                except Exception as e:
+                    last_error = e
+                    retry_after = _soonest(retry_after, e)
+                    retries += 1
+                    if not await self._retry_pause(e, retries, deadline):
+                        break
+
+        raise AllModelsFailed(last_error, len(models_to_try), retry_after)
+
+    def _deadline(self, model_config: Dict[str, Any]) -> Deadline:
+        return model_config.get("deadline") or Deadline.for_request(config=self.deadlines)
+
+    async def _retry_pause(self, error: Exception, retries: int, deadline: Deadline) -> bool:
+        """
+        After a transient error, sleep a jittered backoff and return True to retry the same model;
+        False moves on to the next model. Retries never eat into the time the next attempt needs.
+        """
+        if retries > self.deadlines["retries"] or classify_error(error) not in self.deadlines["retry_on"]:
+            return False
+        delay = deadline.backoff(retries)
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait on an attempt before hedging with the next model"""
+        if self.hedging["use_p95"] and len(self.recent_latencies) >= self.hedging["min_samples"]:
+            ordered = sorted(self.recent_latencies)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return self.hedging["delay"]
+
+    async def _generate_hedged(self, messages: List[Dict[str, str]], models_to_try: List[Dict[str, str]],
+                               priority: int, deadline: Deadline) -> Dict[str, Any]:
+        """
+        Runs the fallback chain with hedging: when the attempts in flight are slower than the hedge delay,
+        the next model is started concurrently. The first success wins and the other attempts are cancelled.
+        No new attempt starts once the deadline is too close.
+        """
+        delay = self.hedge_delay()
+        wait_timeout = delay
+        remaining = iter(enumerate(models_to_try, start=1))
+        pending = {}
+        hedges = 0
+        last_error = None
+        retry_after = None
+        started = time.perf_counter()
+
+        def launch(hedge: bool) -> bool:
+            if deadline.exhausted():
+                return False
+            nxt = next(remaining, None)
+            if nxt is None:
+                return False
+            attempt, model = nxt
+            task = asyncio.create_task(self._timed_attempt(messages, model, priority, deadline))
+            pending[task] = {"attempt": attempt, "model": model, "started": time.perf_counter(), "hedge": hedge}
+            return True
+
+        launch(hedge=False)
+        try:
+            while pending:
+                can_hedge = len(pending) < self.hedging["max_in_flight"]
+                done, _ = await asyncio.wait(
+                    pending, timeout=wait_timeout if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if launch(hedge=True):
+                        hedges += 1
+                    else:
+                        # Nothing left to hedge with, wait for the attempts in flight
+                        wait_timeout = None
+                    continue
+
+                for task in done:
+                    meta = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        retry_after = _soonest(retry_after, last_error)
+                        continue
+
+                    now = time.perf_counter()
+                    losers = list(pending.values())
+                    self._record_winner(meta["model"], meta["attempt"])
+                    return {
+                        "content": task.result()["content"],
+                        "model_info": {"name": meta["model"]["name"], "provider": meta["model"]["provider"]},
+                        "usage": task.result()["usage"],
+                        "attempts": meta["attempt"],
+                        "hedge": {
+                            "delay": round(delay, 3),
+                            "hedges_launched": hedges,
+                            "winner_attempt": meta["attempt"],
+                            "winner_was_hedge": meta["hedge"],
+                            "cancelled": len(losers),
+                            # Time the cancelled attempts spent in flight, i.e. what the hedge cost upstream
+                            "wasted_seconds": round(sum(now - m["started"] for m in losers), 3),
+                            "total_seconds": round(now - started, 3)
+                        }
+                    }
+
+                # A failed attempt is replaced right away, like in the sequential chain
+                if not pending:
+                    launch(hedge=False)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if deadline.exhausted():
+            raise DeadlineExceeded(deadline.budget, last_error, hedges + 1, retry_after)
+        raise AllModelsFailed(last_error, len(models_to_try), retry_after)
+
+    def _models_to_try(self, model_config: Dict[str, Any]) -> List[Dict[str, str]]:
+        # Rebuilt on every request from live health, skipping open circuits
+        models = self.health.rank(self.fallback_models, model_config.get("name"))
+        if not models:
+            error = CircuitOpen("Every model's circuit is open")
+            raise AllModelsFailed(error, 0, self.health.reopens_in(self.fallback_models))
+        return models
+
+    async def _timed_attempt(self, messages, model, priority: int, deadline: Deadline) -> Dict[str, Any]:
+        # Keep the prompt inside this model's context window instead of failing on it
+        messages = fit_messages(messages, model["name"])
+        # Raises CircuitOpen if another request took this half-open window's probe
+        self.health.start(model)
+        # Raises RateLimited without touching the provider when there is no capacity in time
+        reservation = await self._admit(messages, model, priority, deadline)
+        started = time.perf_counter()
+        try:
+            # The SDK timeout bounds each read; wait_for bounds the attempt as a whole, slot wait included
+            response = await asyncio.wait_for(
+                self.providers.get(model["provider"]).generate(messages, model["name"], timeout=deadline.remaining()),
+                timeout=deadline.remaining()
+            )
+        except asyncio.CancelledError:
+            # Lost a hedge race; not the backend's fault
+            self._settle(model, reservation)
+            ATTEMPTS.inc(provider=model["provider"], model=model["name"], outcome="cancelled")
+            note_attempt(model["provider"], model["name"], "cancelled", time.perf_counter() - started)
+            raise
+        except Exception as e:
+            self._settle(model, reservation)
+            self._record_attempt_error(model, e, time.perf_counter() - started)
+            raise
+        self._settle(model, reservation, response["usage"])
+        latency = time.perf_counter() - started
+        self.health.record(model, ok=True, latency=latency)
+        self.recent_latencies.append(latency)
+        self._record_success(model, latency, response["usage"], latency)
+        return response
+
+    async def _admit(self, messages, model, priority: int, deadline: Deadline) -> Dict[str, int]:
+        """Reserves rate-limit capacity for the prompt and the completion cap the provider will be sent"""
+        prompt = self.scheduler.estimate_tokens(messages, 0)
+        completion_cap = self.providers.get(model["provider"]).max_completion_tokens(model["name"])
+        tokens = self.scheduler.estimate_tokens(messages, completion_cap)
+        # Queue for capacity no longer than the scheduler allows, and never past the request's deadline
+        queue_deadline = min(time.monotonic() + self.scheduler.config["max_queue_wait"], deadline.expires_at)
+        try:
+            await self.scheduler.acquire(model["provider"], model["name"], tokens, priority, queue_deadline)
+        except RateLimited:
+            ERRORS.inc(provider=model["provider"], error_class="rate_limited")
+            note_attempt(model["provider"], model["name"], "throttled", 0.0)
+            raise
+        return {"prompt": prompt, "reserved": tokens}
+
+    def _settle(self, model, reservation: Dict[str, int], usage: Optional[Dict[str, int]] = None,
+                deltas: int = 0):
+        """
+        Correct the reservation to what the attempt used: the reported usage, or else the prompt
+        plus the deltas streamed (roughly one token each); nothing was generated if there were none
+        """
+        used = (usage or {}).get("input_tokens", 0) + (usage or {}).get("output_tokens", 0)
+        if not used:
+            used = reservation["prompt"] + deltas
+        self.scheduler.reconcile(model["provider"], model["name"], reservation["reserved"], used)
+
+    def _record_attempt_error(self, model, error: Exception, seconds: float):
+        retry_after = retry_after_for(error)
+        if retry_after is not None:
+            # A 429 means the provider is up but we are over its limit: hold back the queue for that
+            # provider instead of opening its circuit and pushing all its traffic onto the others
+            self.scheduler.penalize(model["provider"], model["name"], retry_after)
+        elif classify_error(error) != "rate_limited":
+            self.health.record(model, ok=False)
+        self._record_failure(model, error, seconds)
+
+    def _record_success(self, model, seconds: float, usage: Dict[str, int], generation_seconds: float,
+                        deltas: Optional[int] = None):
+        labels = {"provider": model["provider"], "model": model["name"]}
+        ATTEMPTS.inc(outcome="success", **labels)
+        ATTEMPT_LATENCY.observe(seconds, **labels)
+        # Streams without usage fall back to counting deltas, which is roughly one token each
+        output_tokens = usage.get("output_tokens") or deltas
+        if output_tokens and generation_seconds > 0:
+            TOKENS_PER_SECOND.observe(output_tokens / generation_seconds, **labels)
+        note_attempt(model["provider"], model["name"], "success", seconds)
+
+    def _record_failure(self, model, error: Exception, seconds: float):
+        error_class = classify_error(error)
+        ATTEMPTS.inc(provider=model["provider"], model=model["name"], outcome="error")
+        ATTEMPT_LATENCY.observe(seconds, provider=model["provider"], model=model["name"])
+        ERRORS.inc(provider=model["provider"], error_class=error_class)
+        note_attempt(model["provider"], model["name"], error_class, seconds)
+
+    def _record_winner(self, model, attempt: int):
+        FAILOVER_DEPTH.observe(attempt)
+        WINNERS.inc(provider=model["provider"], model=model["name"])
+        note_timing("winner", {"provider": model["provider"], "model": model["name"], "attempt": attempt})
+
+    async def _open_stream(self, messages, model, priority: int, deadline: Deadline):
+        """
+        Admits and starts one streaming attempt; returns the stream, its first delta, usage, start time
+        and rate-limit reservation
+        """
+        fitted = fit_messages(messages, model["name"])
+        self.health.start(model)
+        reservation = await self._admit(fitted, model, priority, deadline)
+        usage = {}
+        started = time.perf_counter()
+        stream = self.providers.get(model["provider"]).stream(fitted, model["name"], usage, timeout=deadline.remaining())
+        try:
+            first = await asyncio.wait_for(stream.__anext__(), timeout=deadline.remaining())
+        except StopAsyncIteration:
+            first = ""
+        except BaseException as e:
+            await stream.aclose()
+            self._settle(model, reservation)
+            if isinstance(e, Exception):
+                self._record_attempt_error(model, e, time.perf_counter() - started)
+            raise
+        return stream, first, usage, started, reservation
+
+    async def stream_with_fallback(self, messages: List[Dict[str, str]], model_config: Dict[str, Any],
+                                   info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Streams response deltas, failing over to the next model only until the first token arrives.
+        If given, `info` is filled in with the model that answered, the time to first token and,
+        where the provider reports it on streams, token usage.
+        The deadline covers failover up to the first token; after that the stream runs to completion,
+        with the remaining budget as the SDK's per-read timeout.
+        """
+        info = info if info is not None else {}
+        models_to_try = self._models_to_try(model_config)
+        priority = model_config.get("priority", self.scheduler.config["default_priority"])
+        deadline = self._deadline(model_config)
+        started = time.perf_counter()
+        last_error = None
+        retry_after = None
+        made = 0
+        for attempt, model in enumerate(models_to_try, start=1):
+            stream = None
+            retries = 0
+            while stream is None:
+                if deadline.exhausted():
+                    raise DeadlineExceeded(deadline.budget, last_error, made, retry_after)
+                made += 1
+                try:
+                    stream, first, usage, attempt_started, reservation = await self._open_stream(
+                        messages, model, priority, deadline
+                    )
+                except Exception as e:
+                    last_error = e
+                    retry_after = _soonest(retry_after, e)
+                    retries += 1
+                    if not await self._retry_pause(e, retries, deadline):
+                        break
+            if stream is None:
+                continue
+
+            first_token_at = time.perf_counter()
+            self.health.record(model, ok=True)
+            self._record_winner(model, attempt)
+            TIME_TO_FIRST_TOKEN.observe(first_token_at - started, provider=model["provider"], model=model["name"])
+            info["model_info"] = {"name": model["name"], "provider": model["provider"]}
+            info["usage"] = usage
+            info["ttft_ms"] = round((first_token_at - started) * 1000, 1)
+            note_timing("ttft_ms", info["ttft_ms"])
+            deltas = 1 if first else 0
+            failed = False
             try:
-                if model["provider"] == "openai":
-                    response = await self._generate_openai(messages, model["name"])
-                elif model["provider"] == "anthropic":
-                    response = await self._generate_anthropic(messages, model["name"])
-                elif model["provider"] == "nvidia":
-                    response = await self._generate_nvidia(messages, model["name"])
-                return response
+                if first:
+                    yield first
+                async for delta in stream:
+                    deltas += 1
+                    yield delta
             except Exception as e:
-                last_error = e
-                continue
-                
-        raise Exception(f"All models failed. Last error: {str(last_error)}")
-
-    async def _generate_openai(self, messages, model_name):
-        response = await self.openai_client.chat.completions.create(
-            model=model_name,
-            messages=messages
-        )
-        return response.choices[0].message.content
-
-    async def _generate_anthropic(self, messages, model_name):
-        # Convert chat format to Anthropic format
-        formatted_messages = self._format_for_anthropic(messages)
-        response = await self.anthropic_client.messages.create(
-            model=model_name,
-            messages=formatted_messages
-        )
-        return response.content[0].text
-
-    async def _generate_nvidia(self, messages, model_name):
-        response = await self.nvidia_client.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            temperature=0.5,
-            top_p=1,
-            max_tokens=1024
-        )
-        return response.choices[0].message.content
-
-    def _format_for_anthropic(self, messages):
-        # Convert standard chat format to Anthropic's format
-        formatted = []
-        for msg in messages:
-            role = "assistant" if msg["role"] == "assistant" else "user"
-            formatted.append({"role": role, "content": msg["content"]})
-        return formatted
\ No newline at end of file
+                # Too late to fail over, but the backend broke mid-answer: count it against its health
+                failed = True
+                self.health.record(model, ok=False)
+                self._record_failure(model, e, time.perf_counter() - attempt_started)
+                raise
+            finally:
+                # Also runs when the consumer stops early, which closes the upstream stream
+                await stream.aclose()
+                self._settle(model, reservation, usage, deltas)
+                finished = time.perf_counter()
+                info["total_ms"] = round((finished - started) * 1000, 1)
+                if not failed:
+                    self._record_success(model, finished - attempt_started, usage, finished - first_token_at,
+                                         deltas)
+            return
+
+        raise AllModelsFailed(last_error, len(models_to_try), retry_after)
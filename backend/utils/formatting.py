@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Tuple
+
+from .context import estimate_tokens
+
+# Anthropic caches the prompt prefix up to and including a block carrying this marker
+CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+
+def format_for_anthropic(messages: List[Dict[str, str]], prompt_caching: bool = True,
+                         min_cacheable_tokens: int = 1024) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Convert standard chat messages to Anthropic's `system` blocks and alternating user/assistant turns.
+
+    With prompt caching on, the last system block is a cache breakpoint, so the agent prompt,
+    summary and brand excerpts are cached together, and so is the turn before the latest one,
+    so multi-turn chats reuse their history. Anthropic ignores breakpoints on prefixes shorter
+    than its minimum, so a breakpoint is only set once the estimated prefix reaches
+    min_cacheable_tokens.
+    """
+    system = [
+        {"type": "text", "text": str(m["content"])}
+        for m in messages if m["role"] == "system"
+    ]
+
+    turns: List[Dict[str, Any]] = []
+    for message in messages:
+        if message["role"] == "system":
+            continue
+        role = "assistant" if message["role"] == "assistant" else "user"
+        block = {"type": "text", "text": str(message["content"])}
+        # Anthropic requires strict alternation, so consecutive same-role messages are merged
+        if turns and turns[-1]["role"] == role:
+            turns[-1]["content"].append(block)
+        else:
+            turns.append({"role": role, "content": [block]})
+    if not turns or turns[0]["role"] != "user":
+        turns.insert(0, {"role": "user", "content": [{"type": "text", "text": "(conversation continues)"}]})
+
+    if prompt_caching:
+        prefix = sum(estimate_tokens(block["text"]) for block in system)
+        if system and prefix >= min_cacheable_tokens:
+            system[-1]["cache_control"] = CACHE_BREAKPOINT
+        if len(turns) >= 3:
+            prefix += sum(estimate_tokens(block["text"]) for turn in turns[:-1] for block in turn["content"])
+            if prefix >= min_cacheable_tokens:
+                turns[-2]["content"][-1]["cache_control"] = CACHE_BREAKPOINT
+    return system, turns
+
+
+def anthropic_usage(usage) -> Dict[str, int]:
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0
+    }
+
+
+def openai_usage(usage) -> Dict[str, int]:
+    """OpenAI usage in the same shape; its automatic prompt caching only reports reads"""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "input_tokens": usage.prompt_tokens,
+        "output_tokens": usage.completion_tokens,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    }
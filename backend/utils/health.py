@@ -0,0 +1,183 @@
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from ..config import HEALTH_CONFIG, get_model_config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised when an attempt is about to start but its circuit is open or this window's probe is taken"""
+
+
+class EndpointHealth:
+    """EWMA latency, rolling error rate and circuit-breaker state for one provider or model"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.state = CLOSED
+        self.ewma_latency: Optional[float] = None
+        self.outcomes = deque()
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.last_probe_at = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def _trim(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > self.config["window_seconds"]:
+            self.outcomes.popleft()
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        self._trim(now or time.monotonic())
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Whether a request may be sent, including an occasional probe of an open circuit"""
+        now = now or time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.config["open_seconds"]:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return now - self.last_probe_at >= self.config["probe_interval"]
+        return self.state == CLOSED
+
+    def reopens_in(self, now: Optional[float] = None) -> float:
+        """Seconds until available() next turns true; 0 if it already is"""
+        now = now or time.monotonic()
+        if self.available(now):
+            return 0.0
+        if self.state == OPEN:
+            return self.opened_at + self.config["open_seconds"] - now
+        return self.last_probe_at + self.config["probe_interval"] - now
+
+    def start(self, now: Optional[float] = None):
+        """Claims the half-open window's probe; later attempts see the circuit unavailable until the next window"""
+        if self.state == HALF_OPEN:
+            self.last_probe_at = now or time.monotonic()
+
+    def record(self, ok: bool, latency: Optional[float] = None, now: Optional[float] = None):
+        now = now or time.monotonic()
+        self.total_requests += 1
+        self.outcomes.append((now, ok))
+        self._trim(now)
+
+        if ok:
+            self.consecutive_failures = 0
+            if latency is not None:
+                alpha = self.config["ewma_alpha"]
+                self.ewma_latency = latency if self.ewma_latency is None else \
+                    alpha * latency + (1 - alpha) * self.ewma_latency
+            if self.state == HALF_OPEN:
+                # The probe succeeded, start over with a clean window
+                self.state = CLOSED
+                self.outcomes.clear()
+            return
+
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self._should_trip(now):
+            self.state = OPEN
+            self.opened_at = now
+
+    def _should_trip(self, now: float) -> bool:
+        if self.consecutive_failures >= self.config["consecutive_failures"]:
+            return True
+        return len(self.outcomes) >= self.config["min_requests"] and \
+            self.error_rate(now) >= self.config["error_rate_threshold"]
+
+    def score(self, now: Optional[float] = None) -> float:
+        """Lower is better: expected latency inflated by the recent error rate"""
+        latency = self.ewma_latency if self.ewma_latency is not None else self.config["default_latency"]
+        return latency * (1 + self.config["error_penalty"] * self.error_rate(now))
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.monotonic()
+        self.available(now)
+        return {
+            "state": self.state,
+            "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate(now), 3),
+            "window_requests": len(self.outcomes),
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "open_for": round(now - self.opened_at, 1) if self.state != CLOSED else None
+        }
+
+
+class HealthTracker:
+    """Tracks provider and model health and turns the static fallback list into a per-request try order"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or HEALTH_CONFIG
+        self.providers: Dict[str, EndpointHealth] = {}
+        self.models: Dict[str, EndpointHealth] = {}
+
+    def provider(self, name: str) -> EndpointHealth:
+        if name not in self.providers:
+            self.providers[name] = EndpointHealth(self.config)
+        return self.providers[name]
+
+    def model(self, name: str) -> EndpointHealth:
+        if name not in self.models:
+            self.models[name] = EndpointHealth(self.config)
+        return self.models[name]
+
+    def rank(self, models: List[Dict[str, str]], requested_model: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Healthy models first, best score first, with the requested model kept in front while it is healthy.
+        The requested model matches by MODELS key or provider-side name, so an alias such as "claude-3"
+        selects the fallback entry for the same model. Backends with an open circuit are skipped unless
+        a probe is due, so the list is empty when every circuit is open; callers fail fast then, and
+        reopens_in() says when to try again.
+        """
+        now = time.monotonic()
+        available = [
+            m for m in models
+            if self.provider(m["provider"]).available(now) and self.model(m["name"]).available(now)
+        ]
+        if not available:
+            return []
+
+        target = get_model_config(requested_model)["name"] if requested_model else None
+        requested = [m for m in available if get_model_config(m["name"])["name"] == target]
+        others = [m for m in available if m not in requested]
+        others.sort(key=lambda m: self.model(m["name"]).score(now) + self.provider(m["provider"]).score(now))
+        return requested + others
+
+    def reopens_in(self, models: List[Dict[str, str]]) -> float:
+        """Seconds until the first of these backends takes requests again, counting both of its circuits"""
+        now = time.monotonic()
+        return min((
+            max(self.provider(m["provider"]).reopens_in(now), self.model(m["name"]).reopens_in(now))
+            for m in models
+        ), default=0.0)
+
+    def start(self, model: Dict[str, str]):
+        """
+        Called right before an attempt is sent. Ranking only checks availability, so several requests
+        can rank a half-open backend at once; the first to start takes the probe and the rest get CircuitOpen.
+        """
+        now = time.monotonic()
+        provider, model_health = self.provider(model["provider"]), self.model(model["name"])
+        if not (provider.available(now) and model_health.available(now)):
+            raise CircuitOpen(f"Circuit for {model['name']} ({model['provider']}) is open")
+        provider.start(now)
+        model_health.start(now)
+
+    def record(self, model: Dict[str, str], ok: bool, latency: Optional[float] = None):
+        now = time.monotonic()
+        self.provider(model["provider"]).record(ok, latency, now)
+        self.model(model["name"]).record(ok, latency, now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "providers": {name: h.snapshot(now) for name, h in self.providers.items()},
+            "models": {name: h.snapshot(now) for name, h in self.models.items()}
+        }
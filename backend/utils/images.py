@@ -0,0 +1,201 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..config import IMAGE_CONFIG
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    """Too many image jobs are waiting already"""
+
+
+class ImageCache:
+    """Generated images on disk, one file per prompt/model/size/quality, so repeats never hit the provider"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def make_key(prompt: str, model: str, size: str, quality: str) -> str:
+        normalized = {"prompt": " ".join(prompt.split()), "model": model, "size": size, "quality": quality}
+        payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put(self, key: str, data: bytes):
+        _write_atomic(self.path(key), data)
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so a reader never sees a half-written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ImageJobQueue:
+    """
+    Image generations run as background jobs: submit returns at once and the job is polled.
+    A fixed number of workers drain a bounded queue. A job whose image is already on disk
+    finishes immediately, and a job identical to one still pending or running returns that job.
+    Job records are also written next to the images, so any server process can answer a poll.
+    """
+
+    def __init__(self, generate: Callable[..., Awaitable[Dict[str, Any]]], config: Optional[Dict[str, Any]] = None):
+        self.generate = generate
+        self.config = config or IMAGE_CONFIG
+        self.cache = ImageCache(self.config["cache_dir"])
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._last_expiry = 0.0
+        self.stats = {"submitted": 0, "cache_hits": 0, "deduplicated": 0, "generated": 0, "failed": 0, "rejected": 0}
+
+    def _start(self):
+        # Created on first use so the queue and workers belong to the server's event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.config["workers"])]
+
+    def _new_job(self, key: str, params: Dict[str, str], status: str) -> Dict[str, Any]:
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": status,
+            "image_key": key,
+            **params,
+            "created_at": time.time(),
+            "finished_at": time.time() if status == SUCCEEDED else None,
+            "error": None
+        }
+        self.jobs[job["job_id"]] = job
+        self._save(job)
+        return job
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.config["cache_dir"], "jobs", f"{job_id}.json")
+
+    def _save(self, job: Dict[str, Any]):
+        _write_atomic(self._job_path(job["job_id"]), json.dumps(job).encode("utf-8"))
+
+    def submit(self, prompt: str, model: str, size: str, quality: str) -> Dict[str, Any]:
+        self._start()
+        self._expire()
+        self.stats["submitted"] += 1
+        params = {"prompt": prompt, "model": model, "size": size, "quality": quality}
+        key = self.cache.make_key(prompt, model, size, quality)
+
+        if self.cache.has(key):
+            self.stats["cache_hits"] += 1
+            return {**self._new_job(key, params, SUCCEEDED), "cached": True}
+        if key in self._in_flight:
+            self.stats["deduplicated"] += 1
+            return {**self.jobs[self._in_flight[key]], "deduplicated": True}
+        if self._queue.qsize() >= self.config["max_pending"]:
+            self.stats["rejected"] += 1
+            raise QueueFull(f"{self._queue.qsize()} image jobs are already waiting")
+
+        job = self._new_job(key, params, PENDING)
+        self._in_flight[key] = job["job_id"]
+        self._queue.put_nowait(job)
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None and job_id.isalnum():
+            # Submitted to another server process
+            try:
+                with open(self._job_path(job_id), "rb") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return None
+        if job is None:
+            return None
+        result = dict(job)
+        if job["status"] == PENDING:
+            # Rough place in line, for clients that want to show progress
+            result["queue_position"] = sum(
+                1 for other in self.jobs.values()
+                if other["status"] == PENDING and other["created_at"] <= job["created_at"]
+            )
+        return result
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job["status"] = RUNNING
+            self._save(job)
+            try:
+                response = await self.generate(
+                    job["prompt"], name=job["model"], size=job["size"], quality=job["quality"],
+                    response_format="b64_json"
+                )
+                self.cache.put(job["image_key"], base64.b64decode(response["b64_json"]))
+                job["status"] = SUCCEEDED
+                self.stats["generated"] += 1
+            except Exception as e:
+                job["status"] = FAILED
+                job["error"] = str(e)
+                self.stats["failed"] += 1
+            finally:
+                job["finished_at"] = time.time()
+                self._save(job)
+                self._in_flight.pop(job["image_key"], None)
+                self._queue.task_done()
+
+    def _expire(self):
+        now = time.time()
+        if now - self._last_expiry < 60:
+            return
+        self._last_expiry = now
+        cutoff = now - self.config["job_ttl"]
+        for job_id in [j for j, job in self.jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+            del self.jobs[job_id]
+        try:
+            entries = list(os.scandir(os.path.join(self.config["cache_dir"], "jobs")))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.stat().st_mtime < cutoff:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    async def aclose(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._in_flight),
+            "workers": self.config["workers"]
+        }
@@ -0,0 +1,652 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone
+from itertools import repeat
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import MENTIONS_CONFIG
+from .brand_index import STOPWORDS
+from .metrics import note_timing
+
+# Row timestamps that are missing or could not be parsed
+UNDATED = np.iinfo(np.int64).min
+
+INTERVALS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+# Odd multipliers for the token hash: the length, then each 8-byte word of the token (uint64 wraps)
+HASH_FACTORS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93],
+                        dtype=np.uint64)
+# Token bytes read into the hash; longer tokens are told apart only by these and their length
+HASH_BYTES = 24
+# BYTE_MASKS[n] keeps the low n bytes of a little-endian word
+BYTE_MASKS = np.array([(1 << (8 * n)) - 1 for n in range(9)], dtype=np.uint64)
+
+NEWLINE, QUOTE, PERIOD, DIGIT_ZERO = 10, 34, 46, 48
+
+# Byte classes for the tokenizer: ASCII letters (lowercased), digits and every non-ASCII byte, so
+# UTF-8 words stay whole, are word bytes; everything else maps to 0 and separates tokens
+WORD_BYTES = bytes(
+    byte + 32 if 65 <= byte <= 90 else byte if (48 <= byte <= 57 or 97 <= byte <= 122 or byte >= 128) else 0
+    for byte in range(256)
+)
+
+
+class MentionDataError(ValueError):
+    """The upload is not a mention export this pipeline can read"""
+
+
+def hash_tokens(lower: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    64-bit hashes of the tokens lower[starts:ends]. `lower` must end in HASH_BYTES bytes of padding:
+    a view with a one-byte stride reads the eight bytes at any offset as one unaligned uint64,
+    so a token costs a few gathers instead of a pass over every byte.
+    """
+    words = np.ndarray((len(lower) - 7,), dtype="<u8", buffer=lower, strides=(1,))
+    lengths = ends - starts
+    hashes = (lengths.astype(np.uint64) * HASH_FACTORS[0] ^ words[starts] & BYTE_MASKS[np.minimum(lengths, 8)]) * \
+        HASH_FACTORS[1]
+    # Most words fit in the first eight bytes; only longer tokens need the rest
+    long = np.flatnonzero(lengths > 8)
+    for part in (1, 2):
+        word = words[starts[long] + 8 * part] & BYTE_MASKS[np.clip(lengths[long] - 8 * part, 0, 8)]
+        hashes[long] = (hashes[long] ^ word) * HASH_FACTORS[part + 1]
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def lowercase(data: np.ndarray) -> np.ndarray:
+    """Word bytes lowercased and every other byte zeroed, followed by the padding hash_tokens reads"""
+    # bytes.translate does the table lookup far faster than numpy fancy indexing
+    return np.frombuffer(data.tobytes().translate(WORD_BYTES) + bytes(HASH_BYTES), dtype=np.uint8)
+
+
+def hash_words(words: List[str]) -> np.ndarray:
+    """Hashes of whole words, matching the ones computed for them as tokens"""
+    encoded = [word.encode("utf-8") for word in words]
+    lengths = np.array([len(word) for word in encoded], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    lower = lowercase(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    return hash_tokens(lower, starts, starts + lengths)
+
+
+class _WordTable:
+    """
+    Exact lookup of a few hundred word hashes. A direct-address table on a window of hash bits, picked
+    so that no two words share a slot, answers in a couple of array gathers per token.
+    """
+
+    def __init__(self, hashes: np.ndarray):
+        for bits in (16, 18, 20, 22, 24):
+            mask = np.uint64((1 << bits) - 1)
+            for shift in range(0, 64 - bits + 1, 2):
+                slots = (hashes >> np.uint64(shift)) & mask
+                if len(np.unique(slots)) == len(hashes):
+                    self.shift, self.mask = np.uint64(shift), mask
+                    self.keys = np.zeros(1 << bits, dtype=np.uint64)
+                    self.index = np.full(1 << bits, -1, dtype=np.int32)
+                    self.keys[slots] = hashes
+                    self.index[slots] = np.arange(len(hashes))
+                    return
+        raise ValueError("Word hashes collide in every table window")
+
+    def find(self, hashes: np.ndarray) -> np.ndarray:
+        """Position of each hash in the word list, or -1"""
+        slots = (hashes >> self.shift) & self.mask
+        index = self.index[slots]
+        return np.where(self.keys[slots] == hashes, index, -1)
+
+
+class _TermCounts:
+    """
+    Term frequencies by hash. When the table grows past twice its capacity only the most frequent
+    `capacity` terms are kept, so memory stays bounded and rare terms may be undercounted.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def add(self, hashes: np.ndarray, counts: np.ndarray):
+        """Add counts for sorted, distinct hashes"""
+        position = np.searchsorted(self.hashes, hashes)
+        found = position < len(self.hashes)
+        found[found] = self.hashes[position[found]] == hashes[found]
+        self.counts[position[found]] += counts[found]
+        if not found.all():
+            # Both arrays are sorted, so inserting at the searchsorted positions keeps the table sorted
+            self.hashes = np.insert(self.hashes, position[~found], hashes[~found])
+            self.counts = np.insert(self.counts, position[~found], counts[~found])
+        if len(self.hashes) > 2 * self.capacity:
+            keep = np.sort(np.argpartition(-self.counts, self.capacity - 1)[:self.capacity])
+            self.hashes, self.counts = self.hashes[keep], self.counts[keep]
+
+    def get(self, hashes: np.ndarray) -> np.ndarray:
+        position = np.minimum(np.searchsorted(self.hashes, hashes), max(len(self.hashes) - 1, 0))
+        return np.where(self.hashes[position] == hashes, self.counts[position], 0) if len(self.hashes) else \
+            np.zeros(len(hashes), dtype=np.int64)
+
+    def bar(self, k: int) -> int:
+        """The k-th highest count, which a term needs to be in the top k"""
+        return int(np.partition(self.counts, len(self.counts) - k)[len(self.counts) - k]) if len(self.counts) >= k else 0
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        order = np.argsort(-self.counts, kind="stable")[:k]
+        return [(int(self.hashes[i]), int(self.counts[i])) for i in order]
+
+
+class MentionAggregator:
+    """
+    Streams a CSV or JSONL mention export through vectorized aggregates: mentions and mean sentiment
+    per hour, lexicon sentiment with simple negation, the most frequent terms overall and in negative
+    mentions. Rows are never kept; each piece of the upload is parsed into NumPy arrays, folded into
+    the running totals and dropped, so memory stays flat however long the file is.
+
+    `feed` buffers incoming bytes and `process` does the work, so callers can run the CPU-bound part
+    off the event loop. `finish` returns the compact summary that is handed to the analytics agent.
+    """
+
+    def __init__(self, data_format: Optional[str] = None, text_field: Optional[str] = None,
+                 time_field: Optional[str] = None, interval: Optional[str] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.config = config or MENTIONS_CONFIG
+        if data_format not in (None, "csv", "jsonl"):
+            raise MentionDataError("format must be csv or jsonl")
+        if interval not in (None, *INTERVALS):
+            raise MentionDataError(f"interval must be one of: {', '.join(INTERVALS)}")
+        self.format = data_format
+        self.text_field = text_field
+        self.time_field = time_field
+        self.interval = interval
+
+        self.buffer = bytearray()
+        self.received = 0
+        self.header: Optional[List[str]] = None
+        self.delimiter = ","
+        self.columns: Optional[Tuple[int, Optional[int]]] = None
+
+        # Lexicon words, negators and stopwords in one table, with what each of them means
+        lexicon = self.config["lexicon"]
+        words = sorted(set(lexicon) | set(self.config["negators"]) | STOPWORDS)
+        self.words = _WordTable(hash_words(words))
+        self.word_weights = np.array([lexicon.get(w, 0) for w in words] + [0], dtype=np.float64)
+        self.word_negates = np.array([w in self.config["negators"] for w in words] + [False])
+        # Negators are too common to be interesting terms
+        self.word_ignored = np.array([w in STOPWORDS or w in self.config["negators"] for w in words] + [False])
+
+        self.rows = 0
+        self.skipped = 0
+        self.sentiment_total = 0.0
+        self.positive = 0
+        self.negative = 0
+        # Per hour since the epoch: mentions, summed sentiment, positive and negative mentions
+        self.hours: Dict[int, np.ndarray] = {}
+        self.terms = _TermCounts(self.config["max_terms"])
+        self.negative_terms = _TermCounts(self.config["max_terms"])
+        self.names: Dict[int, str] = {}
+        self.seconds = 0.0
+
+    # Input
+
+    def feed(self, chunk: bytes) -> bool:
+        """Buffer part of the upload; returns True once enough has arrived to be worth processing"""
+        self.received += len(chunk)
+        if self.received > self.config["max_bytes"]:
+            raise MentionDataError(f"Upload exceeds {self.config['max_bytes']} bytes")
+        self.buffer += chunk
+        return len(self.buffer) >= self.config["chunk_bytes"]
+
+    def process(self, final: bool = False):
+        """Aggregate every complete record in the buffer; with final=True, everything that is left"""
+        started = time.perf_counter()
+        if final and self.buffer and not self.buffer.endswith(b"\n"):
+            self.buffer += b"\n"
+        if self.format is None:
+            self._detect_format(final)
+        if self.format == "csv":
+            consumed = self._process_csv()
+        elif self.format == "jsonl":
+            consumed = self._process_jsonl()
+        else:
+            consumed = 0
+        del self.buffer[:consumed]
+        self.seconds += time.perf_counter() - started
+        if len(self.buffer) > self.config["max_record_bytes"]:
+            raise MentionDataError(
+                f"No complete record in {self.config['max_record_bytes']} bytes; check for an unclosed quote")
+
+    def finish(self) -> Dict[str, Any]:
+        """Aggregate the rest of the upload and return the summary"""
+        self.process(final=True)
+        if self.buffer.strip():
+            raise MentionDataError("The upload ends inside a quoted field")
+        if not self.rows:
+            raise MentionDataError("The upload has no mentions")
+        return self.summary()
+
+    def _detect_format(self, final: bool):
+        if self.buffer.startswith(b"\xef\xbb\xbf"):
+            del self.buffer[:3]
+        sample = self.buffer.lstrip()
+        if sample:
+            self.format = "jsonl" if sample.startswith(b"{") else "csv"
+        elif final:
+            raise MentionDataError("The upload is empty")
+
+    def _process_csv(self) -> int:
+        consumed = 0
+        if self.header is None:
+            end = self.buffer.find(b"\n")
+            if end < 0:
+                return 0
+            line = self.buffer[:end].decode("utf-8", "replace").rstrip("\r")
+            self.delimiter = "\t" if "\t" in line and "," not in line else ","
+            self.header = next(csv.reader([line], delimiter=self.delimiter))
+            self.columns = self._columns(self.header)
+            consumed = end + 1
+
+        data = np.frombuffer(self.buffer, dtype=np.uint8)[consumed:]
+        # Delimiters and newlines after an odd number of quotes are inside a quoted field
+        quotes = np.flatnonzero(data == QUOTE)
+        opening = quotes[0::2]
+        before = data[np.maximum(opening - 1, 0)]
+        if not np.all((opening == 0) | (before == NEWLINE) | (before == ord(self.delimiter)) | (before == QUOTE)):
+            # A quote inside an unquoted field (5" screen) is a plain character and must not flip the count
+            quotes = self._quote_toggles(data, quotes)
+        separators = np.flatnonzero((data == NEWLINE) | (data == ord(self.delimiter)))
+        separators = separators[(np.searchsorted(quotes, separators) & 1) == 0]
+        newlines = np.flatnonzero(data[separators] == NEWLINE)
+        if not len(newlines):
+            return consumed
+        cut = int(separators[newlines[-1]]) + 1
+        data, separators = data[:cut], separators[:newlines[-1] + 1]
+
+        fields = np.diff(np.concatenate(([-1], newlines)))
+        width = len(self.header)
+        if np.all(fields == width):
+            ends = separators.reshape(-1, width)
+            starts = np.concatenate(([0], separators[:-1] + 1)).reshape(-1, width)
+            text_column, time_column = self.columns
+            text_starts, text_ends = self._unquote(data, starts[:, text_column], ends[:, text_column])
+            if time_column is None:
+                times = np.full(len(ends), UNDATED, dtype=np.int64)
+            else:
+                times = parse_times(self._gather(data, *self._unquote(
+                    data, starts[:, time_column], ends[:, time_column])))
+            self._aggregate(data, text_starts, text_ends, times)
+        else:
+            # Blank lines or rows with a different number of fields; the csv module copes with both
+            self._aggregate_rows(csv.reader(io.StringIO(data.tobytes().decode("utf-8", "replace")),
+                                            delimiter=self.delimiter))
+        return consumed + cut
+
+    def _quote_toggles(self, data: np.ndarray, quotes: np.ndarray) -> np.ndarray:
+        """
+        The quotes that open or close a quoted field, the way the csv module reads them: a quote opens
+        one only at the start of a field, and a doubled quote inside one is a literal quote (the pair
+        closes and reopens, so the count stays even).
+        """
+        delimiter = ord(self.delimiter)
+        toggles, inside = [], False
+        for position, before in zip(quotes.tolist(), data[np.maximum(quotes - 1, 0)].tolist()):
+            if inside:
+                toggles.append(position)
+                inside = False
+            elif position == 0 or before in (NEWLINE, delimiter) or (toggles and toggles[-1] == position - 1):
+                toggles.append(position)
+                inside = True
+        return np.array(toggles, dtype=np.int64)
+
+    def _columns(self, header: List[str]) -> Tuple[int, Optional[int]]:
+        names = [name.strip().lower() for name in header]
+        text = self._pick(names, self.text_field, self.config["text_fields"], "text")
+        if text is None:
+            raise MentionDataError(f"No text column; name one with text_field (columns: {', '.join(header)})")
+        return text, self._pick(names, self.time_field, self.config["time_fields"], "time")
+
+    @staticmethod
+    def _pick(names: List[str], requested: Optional[str], candidates: List[str], kind: str) -> Optional[int]:
+        if requested is not None:
+            if requested.lower() not in names:
+                raise MentionDataError(f"No {kind} column named {requested}")
+            return names.index(requested.lower())
+        return next((names.index(c) for c in candidates if c in names), None)
+
+    @staticmethod
+    def _unquote(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Field spans without a trailing carriage return or surrounding quotes"""
+        last = np.maximum(ends - 1, 0)
+        ends = ends - ((ends > starts) & (data[last] == ord("\r")))
+        quoted = (ends - starts >= 2) & (data[np.minimum(starts, len(data) - 1)] == QUOTE) & \
+            (data[np.maximum(ends - 1, 0)] == QUOTE)
+        return starts + quoted, ends - quoted
+
+    def _gather(self, data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Fields as a NUL-padded (rows, max_time_chars) byte matrix, the layout numpy reads as S strings"""
+        width = max(1, min(self.config["max_time_chars"], int((ends - starts).max(initial=0))))
+        offsets = np.arange(width)
+        index = np.minimum(starts[:, None] + offsets, len(data) - 1)
+        return np.where(offsets < (ends - starts)[:, None], data[index], 0).astype(np.uint8)
+
+    def _process_jsonl(self) -> int:
+        cut = self.buffer.rfind(b"\n") + 1
+        if not cut:
+            return 0
+        piece = bytes(self.buffer[:cut])
+        try:
+            # One decoder call for the whole piece is much faster than one per line
+            records = json.loads(b"[" + piece.rstrip().replace(b"\n", b",") + b"]")
+        except ValueError:
+            # Blank or malformed lines; decode line by line and skip the bad ones
+            records = []
+            for line in piece.split(b"\n"):
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        self.skipped += 1
+        # map() and set() keep these per-record checks out of the interpreter loop
+        objects = records if set(map(type, records)) == {dict} else [r for r in records if isinstance(r, dict)]
+        self.skipped += len(records) - len(objects)
+        if not objects:
+            return cut
+        if self.columns is None:
+            first = objects[0]
+            names = list(first)
+            text = self._pick([n.lower() for n in names], self.text_field, self.config["text_fields"], "text")
+            if text is None:
+                raise MentionDataError(f"No text field; name one with text_field (fields: {', '.join(names)})")
+            time_index = self._pick([n.lower() for n in names], self.time_field, self.config["time_fields"], "time")
+            self.columns = (names[text], names[time_index] if time_index is not None else None)
+
+        text_key, time_key = self.columns
+        texts = list(map(dict.get, objects, repeat(text_key)))
+        times = list(map(dict.get, objects, repeat(time_key))) if time_key is not None else [None] * len(objects)
+        self._aggregate_values(texts, times)
+        return cut
+
+    def _aggregate_rows(self, rows):
+        text_column, time_column = self.columns
+        texts, times = [], []
+        for row in rows:
+            if not row:
+                continue
+            if len(row) <= max(text_column, time_column or 0):
+                self.skipped += 1
+                continue
+            texts.append(row[text_column])
+            times.append(row[time_column] if time_column is not None else None)
+        self._aggregate_values(texts, times)
+
+    def _aggregate_values(self, texts: List[str], times: List[Any]):
+        """Aggregate already-decoded rows by packing their texts into one NUL-separated buffer"""
+        if set(map(type, texts)) != {str}:
+            rows = [(text, value) for text, value in zip(texts, times) if isinstance(text, str)]
+            self.skipped += len(texts) - len(rows)
+            texts, times = [text for text, _ in rows], [value for _, value in rows]
+        if not texts:
+            return
+        data = np.frombuffer("\0".join(texts).encode("utf-8", "replace"), dtype=np.uint8)
+        breaks = np.flatnonzero(data == 0)
+        if len(breaks) != len(texts) - 1:
+            texts = [text.replace("\0", " ") for text in texts]
+            data = np.frombuffer("\0".join(texts).encode("utf-8", "replace"), dtype=np.uint8)
+            breaks = np.flatnonzero(data == 0)
+        starts = np.concatenate(([0], breaks + 1))
+        ends = np.concatenate((breaks, [len(data)]))
+        width = self.config["max_time_chars"]
+        stamps = None
+        if set(map(type, times)) == {str}:
+            try:
+                stamps = np.array(times, dtype=f"U{min(width, max(map(len, times)) or 1)}").astype(f"S{width}")
+            except UnicodeEncodeError:
+                pass
+        if stamps is None:
+            stamps = np.array([
+                b"" if value is None else str(value).encode("utf-8", "replace")[:width] for value in times
+            ], dtype=f"S{width}")
+        self._aggregate(data, starts, ends, parse_times(stamps.view(np.uint8).reshape(len(times), width)))
+
+    # Aggregation
+
+    def _aggregate(self, data: np.ndarray, starts: np.ndarray, ends: np.ndarray, times: np.ndarray):
+        """Fold one piece into the totals: `data` holds the bytes, rows are the [starts, ends) spans"""
+        rows = len(starts)
+        if not rows:
+            return
+        lower = lowercase(data[:int(ends.max())])
+        word = np.zeros(len(lower) + 2 - HASH_BYTES, dtype=bool)
+        word[1:-1] = lower[:-HASH_BYTES] != 0
+        # Word runs start and end where the byte class flips, so the flips alternate start, end
+        flips = np.flatnonzero(word[1:] != word[:-1])
+        token_starts, token_ends = flips[0::2], flips[1::2]
+
+        # Tokens per row, counted from where each row's text starts; in CSV pieces the other
+        # columns are tokenized too, so tokens past the end of a row's text are dropped
+        token_rows = np.repeat(np.arange(rows), np.diff(np.searchsorted(token_starts, starts), append=len(token_starts)))
+        token_rows = np.concatenate((np.full(len(token_starts) - len(token_rows), -1), token_rows))
+        inside = (token_rows >= 0) & (token_ends <= ends[token_rows])
+        token_starts, token_ends, token_rows = token_starts[inside], token_ends[inside], token_rows[inside]
+
+        hashes = hash_tokens(lower, token_starts, token_ends)
+
+        # Lexicon sentiment; a negator right before a word in the same mention flips it
+        known = self.words.find(hashes)
+        weights = self.word_weights[known]
+        negated = np.zeros(len(hashes), dtype=bool)
+        negated[1:] = self.word_negates[known[:-1]] & (token_rows[:-1] == token_rows[1:])
+        weights[negated] *= -1
+        raw = np.bincount(token_rows, weights=weights, minlength=rows)
+        # Squash so one very emphatic mention does not outweigh many ordinary ones
+        scores = np.tanh(raw / 2)
+
+        self.rows += rows
+        self.sentiment_total += float(scores.sum())
+        self.positive += int((raw > 0).sum())
+        self.negative += int((raw < 0).sum())
+
+        lengths = token_ends - token_starts
+        term = (lengths >= self.config["min_term_chars"]) & ((lower[token_starts] - np.uint8(DIGIT_ZERO)) >= 10) & \
+            ~self.word_ignored[known]
+        self._count(self.terms, hashes[term], lower, token_starts[term], token_ends[term])
+        term &= raw[token_rows] < 0
+        self._count(self.negative_terms, hashes[term], lower, token_starts[term], token_ends[term])
+
+        dated = times != UNDATED
+        if dated.any():
+            hours, inverse_hours = np.unique(times[dated] // 3600, return_inverse=True)
+            totals = np.stack((
+                np.bincount(inverse_hours, minlength=len(hours)),
+                np.bincount(inverse_hours, weights=scores[dated], minlength=len(hours)),
+                np.bincount(inverse_hours, weights=raw[dated] > 0, minlength=len(hours)),
+                np.bincount(inverse_hours, weights=raw[dated] < 0, minlength=len(hours))
+            ), axis=1)
+            for hour, values in zip(hours.tolist(), totals):
+                if hour in self.hours:
+                    self.hours[hour] += values
+                else:
+                    self.hours[hour] = values.astype(np.float64)
+
+    def _count(self, counts: _TermCounts, hashes: np.ndarray, lower: np.ndarray,
+               starts: np.ndarray, ends: np.ndarray):
+        if not len(hashes):
+            return
+        unique, frequency = np.unique(hashes, return_counts=True)
+        counts.add(unique, frequency)
+        # Only terms that can still make the top list are spelled out. A term's count is final after
+        # its last appearance and the bar only rises, so checking this piece's terms is enough.
+        contenders = unique[counts.get(unique) >= counts.bar(self.config["top_terms"])]
+        missing = np.array([h for h in contenders.tolist() if h not in self.names], dtype=np.uint64)
+        if len(missing):
+            occurrences = np.flatnonzero(np.isin(hashes, missing))
+            _, first = np.unique(hashes[occurrences], return_index=True)
+            for index in occurrences[first].tolist():
+                self.names[int(hashes[index])] = lower[starts[index]:ends[index]].tobytes().decode("utf-8", "replace")
+
+    # Summary
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals, the volume series, spikes and top terms, small enough to put in a prompt"""
+        dated = int(sum(values[0] for values in self.hours.values()))
+        result = {
+            "mentions": self.rows,
+            "skipped_rows": self.skipped,
+            "undated": self.rows - dated,
+            "sentiment": {
+                "mean": round(self.sentiment_total / self.rows, 3) if self.rows else 0.0,
+                "positive": round(self.positive / self.rows, 3) if self.rows else 0.0,
+                "negative": round(self.negative / self.rows, 3) if self.rows else 0.0
+            },
+            "top_terms": self._top(self.terms),
+            "negative_terms": self._top(self.negative_terms),
+            "seconds": round(self.seconds, 3)
+        }
+        result["sentiment"]["neutral"] = round(
+            max(0.0, 1 - result["sentiment"]["positive"] - result["sentiment"]["negative"]), 3)
+        result.update(self._series())
+        return result
+
+    def _top(self, counts: _TermCounts) -> List[Dict[str, Any]]:
+        return [{"term": self.names.get(h, "?"), "count": c}
+                for h, c in counts.top(self.config["top_terms"])]
+
+    def _series(self) -> Dict[str, Any]:
+        if not self.hours:
+            return {"interval": None, "start": None, "end": None, "volume": [], "spikes": []}
+        first, last = min(self.hours), max(self.hours)
+        interval = self.interval or next(
+            (name for name, seconds in INTERVALS.items()
+             if (last - first) * 3600 // seconds + 1 <= self.config["max_points"]),
+            "week"
+        )
+        size = INTERVALS[interval] // 3600
+        # Weeks start on Monday; the epoch fell on a Thursday
+        shift = 3 * 24 if interval == "week" else 0
+        origin = (first + shift) // size
+        buckets = np.zeros(((last + shift) // size - origin + 1, 4))
+        for hour, values in self.hours.items():
+            buckets[(hour + shift) // size - origin] += values
+        mentions = buckets[:, 0]
+        sentiment = np.divide(buckets[:, 1], mentions, out=np.zeros(len(mentions)), where=mentions > 0)
+
+        def label(index: int) -> str:
+            stamp = datetime.fromtimestamp(((origin + index) * size - shift) * 3600, timezone.utc)
+            return stamp.strftime("%Y-%m-%dT%H:00Z" if interval == "hour" else "%Y-%m-%d")
+
+        volume = [
+            {"t": label(i), "mentions": int(mentions[i]), "sentiment": round(float(sentiment[i]), 3)}
+            for i in range(len(mentions))
+        ]
+        # Robust z-score: median and median absolute deviation, so the spikes cannot hide themselves
+        median = float(np.median(mentions))
+        spread = 1.4826 * float(np.median(np.abs(mentions - median)))
+        if spread == 0:
+            spread = float(np.mean(np.abs(mentions - median))) or 1.0
+        z = (mentions - median) / spread
+        candidates = np.flatnonzero((z >= self.config["spike_z"]) & (mentions >= self.config["spike_min_mentions"]))
+        spikes = [
+            {**volume[i], "z": round(float(z[i]), 1), "baseline": round(median, 1)}
+            for i in candidates[np.argsort(-z[candidates])][:self.config["max_spikes"]]
+        ]
+        return {
+            "interval": interval,
+            "start": label(0),
+            "end": label(len(mentions) - 1),
+            # The series is cut to the most recent max_points buckets when an interval was forced
+            "volume": volume[-self.config["max_points"]:],
+            "spikes": spikes
+        }
+
+
+def parse_times(field: np.ndarray) -> np.ndarray:
+    """
+    Seconds since the epoch for a NUL-padded (rows, width) byte matrix of timestamps: epoch seconds or
+    milliseconds, or ISO 8601 dates and times. Unparseable values come back as UNDATED.
+    """
+    rows, width = field.shape
+    times = np.full(rows, UNDATED, dtype=np.int64)
+    if not rows:
+        return times
+    lengths = np.count_nonzero(field, axis=1)
+    present = lengths > 0
+    numeric = present & ((field[:, 0] - np.uint8(DIGIT_ZERO)) < 10) & ((field == PERIOD).sum(axis=1) <= 1) & \
+        np.all(((field - np.uint8(DIGIT_ZERO)) < 10) | (field == PERIOD) | (field == 0), axis=1)
+    if numeric.any():
+        values = field[numeric].view(f"S{width}").ravel().astype(np.float64)
+        times[numeric] = np.where(values > 1e11, values / 1000, values).astype(np.int64)
+
+    text = present & ~numeric
+    if text.any():
+        field = field.copy()
+        last = np.maximum(lengths - 1, 0)
+        # numpy reads a trailing Z as UTC but warns about it, so drop it first
+        zulu = text & (field[np.arange(rows), last] == ord("Z"))
+        field[np.flatnonzero(zulu), last[zulu]] = 0
+        # UTC offsets such as +02:00 go through datetime, which applies them
+        offset = text & (lengths > 16) & (field[np.arange(rows), np.maximum(lengths - 3, 0)] == ord(":")) & \
+            np.isin(field[np.arange(rows), np.maximum(lengths - 6, 0)], (ord("+"), ord("-")))
+        plain = np.flatnonzero(text & ~offset)
+        strings = field[plain].view(f"S{width}").ravel()
+        try:
+            parsed = strings.astype("datetime64[s]")
+        except ValueError:
+            parsed = np.array([_parse_time(s) for s in strings], dtype="datetime64[s]")
+        valid = ~np.isnat(parsed)
+        times[plain[valid]] = parsed[valid].astype(np.int64)
+        for row in np.flatnonzero(offset):
+            parsed = _parse_time(field[row].tobytes().rstrip(b"\0"))
+            if not np.isnat(parsed):
+                times[row] = parsed.astype(np.int64)
+    return times
+
+
+def _parse_time(value: bytes) -> np.datetime64:
+    try:
+        stamp = datetime.fromisoformat(value.decode("ascii").strip())
+    except (UnicodeDecodeError, ValueError):
+        return np.datetime64("NaT", "s")
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(stamp, "s")
+
+
+async def summarize_mentions(chunks: AsyncIterator[bytes], **options) -> Dict[str, Any]:
+    """
+    Aggregate a streamed upload. Parsing runs in a worker thread one piece at a time, so the event
+    loop keeps serving other requests while a large export is processed.
+    """
+    aggregator = MentionAggregator(**options)
+    async for chunk in chunks:
+        if aggregator.feed(chunk):
+            await asyncio.to_thread(aggregator.process)
+    summary = await asyncio.to_thread(aggregator.finish)
+    note_timing("mention_aggregation_ms", round(aggregator.seconds * 1000, 1))
+    return summary
+
+
+def render_summary(summary: Dict[str, Any]) -> str:
+    """The summary as compact text for the analytics agent's prompt"""
+    sentiment = summary["sentiment"]
+    lines = [
+        f"Mentions: {summary['mentions']:,} ({summary['undated']:,} undated, {summary['skipped_rows']:,} unreadable rows)",
+        f"Sentiment (-1 to 1): mean {sentiment['mean']:+.2f}; positive {sentiment['positive']:.1%}, "
+        f"negative {sentiment['negative']:.1%}, neutral {sentiment['neutral']:.1%}"
+    ]
+    if summary["volume"]:
+        lines.append(f"Period: {summary['start']} to {summary['end']}")
+        lines.append(f"Mentions and mean sentiment per {summary['interval']}:")
+        lines.extend(f"{p['t']} {p['mentions']} {p['sentiment']:+.2f}" for p in summary["volume"])
+    if summary["spikes"]:
+        lines.append("Spikes (robust z-score against the median):")
+        lines.extend(
+            f"{s['t']} {s['mentions']} mentions, z {s['z']}, baseline {s['baseline']:g}, sentiment {s['sentiment']:+.2f}"
+            for s in summary["spikes"]
+        )
+    for key, title in (("top_terms", "Top terms"), ("negative_terms", "Top terms in negative mentions")):
+        if summary[key]:
+            lines.append(f"{title}: " + ", ".join(f"{t['term']} {t['count']}" for t in summary[key]))
+    return "\n".join(lines)
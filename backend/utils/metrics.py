@@ -0,0 +1,283 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RATE_BUCKETS = (1, 5, 10, 20, 35, 50, 75, 100, 150, 250)
+DEPTH_BUCKETS = (1, 2, 3, 4, 5, 6)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+                    for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                # One count per bucket, then sum and total count
+                series = self.series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, series in self.series.items():
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "pr_agent_http_requests_total", "HTTP requests handled", ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "pr_agent_http_request_duration_seconds", "HTTP request latency until the last body byte", ("method", "route")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "pr_agent_http_requests_in_flight", "HTTP requests currently being handled"))
+ATTEMPTS = REGISTRY.register(Counter(
+    "pr_agent_provider_attempts_total", "Provider attempts by outcome", ("provider", "model", "outcome")))
+ATTEMPT_LATENCY = REGISTRY.register(Histogram(
+    "pr_agent_provider_attempt_duration_seconds", "Duration of each provider attempt", ("provider", "model")))
+TIME_TO_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "pr_agent_time_to_first_token_seconds", "Time from request to first streamed token", ("provider", "model")))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "pr_agent_output_tokens_per_second", "Completion tokens per second of generation", ("provider", "model"),
+    buckets=RATE_BUCKETS))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "pr_agent_queue_wait_seconds", "Time spent waiting for a provider concurrency slot", ("provider",),
+    buckets=FAST_BUCKETS))
+FAILOVER_DEPTH = REGISTRY.register(Histogram(
+    "pr_agent_failover_depth", "Attempt number that produced the answer", (), buckets=DEPTH_BUCKETS))
+WINNERS = REGISTRY.register(Counter(
+    "pr_agent_responses_total", "Answers by the provider and model that produced them", ("provider", "model")))
+ROUTING = REGISTRY.register(Counter(
+    "pr_agent_routing_decisions_total", "Models chosen by the query router and the tier required",
+    ("model", "tier")))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "pr_agent_cache_lookups_total", "Response cache lookups by outcome", ("outcome",)))
+ERRORS = REGISTRY.register(Counter(
+    "pr_agent_errors_total", "Provider and request errors by class", ("provider", "error_class")))
+CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "pr_agent_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("kind", "name")))
+COALESCED = REGISTRY.register(Gauge(
+    "pr_agent_coalescing", "Single-flight leader and follower counts", ("kind",)))
+CACHE_STATS = REGISTRY.register(Gauge(
+    "pr_agent_cache", "Response cache counters and sizes", ("stat",)))
+
+# Exception class names from the OpenAI and Anthropic SDKs, mapped to coarse error classes
+ERROR_CLASSES = {
+    "APITimeoutError": "timeout",
+    "TimeoutError": "timeout",
+    "ReadTimeout": "timeout",
+    "ConnectTimeout": "timeout",
+    "RateLimitError": "rate_limited",
+    "RateLimited": "rate_limited",
+    "CircuitOpen": "circuit_open",
+    "AuthenticationError": "auth",
+    "PermissionDeniedError": "auth",
+    "APIConnectionError": "connection",
+    "ConnectError": "connection",
+    "BadRequestError": "bad_request",
+    "UnprocessableEntityError": "bad_request",
+    "NotFoundError": "not_found",
+    "InternalServerError": "server_error",
+    "OverloadedError": "server_error",
+}
+
+
+def classify_error(error: BaseException) -> str:
+    for cls in type(error).__mro__:
+        if cls.__name__ in ERROR_CLASSES:
+            return ERROR_CLASSES[cls.__name__]
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if isinstance(status, int) and status >= 500:
+        return "server_error"
+    return "other"
+
+
+# Per-request timing record, filled in by the failover layer and written by the middleware
+request_timing: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_timing", default=None)
+
+
+def note_timing(key: str, value: Any):
+    timing = request_timing.get()
+    if timing is not None:
+        timing[key] = value
+
+
+def note_attempt(provider: str, model: str, outcome: str, seconds: float):
+    timing = request_timing.get()
+    if timing is not None:
+        timing.setdefault("attempts", []).append(
+            {"provider": provider, "model": model, "outcome": outcome, "ms": round(seconds * 1000, 1)}
+        )
+
+
+def _timing_logger() -> Optional[logging.Logger]:
+    """PR_AGENT_TIMING_LOG=1 logs one JSON line per request to stderr; any other value is a file path"""
+    target = os.getenv("PR_AGENT_TIMING_LOG")
+    if not target:
+        return None
+    logger = logging.getLogger("pr_agent.timing")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.StreamHandler() if target == "1" else logging.FileHandler(target)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every request until its last body byte, so streamed responses count in full"""
+
+    def __init__(self, app):
+        self.app = app
+        self.timing_log = _timing_logger()
+
+    def _route(self, scope) -> str:
+        app = scope.get("app")
+        for route in getattr(app, "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        method = scope["method"]
+        started = time.perf_counter()
+        timing = {"method": method, "route": route}
+        token = request_timing.set(timing)
+        status = {"code": 500}
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                timing["headers_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUESTS.inc(method=method, route=route, status=status["code"])
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
+            request_timing.reset(token)
+            if self.timing_log is not None and route != "/metrics":
+                timing.update(status=status["code"], total_ms=round(elapsed * 1000, 1), ts=time.time())
+                self.timing_log.info(json.dumps(timing))
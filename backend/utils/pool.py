@@ -0,0 +1,108 @@
+import asyncio
+import importlib
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from ..config import PROVIDER_POOL_CONFIG
+from .metrics import QUEUE_WAIT
+
+
+def _http_library(sdk: str):
+    """The httpx package an SDK is built on; newer Anthropic SDKs ship their own httpx fork"""
+    module = importlib.import_module(sdk)
+    client_class = getattr(module, "DefaultAsyncHttpxClient", None)
+    for base in getattr(client_class, "__mro__", ()):
+        if base.__name__ == "AsyncClient":
+            return importlib.import_module(base.__module__.split(".")[0])
+    return importlib.import_module("httpx")
+
+
+class ProviderPool:
+    """Keep-alive HTTP connection pools and concurrency caps, one per provider.
+
+    httpx clients and asyncio semaphores belong to the event loop that created
+    them, so everything is kept per running loop. The FastAPI app only ever has
+    one loop per worker; the Streamlit app gets a fresh one from asyncio.run().
+    """
+
+    def __init__(self, config: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.config = config or PROVIDER_POOL_CONFIG
+        self._loops = weakref.WeakKeyDictionary()
+
+    def _state(self) -> Dict[str, Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = {"http": {}, "clients": {}, "semaphores": {}}
+            self._loops[loop] = state
+        return state
+
+    def settings(self, provider: str) -> Dict[str, Any]:
+        if provider not in self.config:
+            raise ValueError(f"Unknown provider: {provider}")
+        return self.config[provider]
+
+    def timeout(self, provider: str, sdk: str):
+        settings = self.settings(provider)
+        library = _http_library(sdk)
+        return library.Timeout(settings["timeout"], connect=settings["connect_timeout"])
+
+    def http_client(self, provider: str, sdk: str):
+        state = self._state()
+        if provider not in state["http"]:
+            settings = self.settings(provider)
+            library = _http_library(sdk)
+            # The SDK's own default client keeps its redirect and header defaults
+            client_class = getattr(importlib.import_module(sdk), "DefaultAsyncHttpxClient", library.AsyncClient)
+            state["http"][provider] = client_class(
+                limits=library.Limits(
+                    max_connections=settings["max_connections"],
+                    max_keepalive_connections=settings["max_keepalive_connections"],
+                    keepalive_expiry=settings["keepalive_expiry"]
+                ),
+                timeout=self.timeout(provider, sdk)
+            )
+        return state["http"][provider]
+
+    def semaphore(self, provider: str) -> asyncio.Semaphore:
+        state = self._state()
+        if provider not in state["semaphores"]:
+            state["semaphores"][provider] = asyncio.Semaphore(self.settings(provider)["max_concurrency"])
+        return state["semaphores"][provider]
+
+    @asynccontextmanager
+    async def slot(self, provider: str):
+        """Hold one of the provider's concurrency slots, recording how long it took to get one"""
+        semaphore = self.semaphore(provider)
+        started = time.perf_counter()
+        async with semaphore:
+            QUEUE_WAIT.observe(time.perf_counter() - started, provider=provider)
+            yield
+
+    def client(self, provider: str, sdk: str, build: Callable[..., Any]):
+        """
+        Return the async SDK client for a provider, built on the shared pool the first time.
+        `sdk` names the SDK module, imported only now; `build` gets http_client, timeout and max_retries.
+        """
+        state = self._state()
+        if provider not in state["clients"]:
+            state["clients"][provider] = build(
+                http_client=self.http_client(provider, sdk),
+                timeout=self.timeout(provider, sdk),
+                max_retries=self.settings(provider)["max_retries"]
+            )
+        return state["clients"][provider]
+
+    async def aclose(self):
+        """Close the connection pools owned by the current event loop"""
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        for http_client in state["http"].values():
+            await http_client.aclose()
+
+
+# Shared by every provider client
+provider_pool = ProviderPool()
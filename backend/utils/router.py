@@ -0,0 +1,108 @@
+import json
+import math
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from ..config import ROUTER_CONFIG, get_model_config
+from .context import estimate_tokens
+from .health import HealthTracker
+from .metrics import ROUTING
+
+
+class QueryClassifier:
+    """
+    Cheap CPU estimate of how demanding a query is, from 0 (trivial rewrite) to 1 (hard).
+    A logistic model over length, structure, keyword and agent features, with weights
+    from ROUTER_CONFIG so they can be refitted offline from the routing log.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or ROUTER_CONFIG
+        self.complex_pattern = self._stems(self.config["complex_keywords"])
+        self.simple_pattern = self._stems(self.config["simple_keywords"])
+
+    @staticmethod
+    def _stems(stems: List[str]):
+        return re.compile(r"\b(?:" + "|".join(re.escape(s) for s in stems) + r")\w*", re.IGNORECASE)
+
+    def features(self, query: str, agent_type: Optional[str]) -> Dict[str, float]:
+        return {
+            "length": min(1.0, estimate_tokens(query) / self.config["long_query_tokens"]),
+            "complex_keywords": float(len(self.complex_pattern.findall(query))),
+            "simple_keywords": float(len(self.simple_pattern.findall(query))),
+            "questions": float(min(query.count("?"), 3)),
+            "lines": min(1.0, query.count("\n") / 10),
+            "agent": self.config["agent_bias"].get(agent_type, 0.0)
+        }
+
+    def complexity(self, features: Dict[str, float]) -> float:
+        weights = self.config["weights"]
+        z = weights["bias"] + features["agent"] + sum(
+            weights[name] * value for name, value in features.items() if name in weights
+        )
+        return 1 / (1 + math.exp(-z))
+
+
+class ModelRouter:
+    """
+    Picks a model per query: the classifier sets the quality tier the answer needs (never below
+    the agent's minimum), and among the healthy models of that tier or better, the one with the
+    lowest live expected latency wins. Ties go to the lower tier. Each decision is appended to
+    a JSONL log together with its outcome.
+    """
+
+    def __init__(self, health: HealthTracker, config: Optional[Dict[str, Any]] = None):
+        self.health = health
+        self.config = config or ROUTER_CONFIG
+        self.classifier = QueryClassifier(self.config)
+        self._log_lock = threading.Lock()
+        self._log = open(self.config["log_path"], "a", buffering=1) if self.config.get("log_path") else None
+
+    def required_tier(self, complexity: float, agent_type: Optional[str]) -> int:
+        tier = 1
+        for threshold, threshold_tier in self.config["complexity_tiers"]:
+            if complexity >= threshold:
+                tier = max(tier, threshold_tier)
+        return max(tier, self.config["agent_min_tier"].get(agent_type, 1))
+
+    def route(self, query: str, agent_type: Optional[str], requested_model: str) -> Dict[str, Any]:
+        features = self.classifier.features(query, agent_type)
+        complexity = self.classifier.complexity(features)
+        tier = self.required_tier(complexity, agent_type)
+        now = time.monotonic()
+
+        candidates = []
+        for name, model_tier in self.config["model_tiers"].items():
+            model, provider = self.health.model(name), self.health.provider(get_model_config(name)["provider"])
+            if model_tier < tier or not (provider.available(now) and model.available(now)):
+                continue
+            candidates.append({
+                "model": name,
+                "tier": model_tier,
+                # EWMA latencies inflated by the recent error rates, summed over model and provider
+                # the same way failover ranking does
+                "expected_latency": round(model.score(now) + provider.score(now), 3)
+            })
+        candidates.sort(key=lambda c: (c["expected_latency"], c["tier"]))
+        model = candidates[0]["model"] if candidates else requested_model
+
+        ROUTING.inc(model=model, tier=str(tier))
+        return {
+            "model": model,
+            "requested": requested_model,
+            "agent_type": agent_type,
+            "complexity": round(complexity, 3),
+            "tier": tier,
+            "features": {k: round(v, 3) for k, v in features.items()},
+            "candidates": candidates
+        }
+
+    def log(self, decision: Dict[str, Any], outcome: Dict[str, Any]):
+        """Append a decision and how it went (answering model, latency, status) to the routing log"""
+        if self._log is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), **decision, "outcome": outcome})
+        with self._log_lock:
+            self._log.write(line + "\n")
@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import SCHEDULER_CONFIG
+from .context import message_tokens
+from .metrics import Histogram, REGISTRY, FAST_BUCKETS
+
+# Seconds between checks while a queue is held back for a higher-priority request on another model
+OUTRANKED_POLL = 0.05
+
+SCHEDULER_WAIT = REGISTRY.register(Histogram(
+    "pr_agent_scheduler_wait_seconds", "Time queued for provider rate-limit capacity", ("provider",),
+    buckets=FAST_BUCKETS))
+
+
+class RateLimited(Exception):
+    """The request cannot get provider capacity before its deadline"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Rate limit for {provider} reached; retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available; requests larger than the bucket wait for a full one"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        wait = max(0.0, (amount - self.tokens) / self.rate) if self.rate > 0 else math.inf
+        return max(wait, self.blocked_until - now)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float, now: float):
+        """Correct an earlier take(); a negative amount takes more"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def block(self, seconds: float, now: float):
+        """Upstream said 429: hold everything back until its Retry-After has passed"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Waiter:
+    def __init__(self, model: str, tokens: int, future: asyncio.Future):
+        self.model = model
+        self.tokens = tokens
+        self.future = future
+
+
+class RateLimitScheduler:
+    """
+    Token buckets for requests and estimated tokens per provider and per model, in front of the
+    provider calls. Requests that can't go straight away queue per model, by priority class and then
+    arrival order, so a model held back by its own limit does not hold up other models on the same
+    provider. Provider capacity still goes by priority across those queues: a request waiting only
+    for the provider is never overtaken by a lower-priority one for another model. A request whose
+    deadline can't be met is refused with RateLimited, so the API can answer 429 with Retry-After
+    instead of hammering a provider that is already throttling us.
+
+    Each request reserves its prompt plus the completion cap it sends; reconcile() swaps the
+    reservation for what the provider reports it used once the call is over.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, workers: Optional[int] = None):
+        self.config = config or SCHEDULER_CONFIG
+        # Each worker process gets its share of the account-wide limits
+        self.workers = max(1, workers or self.config.get("workers", 1))
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._queues: Dict[str, List[Tuple[int, int, _Waiter]]] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._sequence = itertools.count()
+        self.stats = {"granted": 0, "queued": 0, "rejected": 0, "upstream_429": 0}
+
+    def priority_for(self, agent_type: Optional[str]) -> int:
+        return self.config["priorities"].get(agent_type, self.config["default_priority"])
+
+    def estimate_tokens(self, messages: List[Dict[str, str]], completion_tokens: Optional[int] = None) -> int:
+        """Prompt estimate plus the completion cap sent with the request, or a typical completion if none is sent"""
+        if completion_tokens is None:
+            completion_tokens = self.config["completion_estimate"]
+        return sum(message_tokens(m) for m in messages) + completion_tokens
+
+    def _bucket_pair(self, key: str, limits: Optional[Dict[str, float]]):
+        if limits is None:
+            return None
+        if key not in self._buckets:
+            self._buckets[key] = (
+                TokenBucket(limits["rpm"] / self.workers),
+                TokenBucket(limits["tpm"] / self.workers)
+            )
+        return self._buckets[key]
+
+    def _pairs(self, provider: str, model: str):
+        pairs = [
+            self._bucket_pair(provider, self.config["provider_limits"].get(provider)),
+            self._bucket_pair(f"{provider}/{model}", self.config["model_limits"].get(model))
+        ]
+        return [p for p in pairs if p is not None]
+
+    def _wait_time(self, provider: str, model: str, requests: float, tokens: float, now: float) -> float:
+        return max(
+            [max(r.wait_time(requests, now), t.wait_time(tokens, now)) for r, t in self._pairs(provider, model)],
+            default=0.0
+        )
+
+    def _take(self, provider: str, model: str, tokens: float, now: float):
+        for requests_bucket, tokens_bucket in self._pairs(provider, model):
+            requests_bucket.take(1, now)
+            tokens_bucket.take(tokens, now)
+
+    def _refund(self, provider: str, model: str, tokens: float):
+        """Undo a _take() for a request that was granted but never sent"""
+        now = time.monotonic()
+        for requests_bucket, tokens_bucket in self._pairs(provider, model):
+            requests_bucket.give_back(1, now)
+            tokens_bucket.give_back(tokens, now)
+        self._wake(provider)
+
+    def _wake(self, provider: str, skip: Optional[str] = None):
+        """Let the provider's queues look at its capacity again"""
+        for key, wakeup in self._wakeups.items():
+            if key.startswith(f"{provider}/") and key != skip:
+                wakeup.set()
+
+    def _provider_ahead(self, provider: str, model: str, rank: Tuple[float, float], now: float) -> List[_Waiter]:
+        """
+        Waiters for other models on this provider that go before `rank` (priority, arrival) and are
+        held back only by the provider's buckets; a model waiting on its own limit does not count
+        """
+        ahead = []
+        for key, queue in self._queues.items():
+            if key == f"{provider}/{model}" or not key.startswith(f"{provider}/"):
+                continue
+            for priority, sequence, waiter in queue:
+                if (priority, sequence) < rank and not waiter.future.done() and self._model_ready(
+                        provider, waiter.model, waiter.tokens, now):
+                    ahead.append(waiter)
+        return ahead
+
+    def _model_ready(self, provider: str, model: str, tokens: float, now: float) -> bool:
+        pair = self._bucket_pair(f"{provider}/{model}", self.config["model_limits"].get(model))
+        return pair is None or max(pair[0].wait_time(1, now), pair[1].wait_time(tokens, now)) <= 0
+
+    async def acquire(self, provider: str, model: str, tokens: int, priority: int,
+                      deadline: Optional[float] = None):
+        """Wait for capacity on provider/model, or raise RateLimited if it won't come before the deadline"""
+        if not self.config["enabled"]:
+            return
+        now = time.monotonic()
+        deadline = deadline if deadline is not None else now + self.config["max_queue_wait"]
+        key = f"{provider}/{model}"
+        queue = self._queues.setdefault(key, [])
+
+        # Everything queued at the same or a higher priority goes first, on this model and on the provider
+        ahead = [w for p, _, w in queue if p <= priority and not w.future.done()] + \
+            self._provider_ahead(provider, model, (priority, math.inf), now)
+        if not ahead and not queue and self._wait_time(provider, model, 1, tokens, now) <= 0:
+            self._take(provider, model, tokens, now)
+            self.stats["granted"] += 1
+            SCHEDULER_WAIT.observe(0.0, provider=provider)
+            return
+
+        expected = self._wait_time(
+            provider, model, len(ahead) + 1, sum(w.tokens for w in ahead) + tokens, now
+        )
+        if now + expected > deadline:
+            self.stats["rejected"] += 1
+            raise RateLimited(provider, expected)
+
+        waiter = _Waiter(model, tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(queue, (priority, next(self._sequence), waiter))
+        self.stats["queued"] += 1
+        self._ensure_dispatcher(key, provider, model)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(0.0, deadline - now))
+        except asyncio.TimeoutError:
+            # cancel() fails if the dispatcher granted the capacity just as the wait timed out
+            if waiter.future.cancel():
+                self.stats["rejected"] += 1
+                # Queues held back for this request can go now
+                self._wake(provider)
+                raise RateLimited(provider, self._wait_time(provider, model, 1, tokens, time.monotonic()))
+        except asyncio.CancelledError:
+            if not waiter.future.cancel():
+                # Granted just as the caller went away: return the request and its tokens
+                self._refund(provider, model, tokens)
+            else:
+                self._wake(provider)
+            raise
+        self.stats["granted"] += 1
+        SCHEDULER_WAIT.observe(time.monotonic() - now, provider=provider)
+
+    def _ensure_dispatcher(self, key: str, provider: str, model: str):
+        task = self._dispatchers.get(key)
+        if task is None or task.done():
+            self._dispatchers[key] = asyncio.create_task(self._dispatch(key, provider, model))
+
+    async def _dispatch(self, key: str, provider: str, model: str):
+        queue = self._queues[key]
+        wakeup = self._wakeups.setdefault(key, asyncio.Event())
+        while queue:
+            priority, sequence, waiter = queue[0]
+            if waiter.future.done():
+                heapq.heappop(queue)
+                continue
+            now = time.monotonic()
+            wait = self._wait_time(provider, model, 1, waiter.tokens, now)
+            if wait <= 0 and self._provider_ahead(provider, model, (priority, sequence), now):
+                # A higher-priority request for another model gets the provider's capacity first
+                wait = OUTRANKED_POLL
+            elif wait <= 0:
+                heapq.heappop(queue)
+                self._take(provider, model, waiter.tokens, now)
+                waiter.future.set_result(None)
+                self._wake(provider, skip=key)
+                continue
+            # Sleep until the capacity is due, or until reconcile() hands some back
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def reconcile(self, provider: str, model: str, reserved: int, used: int):
+        """Swap a granted reservation for the tokens the request actually used"""
+        if not self.config["enabled"] or used == reserved:
+            return
+        now = time.monotonic()
+        for _, tokens_bucket in self._pairs(provider, model):
+            tokens_bucket.give_back(reserved - used, now)
+        if used < reserved:
+            # Queues waiting on this provider may be able to go now
+            self._wake(provider)
+
+    def penalize(self, provider: str, model: str, retry_after: float):
+        """Record an upstream 429 so queued and new requests hold off for Retry-After"""
+        now = time.monotonic()
+        self.stats["upstream_429"] += 1
+        for requests_bucket, tokens_bucket in self._pairs(provider, model):
+            requests_bucket.block(retry_after, now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        buckets = {}
+        for key, (requests_bucket, tokens_bucket) in self._buckets.items():
+            requests_bucket._refill(now)
+            tokens_bucket._refill(now)
+            buckets[key] = {
+                "requests_available": round(requests_bucket.tokens, 1),
+                "tokens_available": round(tokens_bucket.tokens),
+                "blocked_for": round(max(0.0, requests_bucket.blocked_until - now), 1)
+            }
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "queued_now": {k: sum(1 for _, _, w in q if not w.future.done()) for k, q in self._queues.items()},
+            "buckets": buckets
+        }
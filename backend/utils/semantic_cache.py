@@ -0,0 +1,200 @@
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..config import SEMANTIC_CACHE_CONFIG
+from .embeddings import HashedNgramVectorizer
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9][\w'’&.-]*")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+NEGATIONS = {"not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without", "cannot"}
+# Capitalized only because they open a sentence; any other capitalized word counts as a name
+# Memory-mapped matrices are named <agent>-<model>-<pid>.f32
+MMAP_FILE = re.compile(r"-(\d+)\.f32$")
+SENTENCE_STARTERS = {
+    "a", "an", "the", "our", "we", "i", "my", "you", "your", "it", "its", "this", "that", "these", "those",
+    "please", "write", "draft", "create", "prepare", "give", "help", "suggest", "make", "list", "explain",
+    "how", "what", "why", "when", "where", "which", "who", "should", "can", "could", "would", "will",
+    "is", "are", "do", "does", "did", "in", "on", "for", "after", "before", "if", "there", "they"
+}
+
+
+def query_facts(query: str) -> Tuple[Tuple[str, ...], ...]:
+    """
+    The numbers, names and negations in a query, in order. Hashed n-grams barely move when one of
+    these changes ("CEO" and "CFO", "recall" and "will not recall"), so a semantic hit needs them to match.
+    """
+    names = []
+    negations = []
+    sentence_start = True
+    end = 0
+    for match in WORD_PATTERN.finditer(query):
+        if any(c in ".!?:;\n" for c in query[end:match.start()]):
+            sentence_start = True
+        end = match.end()
+        word = match.group()
+        lower = re.sub(r"['’]s$", "", word.rstrip(".").lower())
+        if lower in NEGATIONS or lower.endswith(("n't", "n’t")):
+            negations.append("not")
+        starter = sentence_start and lower in SENTENCE_STARTERS and word[1:].islower()
+        if any(c.isupper() for c in word) and not starter:
+            names.append(lower)
+        sentence_start = word.endswith(".")
+    return tuple(NUMBER_PATTERN.findall(query)), tuple(names), tuple(negations)
+
+
+class SemanticIndex:
+    """
+    Fixed-capacity matrix of unit vectors with one payload per row. Search is a
+    single matrix-vector product; inserts reuse free rows and evict the least
+    recently used row once the matrix is full. Each row also has a guard, and
+    search only considers rows whose guard equals the query's.
+    """
+
+    def __init__(self, dim: int, capacity: int, path: Optional[str] = None):
+        self.dim = dim
+        self.capacity = capacity
+        self.path = path
+        if path:
+            # Scratch space only: payloads live in memory, so rows start out invalid on every start
+            self.vectors = np.memmap(path, dtype=np.float32, mode="w+", shape=(capacity, dim))
+        else:
+            self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.guards = np.zeros(capacity, dtype=np.int64)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.payloads = [None] * capacity
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return int(self.valid.sum())
+
+    def search(self, vector: np.ndarray, threshold: float, guard: int = 0) -> Optional[Tuple[Dict[str, Any], float]]:
+        now = time.time()
+        expired = self.valid & (self.expires_at <= now)
+        if expired.any():
+            self._remove(np.flatnonzero(expired))
+        if not self.valid.any():
+            return None
+
+        scores = self.vectors @ vector
+        scores[~self.valid | (self.guards != guard)] = -1.0
+        slot = int(np.argmax(scores))
+        score = float(scores[slot])
+        if score < threshold:
+            return None
+        self.last_used[slot] = now
+        return self.payloads[slot], score
+
+    def insert(self, vector: np.ndarray, payload: Dict[str, Any], ttl: float, guard: int = 0):
+        free = np.flatnonzero(~self.valid)
+        if free.size:
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.evictions += 1
+        now = time.time()
+        self.vectors[slot] = vector
+        self.valid[slot] = True
+        self.guards[slot] = guard
+        self.expires_at[slot] = now + ttl
+        self.last_used[slot] = now
+        self.payloads[slot] = payload
+
+    def _remove(self, slots: np.ndarray):
+        self.valid[slots] = False
+        for slot in slots:
+            self.payloads[slot] = None
+
+    def close(self):
+        """Deletes the memory-mapped file, if any; the mapping itself goes away with the array"""
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SemanticCache:
+    """Per agent and model semantic indexes for answering paraphrased queries from earlier answers"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or SEMANTIC_CACHE_CONFIG
+        self.vectorizer = HashedNgramVectorizer(dim=self.config["dim"])
+        self.indexes: Dict[Tuple[str, str], SemanticIndex] = {}
+        self.stats = {"hits": 0, "misses": 0, "inserts": 0}
+        if self.config.get("mmap_dir"):
+            self._remove_stale_files(self.config["mmap_dir"])
+
+    @staticmethod
+    def _remove_stale_files(directory: str):
+        """Deletes matrices left behind by workers that exited without closing the cache"""
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            match = MMAP_FILE.search(name)
+            if match is None:
+                continue
+            try:
+                os.kill(int(match.group(1)), 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+            except PermissionError:
+                # Owned by a live process of another user
+                pass
+
+    def close(self):
+        """Drops every index and deletes this worker's memory-mapped files"""
+        for index in self.indexes.values():
+            index.close()
+        self.indexes.clear()
+
+    def enabled_for(self, agent_type: str) -> bool:
+        return self.config["enabled"] and agent_type in self.config["agent_thresholds"]
+
+    def _index(self, agent_type: str, model: str) -> SemanticIndex:
+        key = (agent_type, model)
+        if key not in self.indexes:
+            path = None
+            if self.config.get("mmap_dir"):
+                os.makedirs(self.config["mmap_dir"], exist_ok=True)
+                safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+                path = os.path.join(self.config["mmap_dir"], f"{agent_type}-{safe_model}-{os.getpid()}.f32")
+            self.indexes[key] = SemanticIndex(self.config["dim"], self.config["capacity"], path)
+        return self.indexes[key]
+
+    def lookup(self, agent_type: str, model: str, query: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled_for(agent_type):
+            return None
+        found = self._index(agent_type, model).search(
+            self.vectorizer.transform(query), self.config["agent_thresholds"][agent_type], hash(query_facts(query))
+        )
+        if found is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        payload, score = found
+        return {**payload, "similarity": round(score, 4)}
+
+    def add(self, agent_type: str, model: str, query: str, payload: Dict[str, Any], ttl: float):
+        if not self.enabled_for(agent_type) or ttl <= 0:
+            return
+        self._index(agent_type, model).insert(self.vectorizer.transform(query), payload, ttl, hash(query_facts(query)))
+        self.stats["inserts"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "evictions": sum(index.evictions for index in self.indexes.values()),
+            "indexes": {
+                f"{agent}/{model}": {"entries": len(index), "capacity": index.capacity}
+                for (agent, model), index in self.indexes.items()
+            }
+        }
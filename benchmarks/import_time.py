@@ -0,0 +1,112 @@
+"""
+Cold-start benchmark for the backend.
+
+Imports a module (backend.main by default) in fresh interpreters and reports the wall time,
+peak RSS, which provider SDKs got loaded, and the slowest imports from `python -X importtime`:
+
+    python benchmarks/import_time.py --runs 10 --max-ms 1500
+
+Exits non-zero when the median import time exceeds --max-ms or an SDK listed in
+--forbid is imported eagerly.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "loaded": [m for m in {watch!r} if m in sys.modules]
+}}))
+"""
+
+
+def run_once(module, watch):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, watch=watch)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(module, top):
+    """Top-level packages by cumulative import time, from one `-X importtime` run"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            cumulative_us = int(cumulative.split(":")[-1])
+        except ValueError:
+            continue
+        # Nesting adds two spaces per level; keep direct children of the root import only,
+        # so nested modules are not counted twice
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            totals[name.strip()] = cumulative_us / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import time")
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--watch", nargs="*", default=["openai", "anthropic", "httpx", "numpy"],
+                        help="modules to report as loaded or not")
+    parser.add_argument("--forbid", nargs="*", default=["openai", "anthropic"],
+                        help="fail if any of these is imported")
+    parser.add_argument("--max-ms", type=float)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    watch = list(dict.fromkeys(args.watch + args.forbid))
+    runs = [run_once(args.module, watch) for _ in range(args.runs)]
+    times = [r["ms"] for r in runs]
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms": {
+            "median": round(statistics.median(times), 1),
+            "min": round(min(times), 1),
+            "max": round(max(times), 1)
+        },
+        "max_rss_mb": round(statistics.median(r["max_rss_kb"] for r in runs) / 1024, 1),
+        "modules": runs[-1]["modules"],
+        "loaded": runs[-1]["loaded"],
+        "slowest_imports_ms": [[name, round(ms, 1)] for name, ms in slowest_imports(args.module, args.top)]
+    }
+
+    failures = []
+    if args.max_ms is not None and report["import_ms"]["median"] > args.max_ms:
+        failures.append(f"median import {report['import_ms']['median']}ms > {args.max_ms}ms")
+    eager = [m for m in args.forbid if any(m in r["loaded"] for r in runs)]
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    report["failed_thresholds"] = failures
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Load test for /api/pr-agent.
+
+Drives the backend at a fixed concurrency and reports throughput, latency percentiles,
+errors and which providers answered. With --spawn it starts the mock provider and a
+backend pointed at it, so it costs nothing and can run in CI:
+
+    python benchmarks/load_test.py --spawn --requests 500 --concurrency 50 --max-p95 2.0
+
+Exits non-zero when a --max-* / --min-* threshold is missed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def one_request(client, args, results):
+    query = args.query if not args.unique else f"{args.query} [{uuid.uuid4().hex[:8]}]"
+    payload = {"query": query, "agent_type": args.agent, "model": args.model}
+    started = time.perf_counter()
+    result = {"status": None, "ttft": None, "provider": None, "model": None, "requested": args.model}
+    try:
+        if args.stream:
+            async with client.stream("POST", "/api/pr-agent/stream", json=payload) as response:
+                result["status"] = response.status_code
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        data = json.loads(line[5:])
+                        if event == "token" and result["ttft"] is None:
+                            result["ttft"] = time.perf_counter() - started
+                        elif event == "done":
+                            info = data.get("model_info") or {}
+                            result["provider"], result["model"] = info.get("provider"), info.get("name")
+                        elif event == "error":
+                            result["status"] = data.get("error_class", "stream_error")
+        else:
+            response = await client.post("/api/pr-agent", json=payload)
+            result["status"] = response.status_code
+            if response.status_code == 200:
+                info = response.json().get("model_info") or {}
+                result["provider"], result["model"] = info.get("provider"), info.get("name")
+    except httpx.HTTPError as e:
+        result["status"] = type(e).__name__
+    result["latency"] = time.perf_counter() - started
+    results.append(result)
+
+
+async def run_load(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    # Unique queries would still match each other in the semantic cache, so skip the caches outright
+    headers = {"X-Cache-Bypass": "1"} if args.unique else {}
+    results = []
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout, headers=headers) as client:
+        queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await one_request(client, args, results)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    report = {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_s": {f"p{q}": round(percentile(latencies, q), 4) if latencies else None for q in (50, 95, 99)},
+        "errors": dict(Counter(str(r["status"]) for r in results if r["status"] != 200)),
+        "answered_by": dict(Counter(f"{r['provider']}/{r['model']}" for r in ok)),
+        # Answers that did not come from the requested model went through failover
+        "failover_rate": round(sum(1 for r in ok if r["model"] != r["requested"]) / len(ok), 4) if ok else None
+    }
+    if args.stream:
+        report["ttft_s"] = {f"p{q}": round(percentile(ttfts, q), 4) if ttfts else None for q in (50, 95, 99)}
+    return report
+
+
+def check_thresholds(report, args):
+    failures = []
+    p95 = report["latency_s"]["p95"]
+    if args.max_p95 is not None and (p95 is None or p95 > args.max_p95):
+        failures.append(f"p95 latency {p95}s > {args.max_p95}s")
+    if args.min_throughput is not None and report["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']} rps < {args.min_throughput} rps")
+    error_rate = 1 - report["succeeded"] / report["requests"] if report["requests"] else 1
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        failures.append(f"error rate {error_rate:.3f} > {args.max_error_rate}")
+    return failures
+
+
+def wait_until_up(url, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn_stack(args):
+    """Start the mock provider and a backend that talks to it; returns the processes"""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "NVIDIA_BASE_URL": f"{mock_url}/v1",
+        "ANTHROPIC_BASE_URL": mock_url,
+        "NVIDIA_API_KEY": "mock",
+    }
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.mock_provider:app", "--port", str(args.mock_port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(args.backend_port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    wait_until_up(f"{mock_url}/mock/stats")
+    wait_until_up(f"http://127.0.0.1:{args.backend_port}/metrics")
+    if args.mock_config:
+        httpx.post(f"{mock_url}/mock/config", json=json.loads(args.mock_config))
+    args.url = f"http://127.0.0.1:{args.backend_port}"
+    return [backend, mock]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/pr-agent")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--agent", default="media_relations")
+    parser.add_argument("--model", default="gpt-4")
+    parser.add_argument("--query", default="Draft a short press release announcing our new regional office.")
+    parser.add_argument("--stream", action="store_true", help="use /api/pr-agent/stream and report TTFT")
+    parser.add_argument("--no-unique", dest="unique", action="store_false",
+                        help="send identical queries, which exercises the caches and coalescing")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--spawn", action="store_true", help="start the mock provider and a backend first")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--mock-config", help='JSON for the mock, e.g. \'{"error_rate": 0.1}\'')
+    parser.add_argument("--max-p95", type=float)
+    parser.add_argument("--min-throughput", type=float)
+    parser.add_argument("--max-error-rate", type=float)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    processes = spawn_stack(args) if args.spawn else []
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    failures = check_thresholds(report, args)
+    report["failed_thresholds"] = failures
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,12 @@ PR_AGENTS = {
         "placeholder": "What would you like to communicate to the media?",
         "model": "gpt-4-turbo"
     },
+    "social_media": {
+        "title": "Social Media Manager",
+        "description": "Platform-specific social content and audience engagement",
+        "placeholder": "Share your social media content or campaign idea...",
+        "model": "gpt-4"
+    },
     "analytics_expert": {
         "title": "Analytics Expert",
         "description": "Content and sentiment analysis",
@@ -1,11 +1,14 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional
 import json
+import uuid
 
 # PR Agents configuration
 PR_AGENTS = {
     "Media Relations": {
+        "agent_type": "media_relations",
         "model": "gpt-4",
         "instructions": """
         **Media Relations Agent Instructions:**
@@ -15,6 +18,7 @@ PR_AGENTS = {
         """
     },
     "Crisis Comms": {
+        "agent_type": "crisis_manager",
         "model": "gpt-4",
         "instructions": """
         **Crisis Communications Agent Instructions:**
@@ -24,6 +28,7 @@ PR_AGENTS = {
         """
     },
     "Content Strategy": {
+        "agent_type": "content_strategist",
         "model": "gpt-4",
         "instructions": """
         **Content Strategy Agent Instructions:**
@@ -33,6 +38,7 @@ PR_AGENTS = {
         """
     },
     "Social Media": {
+        "agent_type": "social_media",
         "model": "gpt-4",
         "instructions": """
         **Social Media PR Agent Instructions:**
@@ -42,6 +48,7 @@ PR_AGENTS = {
         """
     },
     "Analytics": {
+        "agent_type": "analytics_expert",
         "model": "gpt-4",
         "instructions": """
         **PR Analytics Agent Instructions:**
@@ -52,59 +59,128 @@ PR_AGENTS = {
     }
 }
 
+BACKEND_URL = 'http://localhost:8000'
+# (connect, read) timeouts; the read timeout applies between streamed chunks
+REQUEST_TIMEOUT = (5, 300)
+# Messages drawn per agent on each rerun; older ones stay behind "Show earlier messages"
+VISIBLE_MESSAGES = 20
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One keep-alive connection pool to the backend, shared by every rerun and browser session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def stream_pr_agent(data: dict, result: dict):
+    """Yield response deltas from the backend's SSE endpoint; the final `done` event lands in `result`"""
+    with get_session().post(
+        f'{BACKEND_URL}/api/pr-agent/stream',
+        json=data,
+        headers={'Content-Type': 'application/json', 'Accept': 'text/event-stream'},
+        stream=True,
+        timeout=REQUEST_TIMEOUT
+    ) as response:
+        if response.status_code != 200:
+            raise Exception(f"Server error: {response.text}")
+
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = "message"
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                payload = json.loads(line[len("data:"):])
+                if event == "token":
+                    yield payload["delta"]
+                elif event == "done":
+                    result.update(payload)
+                elif event == "error":
+                    raise Exception(f"Server error: {payload['detail']}")
+
+def conversation_id(agent_type: str) -> str:
+    """The agent's conversation id, kept in the URL so a page refresh can restore it"""
+    if agent_type not in st.query_params:
+        st.query_params[agent_type] = uuid.uuid4().hex
+    return st.query_params[agent_type]
+
+def load_history(conversation: str) -> list:
+    """Turns the backend stored for a conversation; empty if it has none"""
+    try:
+        response = get_session().get(f'{BACKEND_URL}/api/conversations/{conversation}', timeout=REQUEST_TIMEOUT)
+    except requests.exceptions.ConnectionError:
+        return []
+    return response.json()["messages"] if response.status_code == 200 else []
+
+def render_history(agent_name: str, messages: list):
+    """Draw the latest messages of one agent; earlier ones only on request"""
+    hidden = max(0, len(messages) - VISIBLE_MESSAGES)
+    if hidden and st.toggle(f"Show {hidden} earlier messages", key=f"show_all_{agent_name}"):
+        hidden = 0
+    for message in messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
 def main():
     st.title("PR Agent Chat")
     
-    # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    # Separate chat history per agent, filled from the backend the first time an agent is opened
+    if "histories" not in st.session_state:
+        st.session_state.histories = {}
         
-    # Create tabs for each agent
-    agent_tabs = st.tabs(list(PR_AGENTS.keys()))
+    # Only the selected agent is drawn; tabs would redraw every agent's history on each rerun
+    agent_name = st.sidebar.radio("Agent", list(PR_AGENTS.keys()))
+    agent_info = PR_AGENTS[agent_name]
+    conversation = conversation_id(agent_info['agent_type'])
+    if agent_name not in st.session_state.histories:
+        st.session_state.histories[agent_name] = load_history(conversation)
+    history = st.session_state.histories[agent_name]
+    
+    # Instructions section
+    with st.expander("Instructions", expanded=False):
+        st.markdown(agent_info['instructions'])
+    
+    # Display chat history
+    render_history(agent_name, history)
     
-    for tab, (agent_name, agent_info) in zip(agent_tabs, PR_AGENTS.items()):
-        with tab:
-            # Instructions section
-            with st.expander("Instructions", expanded=False):
-                st.markdown(agent_info['instructions'])
-            
-            # Display chat history
-            for message in st.session_state.messages:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
-            
-            # Chat input
-            if user_input := st.chat_input(f"Message {agent_name}..."):
-                with st.spinner('Processing...'):
-                    try:
-                        data = {
-                            "query": user_input,
-                            "agent_type": agent_name,
-                            "model": agent_info['model']
-                        }
-                        
-                        response = requests.post(
-                            'http://localhost:8000/api/pr-agent',
-                            json=data,
-                            headers={'Content-Type': 'application/json'}
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            if result['status'] == 'success':
-                                st.session_state.messages.extend([
-                                    {"role": "user", "content": user_input},
-                                    {"role": "assistant", "content": result['response']}
-                                ])
-                                st.rerun()
-                            else:
-                                st.error(f"Server error: {response.text}")
-                        else:
-                            st.error(f"Server error: {response.text}")
-                    except requests.exceptions.ConnectionError:
-                        st.error("Cannot connect to backend server. Please make sure it's running on port 8000.")
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
+    # Chat input
+    if user_input := st.chat_input(f"Message {agent_name}..."):
+        with st.chat_message("user"):
+            st.markdown(user_input)
+
+        with st.chat_message("assistant"):
+            message_placeholder = st.empty()
+            try:
+                # Only the new message; the backend keeps the conversation
+                data = {
+                    "query": user_input,
+                    "agent_type": agent_info['agent_type'],
+                    "model": agent_info['model'],
+                    "conversation_id": conversation
+                }
+
+                result = {}
+                response_text = ""
+                for delta in stream_pr_agent(data, result):
+                    response_text += delta
+                    message_placeholder.markdown(response_text + "▌")
+                message_placeholder.markdown(response_text)
+
+                if result.get('status') == 'success':
+                    # Already on screen; no rerun needed, the next one draws it from history
+                    history.extend([
+                        {"role": "user", "content": user_input},
+                        {"role": "assistant", "content": response_text}
+                    ])
+                else:
+                    st.warning("The response stream ended early.")
+            except requests.exceptions.ConnectionError:
+                message_placeholder.error("Cannot connect to backend server. Please make sure it's running on port 8000.")
+            except Exception as e:
+                message_placeholder.error(f"An error occurred: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,33 +1,296 @@
+"""
+Production launcher: a supervisor process running several backend workers, plus the Streamlit frontend.
+
+The supervisor binds the listening socket once and forks the workers, which all accept on it.
+Heavy third-party libraries are imported before forking (--preload), so workers start quickly and
+share those pages; the backend itself is imported in each worker, so a reload picks up new code.
+
+    python run_servers.py --workers 4
+
+Signals to the supervisor:
+    SIGHUP           rolling reload: start a new worker, wait until it is healthy, retire an old one
+    SIGTERM, SIGINT  drain: workers stop accepting, finish in-flight requests, then exit
+
+Workers are health-checked on a private unix socket (GET /healthz) and replaced when they crash or
+stop answering. Worker and frontend output goes straight to this process's stdout/stderr.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
 import subprocess
+import sys
+import tempfile
 import time
 
-def main():
-    try:
-        # Start FastAPI backend
-        backend = subprocess.Popen(
-            ["uvicorn", "backend.main:app", "--host", "0.0.0.0", "--port", "8000"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        print("Started FastAPI backend on port 8000")
-        time.sleep(2)  # Give backend time to start
-
-        # Start Streamlit frontend
-        frontend = subprocess.Popen(
-            ["streamlit", "run", "frontend/app.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+import httpx
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Imported once in the supervisor and shared by every forked worker
+PRELOAD_MODULES = ("fastapi", "starlette", "pydantic", "uvicorn", "httpx", "openai", "anthropic", "numpy")
+
+# State shared between workers lives in these files unless the environment already points elsewhere
+SHARED_STATE_DEFAULTS = {
+    "PR_AGENT_CACHE_DB": "data/response_cache.db",
+    "PR_AGENT_CONVERSATION_DB": "data/conversations.db",
+    "PR_AGENT_IMAGE_DIR": "data/images",
+    "PR_AGENT_BATCH_DIR": "data/batch_jobs",
+    "PR_AGENT_BRAND_INDEX_DIR": "data/brand_index",
+}
+
+
+def log(message: str):
+    print(f"[supervisor {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def run_worker(listener: socket.socket, health_path: str, args):
+    """Entry point of a forked worker: serve the app on the shared socket and a private health socket"""
+    import uvicorn
+
+    # SIGHUP means reload, which is the supervisor's job
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    health = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    health.bind(health_path)
+    health.listen(16)
+    config = uvicorn.Config(
+        "backend.main:app",
+        log_level=args.log_level,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    uvicorn.Server(config).run(sockets=[listener, health])
+
+
+class Worker:
+    def __init__(self, process: multiprocessing.Process, health_path: str):
+        self.process = process
+        self.health_path = health_path
+        self.started_at = time.monotonic()
+        self.healthy = False
+        self.failures = 0
+        self.retiring_since = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class Supervisor:
+    def __init__(self, args):
+        self.args = args
+        self.workers = []
+        self.spawned = 0
+        # Fixed: the rate limits are split between exactly this many workers
+        self.target = args.workers
+        self.frontend = None
+        self.running = True
+        self.reload_requested = False
+        self.recent_crashes = []
+        self.run_dir = tempfile.mkdtemp(prefix="pr-agent-")
+        self.context = multiprocessing.get_context("fork")
+        self.listener = self._bind()
+
+    def _bind(self) -> socket.socket:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.args.host, self.args.port))
+        listener.listen(self.args.backlog)
+        listener.set_inheritable(True)
+        return listener
+
+    def spawn(self) -> Worker:
+        self.spawned += 1
+        health_path = os.path.join(self.run_dir, f"worker-{self.spawned}.sock")
+        process = self.context.Process(target=run_worker, args=(self.listener, health_path, self.args), daemon=False)
+        process.start()
+        worker = Worker(process, health_path)
+        self.workers.append(worker)
+        log(f"started worker {worker.pid}")
+        return worker
+
+    def check_health(self, worker: Worker) -> bool:
+        try:
+            with httpx.Client(transport=httpx.HTTPTransport(uds=worker.health_path),
+                              timeout=self.args.health_timeout) as client:
+                ok = client.get("http://worker/healthz").status_code == 200
+        except (httpx.HTTPError, OSError):
+            ok = False
+        if ok:
+            worker.healthy = True
+            worker.failures = 0
+        return ok
+
+    def retire(self, worker: Worker):
+        """Ask a worker to stop accepting and finish its in-flight requests"""
+        if worker.retiring_since is None and worker.process.is_alive():
+            worker.retiring_since = time.monotonic()
+            os.kill(worker.pid, signal.SIGTERM)
+            log(f"draining worker {worker.pid}")
+
+    def reap(self):
+        """Forget exited workers and replace the ones that were not meant to exit"""
+        now = time.monotonic()
+        for worker in list(self.workers):
+            if worker.process.is_alive():
+                # Drains that overrun the graceful timeout are cut short
+                if worker.retiring_since is not None and now - worker.retiring_since > self.args.graceful_timeout + 5:
+                    log(f"worker {worker.pid} did not drain in time, killing it")
+                    os.kill(worker.pid, signal.SIGKILL)
+                continue
+            worker.process.join()
+            self.workers.remove(worker)
+            try:
+                os.unlink(worker.health_path)
+            except OSError:
+                pass
+            if worker.retiring_since is None and self.running:
+                log(f"worker {worker.pid} exited with {worker.process.exitcode}")
+                self.recent_crashes = [t for t in self.recent_crashes if now - t < 60] + [now]
+
+    def active(self):
+        return [w for w in self.workers if w.retiring_since is None]
+
+    def supervise(self):
+        now = time.monotonic()
+        for worker in self.active():
+            if not worker.process.is_alive():
+                continue
+            booting = not worker.healthy and now - worker.started_at < self.args.boot_timeout
+            if self.check_health(worker) or booting:
+                continue
+            worker.failures += 1
+            if not worker.healthy or worker.failures >= self.args.health_failures:
+                log(f"worker {worker.pid} is unresponsive, replacing it")
+                self.retire(worker)
+
+        missing = self.target - len(self.active())
+        if missing > 0:
+            # A worker that keeps crashing on startup should not turn into a fork loop
+            if len(self.recent_crashes) >= self.args.max_crashes_per_minute:
+                log("too many worker crashes in the last minute, waiting before restarting")
+                self.recent_crashes = self.recent_crashes[1:]
+                time.sleep(self.args.health_interval)
+                return
+            for _ in range(missing):
+                self.spawn()
+
+        if self.frontend is not None and self.frontend.poll() is not None and self.running:
+            log(f"frontend exited with {self.frontend.returncode}, restarting it")
+            self.start_frontend()
+
+    def rolling_reload(self):
+        """
+        Replace workers one at a time. Each old worker drains and exits before its replacement starts, so
+        no more than target workers ever hold a share of the rate limits; the listening socket stays open
+        and queues connections meanwhile.
+        """
+        log("reloading workers")
+        for old in list(self.active()):
+            self.retire(old)
+            old.process.join(self.args.graceful_timeout + 5)
+            if old.process.is_alive():
+                log(f"worker {old.pid} did not drain in time, killing it")
+                os.kill(old.pid, signal.SIGKILL)
+                old.process.join()
+            self.reap()
+            new = self.spawn()
+            deadline = time.monotonic() + self.args.boot_timeout
+            while time.monotonic() < deadline and new.process.is_alive() and not self.check_health(new):
+                time.sleep(0.2)
+            if not new.healthy:
+                log(f"replacement worker {new.pid} did not become healthy, stopping the reload")
+                self.retire(new)
+                return
+
+    def start_frontend(self):
+        self.frontend = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", "frontend/app.py", "--server.port", str(self.args.frontend_port)],
+            cwd=ROOT
         )
-        print("Started Streamlit frontend")
+        log(f"started Streamlit frontend on port {self.args.frontend_port}")
+
+    def install_signals(self):
+        def stop(signum, frame):
+            self.running = False
+
+        def reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+
+    def run(self):
+        self.install_signals()
+        log(f"listening on http://{self.args.host}:{self.args.port} with {self.target} workers")
+        if self.args.frontend:
+            self.start_frontend()
+        while self.running:
+            self.reap()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_reload()
+            self.supervise()
+            time.sleep(self.args.health_interval)
+        self.shutdown()
+
+    def shutdown(self):
+        log("draining all workers")
+        for worker in self.workers:
+            self.retire(worker)
+        if self.frontend is not None and self.frontend.poll() is None:
+            self.frontend.terminate()
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.2)
+        for worker in self.workers:
+            os.kill(worker.pid, signal.SIGKILL)
+            worker.process.join()
+        if self.frontend is not None:
+            self.frontend.wait()
+        self.listener.close()
+        log("stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the PR agent backend workers and the Streamlit frontend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("PR_AGENT_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="import libraries in each worker instead of once before forking")
+    parser.add_argument("--no-frontend", dest="frontend", action="store_false")
+    parser.add_argument("--frontend-port", type=int, default=8501)
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="seconds a draining worker gets to finish in-flight requests")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--health-interval", type=float, default=2.0)
+    parser.add_argument("--health-timeout", type=float, default=2.0)
+    parser.add_argument("--health-failures", type=int, default=3,
+                        help="consecutive failed health checks before a worker is replaced")
+    parser.add_argument("--boot-timeout", type=float, default=60.0)
+    parser.add_argument("--max-crashes-per-minute", type=int, default=10)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    # Workers divide the providers' rate limits between them and share caches through these files
+    os.environ["PR_AGENT_WORKERS"] = str(args.workers)
+    for name, default in SHARED_STATE_DEFAULTS.items():
+        os.environ.setdefault(name, os.path.join(ROOT, default))
+    os.makedirs(os.path.join(ROOT, "data"), exist_ok=True)
+
+    if args.preload:
+        for module in PRELOAD_MODULES:
+            __import__(module)
 
-        # Keep both processes running
-        backend.wait()
-        frontend.wait()
+    Supervisor(args).run()
 
-    except KeyboardInterrupt:
-        print("\nShutting down servers...")
-        backend.terminate()
-        frontend.terminate()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,23 @@
+import pytest
+
+from backend.utils.scheduler import RateLimitScheduler
+
+
+@pytest.fixture
+def make_scheduler():
+    """Builds a RateLimitScheduler with generous OpenAI limits; keyword arguments override the config"""
+    def make(**overrides):
+        config = {
+            "enabled": True,
+            "provider_limits": {"openai": {"rpm": 6000, "tpm": 600000}},
+            "model_limits": {},
+            "priorities": {"crisis_manager": 0, "content_strategist": 3},
+            "default_priority": 2,
+            "workers": 1,
+            "max_queue_wait": 2.0,
+            "completion_estimate": 512
+        }
+        config.update(overrides)
+        return RateLimitScheduler(config)
+
+    return make
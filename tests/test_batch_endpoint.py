@@ -0,0 +1,41 @@
+import json
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.utils.failover import AllModelsFailed
+
+
+def post_batch(monkeypatch, outcomes):
+    async def fake_run(request, http_request):
+        outcome = outcomes[request.query]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return {"response": outcome, "status": "success", "model_info": {"name": request.model}}, "MISS"
+
+    monkeypatch.setattr(main, "run_pr_request", fake_run)
+    items = [{"query": query, "agent_type": "media_relations", "model": "gpt-4"} for query in outcomes]
+    response = TestClient(main.app).post("/api/pr-agent/batch", json={"items": items})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return {line["index"]: line for line in lines if "index" in line}, lines[-1]
+
+
+def test_failed_items_get_error_lines(monkeypatch):
+    items, summary = post_batch(monkeypatch, {
+        "ok": "answer",
+        "bad agent": HTTPException(status_code=400, detail="Unknown agent type"),
+        "exhausted": AllModelsFailed(TimeoutError(), attempts=5),
+        "bug": KeyError("model_info")
+    })
+    assert items[0]["status"] == "success" and items[0]["response"] == "answer"
+    assert items[1]["error_class"] == "bad_request"
+    assert items[2]["error_class"] == "timeout"
+    assert items[3]["status"] == "error" and items[3]["error_class"] == "internal"
+    assert summary == {**summary, "summary": True, "total": 4, "succeeded": 1, "failed": 3}
+
+
+def test_empty_batch_is_rejected():
+    response = TestClient(main.app).post("/api/pr-agent/batch", json={"items": []})
+    assert response.status_code == 400
@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.utils.batch_jobs import BatchJobError, BatchJobManager
+
+
+class FakeBatchClient:
+    name = "openai"
+    supports_batch = True
+
+    def __init__(self):
+        self.batches = {}
+        self.cancel_calls = 0
+
+    async def submit_batch(self, path, model_name):
+        with open(path, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f]
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {"items": items, "state": "running"}
+        return batch_id
+
+    async def batch_status(self, batch_id):
+        batch = self.batches[batch_id]
+        done = len(batch["items"]) if batch["state"] == "ended" else 0
+        return {"state": batch["state"], "provider_status": batch["state"], "completed": done, "failed": 0,
+                "error": None}
+
+    async def batch_results(self, batch_id):
+        for item in self.batches[batch_id]["items"]:
+            yield {"custom_id": item["custom_id"], "status": "success",
+                   "response": f"answer to {item['messages'][-1]['content']}", "usage": {}}
+
+    async def cancel_batch(self, batch_id):
+        self.cancel_calls += 1
+        # Providers refuse to cancel a batch that is already cancelling
+        raise RuntimeError("Batch is already cancelling")
+
+
+class FakeRegistry:
+    def __init__(self, client):
+        self.client = client
+
+    def for_model(self, model):
+        return self.client
+
+    def get(self, name):
+        return self.client
+
+
+def system_prompt(agent_type):
+    return f"You are {agent_type}" if agent_type in ("media_relations", "content_strategist") else None
+
+
+@pytest.fixture
+def manager(tmp_path):
+    client = FakeBatchClient()
+    config = {
+        "default_agent": "content_strategist",
+        "default_model": "gpt-4",
+        "max_requests": 100,
+        "max_bytes": 1024 * 1024,
+        "part_size": {"openai": 2},
+        "poll_interval": 3600,
+        "lease_seconds": 300,
+        "retention": 3600,
+        "directory": str(tmp_path)
+    }
+    return BatchJobManager(system_prompt, providers=FakeRegistry(client), config=config), client
+
+
+async def upload(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def lines(*items):
+    return b"".join(json.dumps(item).encode() + b"\n" for item in items)
+
+
+def test_job_runs_to_completion_in_input_order(manager):
+    manager, client = manager
+
+    async def main():
+        body = lines(*({"query": f"q{i}", "custom_id": f"id-{i}"} for i in range(5)))
+        # Lines split across chunks at arbitrary points
+        job = await manager.create(upload(body[:7], body[7:30], body[30:]), "gpt-4", "content_strategist")
+        await manager.aclose()
+        assert job["status"] == "submitting" and len(job["parts"]) == 3
+        await manager.poll_once()
+        for batch in client.batches.values():
+            batch["state"] = "ended"
+        await manager.poll_once()
+        return manager.get(job["id"])
+
+    job = asyncio.run(main())
+    assert job["status"] == "completed" and job["results_ready"]
+    with open(manager.output_path(job["id"]), encoding="utf-8") as f:
+        results = [json.loads(line) for line in f]
+    assert [r["custom_id"] for r in results] == [f"id-{i}" for i in range(5)]
+    assert results[0]["response"] == "answer to q0"
+
+
+def test_refused_cancel_does_not_stall_the_job(manager):
+    manager, client = manager
+
+    async def main():
+        job = await manager.create(upload(lines({"query": "a"}, {"query": "b"})), "gpt-4", "content_strategist")
+        await manager.aclose()
+        await manager.poll_once()
+        manager.cancel(job["id"])
+        await manager.poll_once()
+        await manager.poll_once()
+        assert manager.get(job["id"])["status"] == "cancelling"
+        client.batches["batch-0"]["state"] = "ended"
+        await manager.poll_once()
+        return manager.get(job["id"])
+
+    job = asyncio.run(main())
+    assert client.cancel_calls == 1
+    assert job["status"] == "cancelled" and job["error"] is None
+    assert job["parts"][0]["cancel_requested"] == 1
+
+
+@pytest.mark.parametrize("body, message", [
+    (b'{"query": "a"}\nnot json\n', "Line 2 is not valid JSON"),
+    (b'{"query": ""}\n', "non-empty"),
+    (b'{"query": "a", "agent_type": ["media_relations"]}\n', "agent_type must be a string"),
+    (b'{"query": "a", "agent_type": "pirate"}\n', "unknown agent type pirate"),
+    (b'{"query": "a", "custom_id": "x"}\n{"query": "b", "custom_id": "x"}\n', "duplicate custom_id"),
+    (b'\n\n', "no requests")
+])
+def test_bad_lines_raise_batch_job_error(manager, body, message):
+    manager, _ = manager
+
+    async def main():
+        await manager.create(upload(body), "gpt-4", "content_strategist")
+
+    with pytest.raises(BatchJobError, match=message):
+        asyncio.run(main())
+
+
+def test_long_lines_in_small_chunks(manager):
+    manager, _ = manager
+    query = "x" * 200000
+    body = lines({"query": query}, {"query": "short"})
+
+    async def main():
+        chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+        job = await manager.create(upload(*chunks), "gpt-4", "content_strategist")
+        await manager.aclose()
+        return job
+
+    job = asyncio.run(main())
+    assert job["total"] == 2
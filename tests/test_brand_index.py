@@ -0,0 +1,88 @@
+import os
+import time
+
+from backend.config import BRAND_INDEX_CONFIG
+from backend.utils.brand_index import BrandIndex
+
+
+def make_index(tmp_path, **overrides):
+    source = tmp_path / "brand"
+    source.mkdir(exist_ok=True)
+    config = {**BRAND_INDEX_CONFIG, "source_dir": str(source), "index_dir": str(tmp_path / "index"), **overrides}
+    return BrandIndex(config), source
+
+
+def generations(tmp_path):
+    return sorted(entry.name for entry in os.scandir(tmp_path / "index") if entry.name.startswith("gen-"))
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_search_ranks_matching_document_first(tmp_path):
+    index, source = make_index(tmp_path)
+    (source / "voice.md").write_text("Acme speaks plainly and avoids jargon in every press release.")
+    (source / "product.md").write_text("The Acme rocket skates ship in three colours this spring.")
+    assert index.refresh()
+    hits = index.search("rocket skates colours", 2)
+    assert hits[0]["source"] == "product.md"
+    assert all(hit["score"] >= BRAND_INDEX_CONFIG["min_score"] for hit in hits)
+    assert index.search("rocket", 0) == []
+
+
+def test_refresh_picks_up_changes_only_once(tmp_path):
+    index, source = make_index(tmp_path)
+    (source / "voice.md").write_text("Acme speaks plainly.")
+    assert index.refresh()
+    assert not index.refresh()
+    (source / "recall.md").write_text("The recall covers batch 42 of the rocket skates.")
+    assert index.refresh()
+    assert index.search("recall batch", 1)[0]["source"] == "recall.md"
+    assert index.snapshot()["documents"] == 2
+
+
+def test_old_generations_are_kept_while_recent(tmp_path):
+    index, source = make_index(tmp_path, keep_generations=1)
+    for i in range(3):
+        (source / "voice.md").write_text(f"Acme speaks plainly, revision {i}.")
+        assert index.refresh()
+    # Superseded generations may still be loading in another worker
+    assert len(generations(tmp_path)) == 3
+
+
+def test_unused_generations_beyond_keep_are_removed(tmp_path):
+    index, source = make_index(tmp_path, keep_generations=2)
+    built = []
+    for i in range(4):
+        (source / "voice.md").write_text(f"Acme speaks plainly, revision {i}.")
+        assert index.refresh()
+        built.append(index.snapshot()["generation"])
+    for i, name in enumerate(built):
+        age(tmp_path / "index" / name, (10 - i) * BRAND_INDEX_CONFIG["refresh_interval"])
+    (source / "voice.md").write_text("Acme speaks plainly, final revision.")
+    assert index.refresh()
+    # The new generation, plus the most recently used of the old ones
+    assert generations(tmp_path) == sorted([index.snapshot()["generation"], built[-1]])
+
+
+def test_generation_in_use_is_touched_on_refresh(tmp_path):
+    index, source = make_index(tmp_path)
+    (source / "voice.md").write_text("Acme speaks plainly.")
+    index.refresh()
+    directory = tmp_path / "index" / index.snapshot()["generation"]
+    age(directory, 3 * BRAND_INDEX_CONFIG["refresh_interval"])
+    assert not index.refresh()
+    assert os.stat(directory).st_mtime > time.time() - BRAND_INDEX_CONFIG["refresh_interval"]
+
+
+def test_generation_removed_while_loading_is_rebuilt(tmp_path):
+    index, source = make_index(tmp_path)
+    (source / "voice.md").write_text("Acme speaks plainly.")
+    index.refresh()
+    directory = tmp_path / "index" / index.snapshot()["generation"]
+    os.remove(directory / "postings.npy")
+    other, _ = make_index(tmp_path)
+    assert other.refresh()
+    assert other.search("plainly", 1)[0]["source"] == "voice.md"
@@ -0,0 +1,70 @@
+import time
+
+from backend.config import CACHE_CONFIG
+from backend.utils.cache import ResponseCache
+
+MESSAGES = [
+    {"role": "system", "content": "You are a Crisis Manager."},
+    {"role": "user", "content": "Draft a holding line"}
+]
+MODEL = {"name": "gpt-4", "temperature": 0.7}
+
+
+def make_cache(**overrides):
+    return ResponseCache({**CACHE_CONFIG, "sqlite_path": None, **overrides})
+
+
+def test_key_ignores_whitespace_but_not_sampling_params():
+    spaced = [{"role": m["role"], "content": "  " + m["content"].replace(" ", "   ")} for m in MESSAGES]
+    assert ResponseCache.make_key(spaced, MODEL) == ResponseCache.make_key(MESSAGES, MODEL)
+    assert ResponseCache.make_key(MESSAGES, {**MODEL, "temperature": 0.2}) != ResponseCache.make_key(MESSAGES, MODEL)
+    assert ResponseCache.make_key(MESSAGES, {**MODEL, "name": "claude"}) != ResponseCache.make_key(MESSAGES, MODEL)
+
+
+def test_lru_eviction_and_hit_rate():
+    cache = make_cache(max_entries=2)
+    cache.set("a", {"response": "A"}, 60)
+    cache.set("b", {"response": "B"}, 60)
+    assert cache.get("a") == {"response": "A"}
+    cache.set("c", {"response": "C"}, 60)
+    # "b" was least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    snapshot = cache.snapshot()
+    assert snapshot["evictions"] == 1
+    assert snapshot["hit_rate"] == 0.75
+
+
+def test_expired_and_zero_ttl_entries(monkeypatch):
+    cache = make_cache()
+    cache.set("never", {"response": "x"}, 0)
+    assert cache.get("never") is None
+    cache.set("soon", {"response": "x"}, 10)
+    now = time.time()
+    monkeypatch.setattr("backend.utils.cache.time.time", lambda: now + 11)
+    assert cache.get("soon") is None
+    assert cache.stats["expirations"] == 1
+
+
+def test_ttl_per_agent():
+    cache = make_cache()
+    assert cache.ttl_for("crisis_manager") == 300
+    assert cache.ttl_for(None) == CACHE_CONFIG["default_ttl"]
+
+
+def test_sqlite_tier_is_shared(tmp_path):
+    path = str(tmp_path / "cache.db")
+    make_cache(sqlite_path=path).set("k", {"response": "stored"}, 60)
+    other = make_cache(sqlite_path=path)
+    assert other.get("k") == {"response": "stored"}
+    assert other.get("k") == {"response": "stored"}
+    assert other.stats["disk_hits"] == 1
+    assert other.stats["memory_hits"] == 1
+
+
+def test_sqlite_tier_is_pruned_to_max_disk_entries(tmp_path):
+    cache = make_cache(sqlite_path=str(tmp_path / "cache.db"), max_disk_entries=10)
+    for i in range(100):
+        cache.set(f"k{i}", {"response": i}, 60 + i)
+    rows = cache._db.execute("SELECT key FROM responses ORDER BY expires_at").fetchall()
+    assert [key for key, in rows] == [f"k{i}" for i in range(90, 100)]
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from backend.utils.coalesce import SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Upstream:
+    """A token stream that records whether it was cancelled or closed"""
+
+    def __init__(self, deltas, delay=0.01, error=None):
+        self.deltas = deltas
+        self.delay = delay
+        self.error = error
+        self.started = 0
+        self.closed = False
+
+    async def stream(self, info):
+        self.started += 1
+        try:
+            for delta in self.deltas:
+                await asyncio.sleep(self.delay)
+                yield delta
+            if self.error is not None:
+                raise self.error
+            info["model_info"] = {"name": "gpt-4"}
+        finally:
+            self.closed = True
+
+
+def test_do_shares_one_call():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("key", factory) for _ in range(5)))
+        return calls, results, flight.snapshot()
+
+    calls, results, snapshot = run(main())
+    assert calls == 1
+    assert [r for r, _ in results] == ["answer"] * 5
+    assert sum(coalesced for _, coalesced in results) == 4
+    assert snapshot["in_flight"] == 0
+
+
+def test_late_subscriber_gets_replay():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream(["a", "b", "c"])
+        completed = []
+        first, info, _ = flight.stream("key", upstream.stream, on_complete=lambda text, info: completed.append(text))
+        got_first = [await first.__anext__()]
+        second, _, coalesced = flight.stream("key", upstream.stream)
+        got_first += [d async for d in first]
+        got_second = [d async for d in second]
+        return upstream, info, coalesced, got_first, got_second, completed
+
+    upstream, info, coalesced, got_first, got_second, completed = run(main())
+    assert upstream.started == 1
+    assert coalesced
+    assert got_first == got_second == ["a", "b", "c"]
+    assert completed == ["abc"]
+    assert info["model_info"] == {"name": "gpt-4"}
+
+
+def test_subscriber_that_never_reads_stops_upstream():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream(["a"] * 100)
+        stream, _, _ = flight.stream("key", upstream.stream)
+        await asyncio.sleep(0.03)
+        # The client disconnected before its first read
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+        return upstream, flight.snapshot()
+
+    upstream, snapshot = run(main())
+    assert upstream.closed
+    assert snapshot["streams_in_flight"] == 0
+
+
+def test_upstream_keeps_running_while_one_subscriber_remains():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream(["a", "b", "c"])
+        leaving, _, _ = flight.stream("key", upstream.stream)
+        staying, _, _ = flight.stream("key", upstream.stream)
+        await leaving.aclose()
+        return [d async for d in staying]
+
+    assert run(main()) == ["a", "b", "c"]
+
+
+def test_upstream_error_reaches_every_subscriber():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream(["a"], error=RuntimeError("provider failed"))
+        streams = [flight.stream("key", upstream.stream)[0] for _ in range(2)]
+        outcomes = []
+        for stream in streams:
+            with pytest.raises(RuntimeError):
+                async for _ in stream:
+                    pass
+            outcomes.append(stream.broadcast.subscribers)
+        return outcomes
+
+    assert run(main()) == [1, 0]
@@ -0,0 +1,60 @@
+from backend.utils import context
+from backend.utils.context import ConversationContext, estimate_tokens, fit_messages, message_tokens
+
+CONFIG = {"safety_margin": 0.1, "summary_share": 0.15, "summary_chars_per_turn": 200}
+
+
+def turns(count, words=400):
+    messages = [{"role": "system", "content": "You are a Media Relations Specialist."}]
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"turn {i} " + "word " * words})
+    return messages
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Hello, world!") == 4
+    text = "word " * 1000
+    assert estimate_tokens(text) == estimate_tokens(text) == 1300
+
+
+def test_token_cache_is_bounded_and_keeps_no_text(monkeypatch):
+    monkeypatch.setattr(context, "TOKEN_CACHE_SIZE", 3)
+    context._token_counts.clear()
+    for i in range(10):
+        estimate_tokens(f"{i} " + "long " * 100)
+    assert len(context._token_counts) == 3
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in context._token_counts)
+
+
+def test_window_keeps_everything_that_fits():
+    messages = turns(4, words=10)
+    assert ConversationContext(messages, CONFIG).window("gpt-4") == messages
+
+
+def test_window_rolls_old_turns_into_a_summary():
+    messages = turns(60)
+    conversation = ConversationContext(messages, CONFIG)
+    window = conversation.window("gpt-4")
+    assert window[0] == messages[0]
+    assert window[1]["role"] == "system" and window[1]["content"].startswith("Summary of earlier conversation:")
+    assert window[-1] == messages[-1]
+    assert sum(message_tokens(m) for m in window) <= conversation.budget("gpt-4")
+
+
+def test_window_is_incremental():
+    messages = turns(60)
+    conversation = ConversationContext(messages[:40], CONFIG)
+    conversation.window("gpt-4")
+    conversation.sync(messages)
+    assert conversation.window("gpt-4") == ConversationContext(messages, CONFIG).window("gpt-4")
+
+
+def test_fit_messages():
+    short = turns(2, words=10)
+    assert fit_messages(short, "gpt-4") is short
+    long = turns(60)
+    fitted = fit_messages(long, "gpt-4")
+    assert len(fitted) < len(long)
+    assert fit_messages(long, "claude-3-opus") is long
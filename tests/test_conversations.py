@@ -0,0 +1,96 @@
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.config import CONVERSATION_CONFIG
+from backend.utils.conversations import ConversationConflict, ConversationStore
+
+
+def make_store(**overrides):
+    return ConversationStore({**CONVERSATION_CONFIG, "sqlite_path": None, **overrides})
+
+
+def turn(i):
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+def test_context_starts_with_system_prompt_and_grows_with_appends():
+    store = make_store()
+    assert store.context("c1", "media_relations", "You are a Media Relations Specialist.").messages == [
+        {"role": "system", "content": "You are a Media Relations Specialist."}
+    ]
+    store.append("c1", "media_relations", turn(1))
+    context = store.context("c1", "media_relations", "You are a Media Relations Specialist.")
+    assert [m["content"] for m in context.messages] == [
+        "You are a Media Relations Specialist.", "question 1", "answer 1"
+    ]
+    assert store.history("c1")["messages"] == turn(1)
+
+
+def test_other_agent_is_rejected():
+    store = make_store()
+    store.append("c1", "media_relations", turn(1))
+    with pytest.raises(ConversationConflict):
+        store.append("c1", "crisis_manager", turn(2))
+
+
+def test_only_newest_messages_are_kept(tmp_path):
+    store = make_store(max_messages=4, sqlite_path=str(tmp_path / "conversations.db"))
+    for i in range(5):
+        store.append("c1", None, turn(i))
+    assert store.history("c1")["messages"] == turn(3) + turn(4)
+    rows = store._db.execute("SELECT COUNT(*) FROM turns").fetchone()
+    assert rows[0] == 4
+
+
+def test_workers_share_conversations_through_sqlite(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    first, second = make_store(sqlite_path=path), make_store(sqlite_path=path)
+    first.append("c1", "social_media", turn(1))
+    # Timestamps must move forward for the other worker's cached copy to look stale
+    time.sleep(0.01)
+    second.append("c1", "social_media", turn(2))
+    assert first.history("c1")["messages"] == turn(1) + turn(2)
+    assert second.stats["disk_loads"] == 1
+
+
+def test_idle_conversations_expire(monkeypatch):
+    store = make_store(ttl=60)
+    store.append("c1", None, turn(1))
+    now = time.time()
+    monkeypatch.setattr("backend.utils.conversations.time.time", lambda: now + 61)
+    assert store.history("c1") is None
+    assert store.snapshot()["expired"] == 1
+
+
+def test_delete():
+    store = make_store()
+    store.append("c1", None, turn(1))
+    store.delete("c1")
+    assert store.history("c1") is None
+
+
+def test_endpoint_sends_only_the_new_message(monkeypatch):
+    sent = []
+
+    async def fake_generate(messages, model_config):
+        sent.append(messages)
+        return {"content": f"answer {len(sent)}", "model_info": {"name": "gpt-4", "provider": "openai"},
+                "usage": {}, "attempts": 1}
+
+    monkeypatch.setattr(main.failover_handler, "generate_with_details", fake_generate)
+    client = TestClient(main.app)
+    conversation_id = uuid.uuid4().hex
+    for query in ("Draft a holding statement", "Make it shorter"):
+        response = client.post("/api/pr-agent", json={
+            "query": query, "agent_type": "crisis_manager", "model": "gpt-4", "conversation_id": conversation_id
+        })
+        assert response.status_code == 200
+    assert [m["content"] for m in sent[1][1:]] == ["Draft a holding statement", "answer 1", "Make it shorter"]
+    history = client.get(f"/api/conversations/{conversation_id}").json()
+    assert len(history["messages"]) == 4
+    client.delete(f"/api/conversations/{conversation_id}")
+    assert client.get(f"/api/conversations/{conversation_id}").status_code == 404
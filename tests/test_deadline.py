@@ -0,0 +1,32 @@
+import time
+
+from backend.config import DEADLINE_CONFIG
+from backend.utils.deadline import Deadline
+
+CONFIG = {**DEADLINE_CONFIG, "min_attempt": 1.0, "backoff_base": 0.25, "backoff_max": 2.0}
+
+
+def test_budget_per_agent_capped_at_max():
+    assert Deadline.for_request("crisis_manager", config=CONFIG).budget == CONFIG["agent_budgets"]["crisis_manager"]
+    assert Deadline.for_request(None, config=CONFIG).budget == CONFIG["default"]
+    assert Deadline.for_request("crisis_manager", seconds=10 * CONFIG["max"], config=CONFIG).budget == CONFIG["max"]
+
+
+def test_remaining_and_exhausted():
+    deadline = Deadline(1.5, CONFIG)
+    assert 1.4 < deadline.remaining() <= 1.5
+    assert not deadline.exhausted()
+    deadline.expires_at = time.monotonic() + 0.5
+    assert deadline.exhausted()
+    deadline.expires_at = time.monotonic() - 1
+    assert deadline.remaining() == 0.0
+
+
+def test_backoff_grows_and_never_eats_the_next_attempt():
+    deadline = Deadline(60, CONFIG)
+    for retry in range(1, 8):
+        delay = deadline.backoff(retry)
+        assert 0 <= delay <= min(CONFIG["backoff_max"], CONFIG["backoff_base"] * 2 ** (retry - 1))
+    # With only min_attempt left, any sleep would leave too little for the retry itself
+    deadline.expires_at = time.monotonic() + 1.0
+    assert deadline.backoff(5) is None
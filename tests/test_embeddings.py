@@ -0,0 +1,22 @@
+import numpy as np
+
+from backend.utils.embeddings import HashedNgramVectorizer
+
+
+def test_vectors_are_normalized_and_deterministic():
+    vectorizer = HashedNgramVectorizer(dim=256)
+    vector = vectorizer.transform("Draft a press release for our product launch")
+    assert vector.shape == (256,) and vector.dtype == np.float32
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    assert np.array_equal(vector, HashedNgramVectorizer(dim=256).transform("Draft a press release for our product launch"))
+    assert not vectorizer.transform("?!").any()
+
+
+def test_paraphrases_are_closer_than_unrelated_text():
+    vectorizer = HashedNgramVectorizer()
+    query, paraphrase, unrelated = vectorizer.transform_many([
+        "Draft a press release announcing our new product launch",
+        "Write a press release that announces the launch of our new product",
+        "Summarize last quarter's social media sentiment"
+    ])
+    assert query @ paraphrase > query @ unrelated + 0.2
@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+
+from backend.config import HEDGING_CONFIG
+from backend.utils.deadline import Deadline
+from backend.utils.failover import AllModelsFailed, DeadlineExceeded, FailoverHandler
+from backend.utils.metrics import ATTEMPTS, ERRORS
+
+DEADLINES = {
+    "default": 5.0,
+    "max": 10.0,
+    "agent_budgets": {},
+    "min_attempt": 0.05,
+    "retries": 1,
+    "retry_on": ["connection", "server_error"],
+    "backoff_base": 0.01,
+    "backoff_max": 0.02
+}
+
+
+class ConnectError(Exception):
+    """Classified by name like httpx's, so it counts as a transient connection error"""
+
+
+class FakeClient:
+    """
+    Answers per model from a script: a latency and either a reply or an exception, in order of calls.
+    A (reply, exception) pair streams the reply and then breaks with the exception.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+
+    def max_completion_tokens(self, model_name):
+        return 100
+
+    def _next(self, model_name):
+        self.calls.append(model_name)
+        steps = self.script[model_name]
+        return steps.pop(0) if len(steps) > 1 else steps[0]
+
+    async def generate(self, messages, model_name, timeout=None):
+        delay, outcome = self._next(model_name)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {"content": outcome, "usage": {"input_tokens": 10, "output_tokens": 5}}
+
+    async def stream(self, messages, model_name, usage, timeout=None):
+        delay, outcome = self._next(model_name)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        outcome, error = outcome if isinstance(outcome, tuple) else (outcome, None)
+        for word in outcome.split():
+            yield word + " "
+        if error is not None:
+            raise error
+
+
+class FakeRegistry:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, provider):
+        return self.client
+
+
+@pytest.fixture
+def make_handler(make_scheduler):
+    def make(script, **hedging):
+        client = FakeClient(script)
+        handler = FailoverHandler(providers=FakeRegistry(client), scheduler=make_scheduler())
+        handler.fallback_models = [{"name": name, "provider": "openai"} for name in script]
+        handler.deadlines = DEADLINES
+        handler.hedging = {**HEDGING_CONFIG, "use_p95": False, **hedging}
+        settled = []
+        reconcile = handler.scheduler.reconcile
+
+        def record(provider, model, reserved, used):
+            settled.append((model, reserved, used))
+            reconcile(provider, model, reserved, used)
+
+        handler.scheduler.reconcile = record
+        return handler, client, settled
+
+    return make
+
+
+def count(metric, **labels):
+    return metric.values.get(metric._key(labels), 0)
+
+
+def generate(handler, model="gpt-4", **config):
+    return asyncio.run(handler.generate_with_details(
+        [{"role": "user", "content": "Draft a holding statement"}], {"name": model, **config}
+    ))
+
+
+def test_fails_over_to_next_model_and_settles_each_attempt(make_handler):
+    handler, client, settled = make_handler({
+        "gpt-4": [(0, ValueError("bad output"))],
+        "gpt-3.5-turbo": [(0, "Holding statement")]
+    })
+    result = generate(handler)
+    assert result["content"] == "Holding statement"
+    assert result["model_info"]["name"] == "gpt-3.5-turbo"
+    assert result["attempts"] == 2
+    assert client.calls == ["gpt-4", "gpt-3.5-turbo"]
+    # The failed attempt gives its reservation back down to the prompt; the answer to its reported usage
+    assert settled[0][0] == "gpt-4" and settled[0][2] < settled[0][1]
+    assert settled[1] == ("gpt-3.5-turbo", settled[1][1], 15)
+
+
+def test_transient_error_retries_the_same_model(make_handler):
+    handler, client, _ = make_handler({
+        "gpt-4": [(0, ConnectError("reset")), (0, "Holding statement")],
+        "gpt-3.5-turbo": [(0, "fallback")]
+    })
+    assert generate(handler)["model_info"]["name"] == "gpt-4"
+    assert client.calls == ["gpt-4", "gpt-4"]
+
+
+def test_all_models_failing(make_handler):
+    handler, _, _ = make_handler({"gpt-4": [(0, ValueError("no"))], "gpt-3.5-turbo": [(0, ValueError("no"))]})
+    with pytest.raises(AllModelsFailed) as failed:
+        generate(handler)
+    assert failed.value.attempts == 2
+
+
+def test_every_circuit_open_fails_fast_with_a_retry_hint(make_handler):
+    handler, client, _ = make_handler({"gpt-4": [(0, "unused")], "gpt-3.5-turbo": [(0, "unused")]})
+    for model in handler.fallback_models:
+        for _ in range(handler.health.config["consecutive_failures"]):
+            handler.health.record(model, ok=False)
+    with pytest.raises(AllModelsFailed) as failed:
+        generate(handler)
+    assert failed.value.error_class == "circuit_open"
+    assert 0 < failed.value.retry_after <= handler.health.config["open_seconds"]
+    assert client.calls == []
+
+
+def test_deadline_bounds_the_whole_chain(make_handler):
+    handler, client, _ = make_handler({"gpt-4": [(5, "late")], "gpt-3.5-turbo": [(5, "late")]})
+    with pytest.raises(DeadlineExceeded) as exceeded:
+        generate(handler, deadline=Deadline(0.2, DEADLINES))
+    assert exceeded.value.error_class == "deadline_exceeded"
+    assert client.calls == ["gpt-4"]
+
+
+def test_hedge_wins_when_first_model_is_slow(make_handler):
+    handler, client, settled = make_handler({
+        "gpt-4": [(5, "slow")],
+        "gpt-3.5-turbo": [(0.01, "fast")]
+    }, delay=0.05)
+    result = generate(handler, hedge=True)
+    assert result["content"] == "fast"
+    assert result["hedge"]["winner_was_hedge"]
+    assert result["hedge"]["cancelled"] == 1
+    # The cancelled attempt released its reservation too
+    assert {model for model, _, _ in settled} == {"gpt-4", "gpt-3.5-turbo"}
+
+
+def test_stream_fails_over_before_the_first_token(make_handler):
+    handler, client, settled = make_handler({
+        "gpt-4": [(0, ConnectError("reset"))],
+        "gpt-3.5-turbo": [(0, "We are aware of the issue")]
+    })
+
+    async def collect():
+        info = {}
+        deltas = [d async for d in handler.stream_with_fallback(
+            [{"role": "user", "content": "Draft a holding statement"}], {"name": "gpt-4"}, info)]
+        return deltas, info
+
+    deltas, info = asyncio.run(collect())
+    assert "".join(deltas) == "We are aware of the issue "
+    assert info["model_info"]["name"] == "gpt-3.5-turbo"
+    # No usage on the stream, so the reservation settles to the prompt plus one token per delta
+    prompt = settled[-1][2] - len(deltas)
+    assert settled[-1][0] == "gpt-3.5-turbo" and prompt > 0
+
+
+def test_stream_breaking_after_the_first_token_counts_as_a_failure(make_handler):
+    handler, _, settled = make_handler({
+        "gpt-4": [(0, ("We are aware", ConnectError("reset")))],
+        "gpt-3.5-turbo": [(0, "fallback")]
+    })
+    labels = {"provider": "openai", "model": "gpt-4"}
+    successes = count(ATTEMPTS, outcome="success", **labels)
+    errors = count(ERRORS, provider="openai", error_class="connection")
+    deltas = []
+
+    async def collect():
+        async for delta in handler.stream_with_fallback(
+                [{"role": "user", "content": "Draft a holding statement"}], {"name": "gpt-4"}):
+            deltas.append(delta)
+
+    with pytest.raises(ConnectError):
+        asyncio.run(collect())
+    # No failover once tokens went out, but the break counts against gpt-4 and its reservation still settles
+    assert deltas == ["We ", "are ", "aware "]
+    assert handler.health.model("gpt-4").total_failures == 1
+    assert count(ATTEMPTS, outcome="success", **labels) == successes
+    assert count(ERRORS, provider="openai", error_class="connection") == errors + 1
+    assert settled[-1][0] == "gpt-4"
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+from backend.utils.formatting import CACHE_BREAKPOINT, anthropic_usage, format_for_anthropic, openai_usage
+
+LONG = "Brand voice guideline. " * 400
+SHORT_PROMPT = "You are a Media Relations Specialist."
+
+
+def breakpoints(system, turns):
+    marked = [("system", i) for i, block in enumerate(system) if "cache_control" in block]
+    marked += [
+        ("turn", i) for i, turn in enumerate(turns) for block in turn["content"] if "cache_control" in block
+    ]
+    return marked
+
+
+def test_roles_and_alternation():
+    system, turns = format_for_anthropic([
+        {"role": "system", "content": SHORT_PROMPT},
+        {"role": "assistant", "content": "Earlier answer"},
+        {"role": "user", "content": "one"},
+        {"role": "user", "content": "two"}
+    ], prompt_caching=False)
+    assert system == [{"type": "text", "text": SHORT_PROMPT}]
+    assert [turn["role"] for turn in turns] == ["user", "assistant", "user"]
+    assert [block["text"] for block in turns[-1]["content"]] == ["one", "two"]
+
+
+def test_short_prompts_get_no_breakpoints():
+    system, turns = format_for_anthropic([
+        {"role": "system", "content": SHORT_PROMPT},
+        {"role": "user", "content": "Draft a statement"},
+        {"role": "assistant", "content": "Here it is"},
+        {"role": "user", "content": "Shorter please"}
+    ])
+    assert breakpoints(system, turns) == []
+
+
+def test_breakpoint_after_brand_excerpts_once_long_enough():
+    system, turns = format_for_anthropic([
+        {"role": "system", "content": SHORT_PROMPT},
+        {"role": "system", "content": LONG},
+        {"role": "user", "content": "Draft a statement"}
+    ])
+    assert breakpoints(system, turns) == [("system", 1)]
+    assert system[1]["cache_control"] == CACHE_BREAKPOINT
+
+
+def test_history_breakpoint_counts_the_whole_prefix():
+    messages = [{"role": "system", "content": SHORT_PROMPT}]
+    messages += [{"role": "user", "content": "question"}, {"role": "assistant", "content": LONG}]
+    messages += [{"role": "user", "content": "follow-up"}]
+    system, turns = format_for_anthropic(messages)
+    assert breakpoints(system, turns) == [("turn", 1)]
+    assert breakpoints(*format_for_anthropic(messages, min_cacheable_tokens=10 ** 6)) == []
+
+
+def test_usage_shapes():
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=4))
+    assert openai_usage(usage) == {
+        "input_tokens": 10, "output_tokens": 5, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 4
+    }
+    assert openai_usage(None) == {}
+    assert anthropic_usage(SimpleNamespace(input_tokens=3, output_tokens=2))["cache_read_input_tokens"] == 0
@@ -0,0 +1,59 @@
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+spec = importlib.util.spec_from_file_location(
+    "frontend_app", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "app.py")
+)
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+
+
+class FakeResponse:
+    status_code = 200
+    text = ""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+
+class FakeSession:
+    def __init__(self, lines):
+        self.lines = lines
+        self.posted = []
+
+    def post(self, url, **kwargs):
+        self.posted.append((url, kwargs["json"]))
+        return FakeResponse(self.lines)
+
+
+def test_stream_yields_tokens_and_records_done(monkeypatch):
+    session = FakeSession([
+        "event: token", 'data: {"delta": "Big "}', "",
+        "event: token", 'data: {"delta": "news"}', "",
+        "event: done", 'data: {"status": "success", "model_info": {"name": "gpt-4"}}', ""
+    ])
+    monkeypatch.setattr(app, "get_session", lambda: session)
+    result = {}
+    assert "".join(app.stream_pr_agent({"query": "launch"}, result)) == "Big news"
+    assert result["model_info"] == {"name": "gpt-4"}
+    assert session.posted[0][0].endswith("/api/pr-agent/stream")
+
+
+def test_stream_error_event_raises(monkeypatch):
+    session = FakeSession(["event: error", 'data: {"status": "error", "detail": "All models failed"}', ""])
+    monkeypatch.setattr(app, "get_session", lambda: session)
+    with pytest.raises(Exception, match="All models failed"):
+        list(app.stream_pr_agent({"query": "launch"}, {}))
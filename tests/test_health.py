@@ -0,0 +1,103 @@
+import pytest
+
+from backend.utils.health import CLOSED, HALF_OPEN, CircuitOpen, HealthTracker
+
+CONFIG = {
+    "ewma_alpha": 0.5,
+    "default_latency": 5.0,
+    "window_seconds": 300,
+    "min_requests": 5,
+    "error_rate_threshold": 0.5,
+    "consecutive_failures": 3,
+    "open_seconds": 30,
+    "probe_interval": 10,
+    "error_penalty": 4.0
+}
+
+MODELS = [
+    {"name": "gpt-4", "provider": "openai"},
+    {"name": "claude-3-opus", "provider": "anthropic"},
+    {"name": "claude-3-sonnet", "provider": "anthropic"}
+]
+
+
+def names(models):
+    return [m["name"] for m in models]
+
+
+def open_circuit(health, model):
+    for _ in range(CONFIG["consecutive_failures"]):
+        health.record(model, ok=False)
+
+
+def test_requested_model_goes_first():
+    health = HealthTracker(CONFIG)
+    assert names(health.rank(MODELS, "claude-3-sonnet"))[0] == "claude-3-sonnet"
+
+
+@pytest.mark.parametrize("alias", ["claude-3", "claude-3-opus-20240229"])
+def test_requested_alias_resolves_to_fallback_entry(alias):
+    health = HealthTracker(CONFIG)
+    assert names(health.rank(MODELS, alias))[0] == "claude-3-opus"
+
+
+def test_faster_models_rank_higher():
+    health = HealthTracker(CONFIG)
+    health.record(MODELS[0], ok=True, latency=4.0)
+    health.record(MODELS[1], ok=True, latency=1.0)
+    health.record(MODELS[2], ok=True, latency=2.0)
+    assert names(health.rank(MODELS)) == ["claude-3-opus", "claude-3-sonnet", "gpt-4"]
+
+
+def test_open_circuit_is_skipped():
+    health = HealthTracker(CONFIG)
+    open_circuit(health, MODELS[0])
+    assert "gpt-4" not in names(health.rank(MODELS, "gpt-4"))
+    with pytest.raises(CircuitOpen):
+        health.start(MODELS[0])
+
+
+def test_nothing_ranked_when_every_circuit_is_open():
+    health = HealthTracker(CONFIG)
+    for model in MODELS:
+        open_circuit(health, model)
+    assert health.rank(MODELS) == []
+    for model in MODELS:
+        with pytest.raises(CircuitOpen):
+            health.start(model)
+    health.model("claude-3-opus").opened_at -= 20
+    health.provider("anthropic").opened_at -= 20
+    assert health.reopens_in(MODELS) == pytest.approx(CONFIG["open_seconds"] - 20, abs=0.5)
+
+
+def test_half_open_allows_one_probe_per_window():
+    health = HealthTracker(CONFIG)
+    model = MODELS[0]
+    open_circuit(health, model)
+    for endpoint in (health.model("gpt-4"), health.provider("openai")):
+        endpoint.opened_at -= CONFIG["open_seconds"]
+
+    # Two requests rank the backend before either has started its attempt
+    assert "gpt-4" in names(health.rank(MODELS))
+    assert "gpt-4" in names(health.rank(MODELS))
+    health.start(model)
+    assert health.model("gpt-4").state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        health.start(model)
+    assert "gpt-4" not in names(health.rank(MODELS))
+
+    health.record(model, ok=True, latency=1.0)
+    assert health.model("gpt-4").state == CLOSED
+    health.start(model)
+    health.start(model)
+
+
+def test_failed_probe_reopens_circuit():
+    health = HealthTracker(CONFIG)
+    model = MODELS[0]
+    open_circuit(health, model)
+    for endpoint in (health.model("gpt-4"), health.provider("openai")):
+        endpoint.opened_at -= CONFIG["open_seconds"]
+    health.start(model)
+    health.record(model, ok=False)
+    assert health.model("gpt-4").snapshot()["state"] == "open"
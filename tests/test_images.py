@@ -0,0 +1,105 @@
+import asyncio
+import base64
+
+import pytest
+
+from backend.config import IMAGE_CONFIG
+from backend.utils.images import FAILED, SUCCEEDED, ImageCache, ImageJobQueue, QueueFull
+
+PNG = b"\x89PNG fake image"
+
+
+def make_queue(tmp_path, generate, **overrides):
+    return ImageJobQueue(generate, {**IMAGE_CONFIG, "cache_dir": str(tmp_path), **overrides})
+
+
+async def wait_for(queue, job_id):
+    while queue.get(job_id)["status"] not in (SUCCEEDED, FAILED):
+        await asyncio.sleep(0.01)
+    return queue.get(job_id)
+
+
+def test_cache_key_ignores_whitespace():
+    assert ImageCache.make_key("a  red\nlogo", "dall-e-3", "1024x1024", "hd") == \
+        ImageCache.make_key("a red logo", "dall-e-3", "1024x1024", "hd")
+    assert ImageCache.make_key("a red logo", "dall-e-3", "1024x1024", "hd") != \
+        ImageCache.make_key("a red logo", "dall-e-3", "1024x1024", "standard")
+
+
+def test_job_generates_once_then_hits_the_cache(tmp_path):
+    calls = []
+
+    async def generate(prompt, **params):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return {"b64_json": base64.b64encode(PNG).decode()}
+
+    async def run():
+        queue = make_queue(tmp_path, generate)
+        first = queue.submit("a red logo", "dall-e-3", "1024x1024", "hd")
+        duplicate = queue.submit("a red  logo", "dall-e-3", "1024x1024", "hd")
+        assert duplicate["deduplicated"] and duplicate["job_id"] == first["job_id"]
+        done = await wait_for(queue, first["job_id"])
+        again = queue.submit("a red logo", "dall-e-3", "1024x1024", "hd")
+        await queue.aclose()
+        return queue, done, again
+
+    queue, done, again = asyncio.run(run())
+    assert done["status"] == SUCCEEDED
+    assert again["cached"] and again["status"] == SUCCEEDED
+    assert calls == ["a red logo"]
+    with open(queue.cache.path(done["image_key"]), "rb") as f:
+        assert f.read() == PNG
+
+
+def test_failed_job_records_the_error(tmp_path):
+    async def generate(prompt, **params):
+        raise RuntimeError("content policy")
+
+    async def run():
+        queue = make_queue(tmp_path, generate)
+        job = queue.submit("a logo", "dall-e-3", "1024x1024", "hd")
+        done = await wait_for(queue, job["job_id"])
+        await queue.aclose()
+        return queue, done
+
+    queue, done = asyncio.run(run())
+    assert done["status"] == FAILED and done["error"] == "content policy"
+    assert queue.snapshot()["in_flight"] == 0
+
+
+def test_full_queue_rejects(tmp_path):
+    async def generate(prompt, **params):
+        await asyncio.Event().wait()
+
+    async def run():
+        queue = make_queue(tmp_path, generate, workers=1, max_pending=1)
+        queue.submit("first", "dall-e-3", "1024x1024", "hd")
+        # Let the worker take the first job off the queue
+        await asyncio.sleep(0)
+        queue.submit("second", "dall-e-3", "1024x1024", "hd")
+        try:
+            with pytest.raises(QueueFull):
+                queue.submit("third", "dall-e-3", "1024x1024", "hd")
+        finally:
+            await queue.aclose()
+        return queue
+
+    assert asyncio.run(run()).stats["rejected"] == 1
+
+
+def test_other_process_can_poll_a_job(tmp_path):
+    async def generate(prompt, **params):
+        return {"b64_json": base64.b64encode(PNG).decode()}
+
+    async def run():
+        queue = make_queue(tmp_path, generate)
+        job = queue.submit("a logo", "dall-e-3", "1024x1024", "hd")
+        await wait_for(queue, job["job_id"])
+        await queue.aclose()
+        return job
+
+    job = asyncio.run(run())
+    other = make_queue(tmp_path, generate)
+    assert other.get(job["job_id"])["status"] == SUCCEEDED
+    assert other.get("../../etc/passwd") is None
@@ -0,0 +1,113 @@
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.config import MENTIONS_CONFIG
+from backend.utils.mentions import MentionAggregator, MentionDataError, summarize_mentions
+
+# Small pieces, so uploads in these tests cross several of them
+CONFIG = {**MENTIONS_CONFIG, "chunk_bytes": 4096, "max_record_bytes": 16384}
+
+
+def summarize(data: bytes, piece: int = 1000, **options):
+    async def chunks():
+        for i in range(0, len(data), piece):
+            yield data[i:i + piece]
+
+    return asyncio.run(summarize_mentions(chunks(), config=CONFIG, **options))
+
+
+def csv_rows(count, stray_at=None):
+    lines = ["timestamp,text"]
+    for i in range(count):
+        text = f'"Loving the new phone, great battery {i}"'
+        if i == stray_at:
+            text = 'The 5" screen is terrible'
+        lines.append(f"2024-03-0{1 + i % 3}T10:00:00Z,{text}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_csv_counts_rows_and_sentiment():
+    summary = summarize(csv_rows(300))
+    assert summary["mentions"] == 300
+    assert summary["undated"] == 0
+    assert summary["sentiment"]["positive"] == 1.0
+
+
+def test_stray_quote_in_unquoted_field():
+    data = csv_rows(2000, stray_at=700)
+    expected = sum(1 for _ in csv.reader(io.StringIO(data.decode()))) - 1
+    summary = summarize(data)
+    assert summary["mentions"] == expected == 2000
+    assert summary["sentiment"]["negative"] == pytest.approx(1 / 2000, abs=1e-3)
+
+
+def test_doubled_quotes_inside_quoted_field():
+    data = b'text\n"She said ""great"" twice"\n"plain, with a comma"\n'
+    assert summarize(data, piece=7)["mentions"] == 2
+
+
+def test_unclosed_quote_is_capped():
+    data = b'text\n"never closed, ' + b"word " * 10000 + b"\n" * 10
+    with pytest.raises(MentionDataError, match="unclosed quote"):
+        summarize(data)
+
+
+def test_jsonl_epoch_and_iso_times():
+    records = [
+        {"content": "Great launch", "created_at": 1709287200},
+        {"content": "Terrible support", "created_at": "2024-03-01T11:00:00Z"},
+        {"content": "No time at all"},
+        "not an object"
+    ]
+    data = "\n".join(json.dumps(r) for r in records).encode()
+    summary = summarize(data)
+    assert summary["mentions"] == 3
+    assert summary["skipped_rows"] == 1
+    assert summary["undated"] == 1
+
+
+def test_empty_upload():
+    with pytest.raises(MentionDataError, match="empty"):
+        summarize(b"")
+
+
+def test_unknown_text_field():
+    with pytest.raises(MentionDataError, match="No text column named body"):
+        summarize(b"text,timestamp\nhello,2024-03-01\n", text_field="body")
+
+
+def test_rejects_unknown_format():
+    with pytest.raises(MentionDataError):
+        MentionAggregator(data_format="xml")
+
+
+def test_endpoint_summary_only_and_bad_upload():
+    client = TestClient(main.app)
+    response = client.post("/api/analytics/mentions?summary_only=true", content=csv_rows(50),
+                           headers={"content-type": "text/csv"})
+    assert response.status_code == 200
+    assert response.json()["summary"]["mentions"] == 50
+    response = client.post("/api/analytics/mentions?summary_only=true&text_field=body", content=csv_rows(5),
+                           headers={"content-type": "text/csv"})
+    assert response.status_code == 400
+
+
+def test_endpoint_hands_the_summary_to_the_analytics_agent(monkeypatch):
+    seen = {}
+
+    async def fake_run(request, http_request):
+        seen["request"] = request
+        return {"response": "Volume doubled on launch day", "status": "success"}, "MISS"
+
+    monkeypatch.setattr(main, "run_pr_request", fake_run)
+    response = TestClient(main.app).post("/api/analytics/mentions?query=What+happened", content=csv_rows(20),
+                                         headers={"content-type": "text/csv"})
+    assert response.json()["response"] == "Volume doubled on launch day"
+    assert seen["request"].agent_type == "analytics_expert"
+    assert seen["request"].query.startswith("What happened\n\n")
@@ -0,0 +1,63 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.utils.metrics import Counter, Histogram, Registry, classify_error, note_timing, request_timing
+
+
+class InternalServerError(Exception):
+    pass
+
+
+class Upstream(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_counter_and_histogram_exposition():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests", ("route",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0)))
+    requests.inc(route='/api/"x"')
+    requests.inc(2, route='/api/"x"')
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, route="/api")
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/api/\\"x\\""} 3' in text
+    assert 'latency_seconds_bucket{route="/api",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/api",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/api",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{route="/api"} 5.55' in text
+    assert 'latency_seconds_count{route="/api"} 3' in text
+
+
+def test_classify_error_by_name_and_status():
+    assert classify_error(InternalServerError()) == "server_error"
+    assert classify_error(asyncio.TimeoutError()) == "timeout"
+    assert classify_error(Upstream(429)) == "rate_limited"
+    assert classify_error(Upstream(503)) == "server_error"
+    assert classify_error(ValueError()) == "other"
+
+
+def test_note_timing_only_inside_a_request():
+    note_timing("ttft_ms", 1.0)
+    timing = {}
+    token = request_timing.set(timing)
+    try:
+        note_timing("ttft_ms", 12.5)
+    finally:
+        request_timing.reset(token)
+    assert timing == {"ttft_ms": 12.5}
+
+
+def test_metrics_endpoint_counts_requests_by_route():
+    client = TestClient(main.app)
+    client.get("/healthz")
+    client.get("/api/images/jobs/0123abcd")
+    text = client.get("/metrics").text
+    assert 'pr_agent_http_requests_total{method="GET",route="/healthz",status="200"}' in text
+    # Labelled by route template, so ids do not create new series
+    assert 'route="/api/images/jobs/{job_id}",status="404"' in text
+    assert "# TYPE pr_agent_provider_attempt_duration_seconds histogram" in text
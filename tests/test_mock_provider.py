@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from backend import mock_provider
+from backend.config import PROVIDER_POOL_CONFIG
+from backend.clients.openai_client import OpenAIClient
+from backend.utils.pool import ProviderPool
+
+
+class MockOpenAIClient(OpenAIClient):
+    """The real SDK client, talking to the mock provider app in-process"""
+
+    def build_client(self, **common):
+        http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_provider.app))
+        return self.sdk_module().AsyncOpenAI(api_key="test", base_url="http://mock/v1",
+                                             http_client=http_client, max_retries=0)
+
+
+@pytest.fixture(autouse=True)
+def fast_mock(monkeypatch):
+    for key, value in {"latency_median": 0.0, "tokens_per_second": 1e6, "output_tokens": 20}.items():
+        monkeypatch.setitem(mock_provider.MOCK_CONFIG, key, value)
+
+
+def run(body):
+    """Runs body(client) on a fresh loop, closing the pool it opened"""
+    async def main():
+        try:
+            return await body(client)
+        finally:
+            await pool.aclose()
+
+    pool = ProviderPool(PROVIDER_POOL_CONFIG)
+    client = MockOpenAIClient(pool)
+    return asyncio.run(main())
+
+
+MESSAGES = [{"role": "user", "content": "Draft a statement"}]
+
+
+def test_completion_reports_usage():
+    result = run(lambda client: client.generate(MESSAGES, "gpt-4"))
+    assert result["content"]
+    assert result["usage"]["output_tokens"] == len(result["content"].split())
+    assert result["usage"]["input_tokens"] > 0
+
+
+def test_stream_fills_in_usage_from_the_last_chunk():
+    async def body(client):
+        usage = {}
+        deltas = [delta async for delta in client.stream(MESSAGES, "gpt-4", usage)]
+        return deltas, usage
+
+    deltas, usage = run(body)
+    assert usage["output_tokens"] == len(deltas)
+    assert usage["input_tokens"] > 0
+
+
+def test_fault_injection(monkeypatch):
+    monkeypatch.setitem(mock_provider.MOCK_CONFIG, "providers", {"openai": {"rate_limit_rate": 1}})
+    with pytest.raises(openai.RateLimitError):
+        run(lambda client: client.generate(MESSAGES, "gpt-4"))
+    assert mock_provider.stats["openai.rate_limited"] >= 1
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from backend.utils.pool import ProviderPool
+
+CONFIG = {
+    "openai": {
+        "max_connections": 10,
+        "max_keepalive_connections": 5,
+        "keepalive_expiry": 30.0,
+        "max_concurrency": 2,
+        "timeout": 60.0,
+        "connect_timeout": 5.0,
+        "max_retries": 0
+    }
+}
+
+
+def test_clients_are_shared_within_a_loop_and_closed_with_it():
+    pool = ProviderPool(CONFIG)
+    built = []
+
+    def build(**kwargs):
+        built.append(kwargs)
+        return object()
+
+    async def run():
+        client = pool.client("openai", "openai", build)
+        assert pool.client("openai", "openai", build) is client
+        http = pool.http_client("openai", "openai")
+        await pool.aclose()
+        return http
+
+    http = asyncio.run(run())
+    assert len(built) == 1
+    assert built[0]["max_retries"] == 0
+    assert http.is_closed
+    # A new loop gets its own clients
+    asyncio.run(run())
+    assert len(built) == 2
+
+
+def test_slots_cap_concurrency():
+    pool = ProviderPool(CONFIG)
+    running = []
+
+    async def call():
+        async with pool.slot("openai"):
+            running.append(1)
+            peak = len(running)
+            await asyncio.sleep(0.01)
+            running.pop()
+            return peak
+
+    async def run():
+        return await asyncio.gather(*(call() for _ in range(6)))
+
+    assert max(asyncio.run(run())) == CONFIG["openai"]["max_concurrency"]
+
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        ProviderPool(CONFIG).settings("nvidia")
@@ -0,0 +1,44 @@
+import pytest
+
+from backend.clients.registry import ProviderRegistry
+
+
+class FakeClient:
+    created = 0
+
+    def __init__(self, pool):
+        self.pool = pool
+        FakeClient.created += 1
+
+
+class OtherClient(FakeClient):
+    pass
+
+
+def make_registry():
+    return ProviderRegistry(pool="pool", providers={"openai": "tests.test_registry:FakeClient"})
+
+
+def test_clients_load_on_first_use_only():
+    registry = make_registry()
+    assert registry.loaded() == []
+    created = FakeClient.created
+    client = registry.get("openai")
+    assert registry.get("openai") is client
+    assert client.pool == "pool"
+    assert FakeClient.created == created + 1
+    assert registry.loaded() == ["openai"]
+
+
+def test_for_model_uses_the_models_provider():
+    registry = make_registry()
+    assert isinstance(registry.for_model("gpt-4"), FakeClient)
+    with pytest.raises(ValueError, match="Unknown provider: anthropic"):
+        registry.for_model("claude-3-opus")
+
+
+def test_register_replaces_a_loaded_provider():
+    registry = make_registry()
+    registry.get("openai")
+    registry.register("openai", "tests.test_registry:OtherClient")
+    assert isinstance(registry.get("openai"), OtherClient)
@@ -0,0 +1,83 @@
+import json
+
+from backend.config import HEALTH_CONFIG, ROUTER_CONFIG
+from backend.utils.health import HealthTracker
+from backend.utils.router import ModelRouter, QueryClassifier
+
+
+def make_router(**overrides):
+    health = HealthTracker(HEALTH_CONFIG)
+    return ModelRouter(health, {**ROUTER_CONFIG, "log_path": None, **overrides}), health
+
+
+def record(health, name, provider, latency, count=5):
+    for _ in range(count):
+        health.record({"name": name, "provider": provider}, ok=True, latency=latency)
+
+
+def test_classifier_orders_easy_below_hard():
+    classifier = QueryClassifier()
+    easy = classifier.complexity(classifier.features("Rewrite this headline", "social_media"))
+    hard = classifier.complexity(classifier.features(
+        "Plan our crisis strategy for the product recall: which stakeholders first, what are the legal risks, "
+        "and how do we compare against the breach investigation last year?", "crisis_manager"))
+    assert easy < 0.33 < 0.66 <= hard
+
+
+def test_easy_query_goes_to_fastest_model():
+    router, health = make_router()
+    record(health, "gpt-3.5-turbo", "openai", 0.5)
+    record(health, "gpt-4", "openai", 4.0)
+    decision = router.route("Rewrite this headline", "social_media", "gpt-4")
+    assert decision["tier"] == 1
+    assert decision["model"] == "gpt-3.5-turbo"
+
+
+def test_agent_minimum_tier_is_respected():
+    router, health = make_router()
+    record(health, "gpt-3.5-turbo", "openai", 0.1)
+    decision = router.route("Rewrite this headline", "crisis_manager", "gpt-4")
+    assert decision["tier"] >= 2
+    assert all(c["tier"] >= 2 for c in decision["candidates"])
+    assert decision["model"] != "gpt-3.5-turbo"
+
+
+def test_open_circuits_are_skipped_and_requested_model_is_the_last_resort():
+    router, health = make_router(model_tiers={"gpt-4": 3})
+    for _ in range(HEALTH_CONFIG["consecutive_failures"]):
+        health.record({"name": "gpt-4", "provider": "openai"}, ok=False)
+    decision = router.route("Rewrite this headline", None, "claude-3-opus")
+    assert decision["candidates"] == []
+    assert decision["model"] == "claude-3-opus"
+
+
+def test_models_of_an_unhealthy_provider_are_skipped():
+    router, health = make_router()
+    record(health, "gpt-3.5-turbo", "openai", 0.1)
+    record(health, "claude-3-sonnet", "anthropic", 1.0)
+    for _ in range(HEALTH_CONFIG["consecutive_failures"]):
+        # Failures of another OpenAI model open the provider's circuit too
+        health.record({"name": "gpt-4", "provider": "openai"}, ok=False)
+    decision = router.route("Rewrite this headline", "social_media", "gpt-4")
+    assert decision["model"] == "claude-3-sonnet"
+    assert not any(c["model"].startswith("gpt-") for c in decision["candidates"])
+
+
+def test_slow_provider_counts_against_its_models():
+    router, health = make_router(model_tiers={"claude-3-sonnet": 2, "nvidia/llama-3.1-nemotron-70b-instruct": 2})
+    record(health, "claude-3-sonnet", "anthropic", 1.0)
+    record(health, "nvidia/llama-3.1-nemotron-70b-instruct", "nvidia", 1.2)
+    # Another Anthropic model has been slow, so the provider as a whole is
+    record(health, "claude-3-opus", "anthropic", 8.0, count=20)
+    decision = router.route("Rewrite this headline", "social_media", "gpt-4")
+    assert decision["model"] == "nvidia/llama-3.1-nemotron-70b-instruct"
+
+
+def test_decisions_are_logged(tmp_path):
+    path = tmp_path / "routing.jsonl"
+    router, _ = make_router(log_path=str(path))
+    decision = router.route("Rewrite this headline", "social_media", "gpt-4")
+    router.log(decision, {"model": decision["model"], "status": "ok"})
+    line = json.loads(path.read_text())
+    assert line["requested"] == "gpt-4"
+    assert line["outcome"]["status"] == "ok"
@@ -0,0 +1,62 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+@pytest.fixture
+def supervisor(tmp_path):
+    port = free_port()
+    env = {**os.environ, "PR_AGENT_CACHE_DB": str(tmp_path / "cache.db"),
+           "PR_AGENT_CONVERSATION_DB": str(tmp_path / "conversations.db"),
+           "PR_AGENT_IMAGE_DIR": str(tmp_path / "images"), "PR_AGENT_BATCH_DIR": str(tmp_path / "batch"),
+           "PR_AGENT_BRAND_INDEX_DIR": str(tmp_path / "brand_index")}
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "run_servers.py"), "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "2", "--no-frontend", "--health-interval", "0.2", "--graceful-timeout", "2",
+         "--log-level", "warning"],
+        env=env, stderr=subprocess.DEVNULL
+    )
+    try:
+        yield process, f"http://127.0.0.1:{port}/healthz"
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def test_workers_serve_reload_and_drain(supervisor):
+    process, url = supervisor
+    assert wait_healthy(url)
+    process.send_signal(signal.SIGHUP)
+    # The listening socket is never closed during a rolling reload
+    for _ in range(20):
+        assert httpx.get(url, timeout=5.0).status_code == 200
+        time.sleep(0.1)
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=20) == 0
@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.utils.scheduler import RateLimited
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_estimate_tokens_uses_the_completion_cap_sent(make_scheduler):
+    messages = [{"role": "user", "content": "Draft a statement"}]
+    limiter = make_scheduler()
+    prompt = limiter.estimate_tokens(messages, 0)
+    assert limiter.estimate_tokens(messages, 1024) == prompt + 1024
+    assert limiter.estimate_tokens(messages) == prompt + 512
+
+
+def test_grants_immediately_with_capacity(make_scheduler):
+    async def main():
+        limiter = make_scheduler()
+        await limiter.acquire("openai", "gpt-4", 1000, priority=2)
+        return limiter.snapshot()
+
+    snapshot = run(main())
+    assert snapshot["granted"] == 1 and snapshot["queued"] == 0
+    assert snapshot["buckets"]["openai"]["tokens_available"] == pytest.approx(599000, abs=50)
+
+
+def test_refuses_when_capacity_comes_after_the_deadline(make_scheduler):
+    async def main():
+        limiter = make_scheduler(provider_limits={"openai": {"rpm": 60, "tpm": 6000}})
+        await limiter.acquire("openai", "gpt-4", 6000, priority=2)
+        with pytest.raises(RateLimited) as refused:
+            await limiter.acquire("openai", "gpt-4", 3000, priority=2, deadline=time.monotonic() + 0.1)
+        return refused.value
+
+    refused = run(main())
+    assert refused.retry_after == pytest.approx(30, abs=1)
+
+
+def test_reconcile_returns_unused_tokens(make_scheduler):
+    async def main():
+        limiter = make_scheduler(provider_limits={"openai": {"rpm": 60, "tpm": 6000}})
+        await limiter.acquire("openai", "gpt-4", 6000, priority=2)
+        limiter.reconcile("openai", "gpt-4", reserved=6000, used=500)
+        return limiter.snapshot()["buckets"]["openai"]["tokens_available"]
+
+    assert run(main()) == pytest.approx(5500, abs=5)
+
+
+def test_reconcile_wakes_queued_requests(make_scheduler):
+    async def main():
+        limiter = make_scheduler(provider_limits={"openai": {"rpm": 6000, "tpm": 600}})
+        await limiter.acquire("openai", "gpt-4", 600, priority=2)
+        waiting = asyncio.create_task(
+            limiter.acquire("openai", "gpt-4", 300, priority=2, deadline=time.monotonic() + 60)
+        )
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        started = time.monotonic()
+        limiter.reconcile("openai", "gpt-4", reserved=600, used=100)
+        await waiting
+        return time.monotonic() - started
+
+    assert run(main()) < 0.5
+
+
+def test_blocked_model_does_not_hold_up_other_models(make_scheduler):
+    async def main():
+        limiter = make_scheduler(model_limits={"gpt-4": {"rpm": 60, "tpm": 100000}})
+        await limiter.acquire("openai", "gpt-4", 100, priority=2)
+        # Waits about a second for gpt-4's own request bucket
+        blocked = asyncio.create_task(
+            limiter.acquire("openai", "gpt-4", 100, priority=0, deadline=time.monotonic() + 5)
+        )
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        await limiter.acquire("openai", "gpt-3.5-turbo", 100, priority=3, deadline=time.monotonic() + 0.2)
+        elapsed = time.monotonic() - started
+        blocked.cancel()
+        return elapsed
+
+    assert run(main()) < 0.1
+
+
+def test_queue_serves_higher_priority_first(make_scheduler):
+    async def main():
+        limiter = make_scheduler(provider_limits={"openai": {"rpm": 600, "tpm": 600000}})
+        # Drain the request bucket so everything after this queues (10 requests per second)
+        for _ in range(600):
+            await limiter.acquire("openai", "gpt-4", 1, priority=2)
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire("openai", "gpt-4", 1, priority, deadline=time.monotonic() + 5)
+            order.append(name)
+
+        low = asyncio.create_task(request("low", 3))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(request("high", 0))
+        await asyncio.gather(low, high)
+        return order
+
+    assert run(main()) == ["high", "low"]
+
+
+def test_disabled_scheduler_never_waits(make_scheduler):
+    async def main():
+        limiter = make_scheduler(enabled=False, provider_limits={"openai": {"rpm": 1, "tpm": 1}})
+        for _ in range(5):
+            await limiter.acquire("openai", "gpt-4", 10 ** 6, priority=2)
+
+    run(main())
+
+
+def test_cancelled_grant_returns_request_and_tokens(make_scheduler):
+    async def main():
+        limiter = make_scheduler(provider_limits={"openai": {"rpm": 60, "tpm": 6000}})
+        await limiter.acquire("openai", "gpt-4", 6000, priority=2)
+        waiting = asyncio.create_task(
+            limiter.acquire("openai", "gpt-4", 1000, priority=2, deadline=time.monotonic() + 60)
+        )
+        await asyncio.sleep(0.01)
+        before = limiter.snapshot()["buckets"]["openai"]
+        # The caller goes away (a disconnect, a lost hedge) just as the dispatcher grants its capacity
+        _, _, waiter = limiter._queues["openai/gpt-4"][0]
+        waiting.cancel()
+        limiter._take("openai", "gpt-4", waiter.tokens, time.monotonic())
+        waiter.future.set_result(None)
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return before, limiter.snapshot()["buckets"]["openai"]
+
+    before, after = run(main())
+    assert after["requests_available"] == pytest.approx(before["requests_available"], abs=0.1)
+    assert after["tokens_available"] == pytest.approx(before["tokens_available"], abs=5)
+
+
+def test_provider_capacity_goes_to_the_higher_priority_model_first(make_scheduler):
+    async def main():
+        limiter = make_scheduler(provider_limits={"openai": {"rpm": 6000, "tpm": 6000}})
+        await limiter.acquire("openai", "gpt-4", 6000, priority=2)
+        # Needs three seconds of provider tokens
+        crisis = asyncio.create_task(
+            limiter.acquire("openai", "gpt-4", 300, priority=0, deadline=time.monotonic() + 10)
+        )
+        await asyncio.sleep(0.6)
+        # Enough has refilled for this one, but it would take it from the crisis request
+        with pytest.raises(RateLimited) as refused:
+            await limiter.acquire("openai", "gpt-3.5-turbo", 50, priority=3, deadline=time.monotonic() + 0.2)
+        assert not crisis.done()
+        crisis.cancel()
+        return refused.value
+
+    assert run(main()).retry_after > 1
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend.utils.semantic_cache import SemanticCache, query_facts
+
+CONFIG = {
+    "enabled": True,
+    "dim": 512,
+    "capacity": 8,
+    "agent_thresholds": {"media_relations": 0.8},
+    "mmap_dir": None
+}
+
+ANSWER = {"content": "statement", "model_info": {"name": "gpt-4", "provider": "openai"}}
+
+
+def cached(query: str, lookup: str, agent_type: str = "media_relations"):
+    cache = SemanticCache(CONFIG)
+    cache.add(agent_type, "gpt-4", query, ANSWER, ttl=60)
+    return cache.lookup(agent_type, "gpt-4", lookup)
+
+
+def test_paraphrase_hits():
+    hit = cached("Draft a media statement about the Acme product recall",
+                 "Draft a media statement about the Acme product recall please")
+    assert hit is not None
+    assert hit["content"] == "statement"
+    assert hit["similarity"] >= CONFIG["agent_thresholds"]["media_relations"]
+
+
+@pytest.mark.parametrize("query, lookup", [
+    ("Our CEO was arrested for fraud this morning. Draft a holding statement for the press.",
+     "Our CFO was arrested for fraud this morning. Draft a holding statement for the press."),
+    ("Draft a media statement about the Acme product recall",
+     "Draft a media statement about the Globex product recall"),
+    ("Announce that we will recall the X200 blender this week",
+     "Announce that we will not recall the X200 blender this week"),
+    ("Write a release saying third quarter revenue grew 12% year over year",
+     "Write a release saying third quarter revenue grew 21% year over year")
+])
+def test_near_duplicates_with_different_facts_miss(query, lookup):
+    assert cached(query, lookup) is None
+
+
+def test_agents_without_threshold_never_hit():
+    query = "Our CEO was arrested for fraud this morning. Draft a holding statement."
+    assert cached(query, query, agent_type="crisis_manager") is None
+
+
+def test_disabled_by_default_config():
+    cache = SemanticCache({**CONFIG, "enabled": False})
+    cache.add("media_relations", "gpt-4", "hello", ANSWER, ttl=60)
+    assert cache.lookup("media_relations", "gpt-4", "hello") is None
+
+
+def test_query_facts():
+    numbers, names, negations = query_facts("Should Acme's CEO resign? We won't comment on the $2.5 million fine.")
+    assert numbers == ("2.5",)
+    assert names == ("acme", "ceo")
+    assert negations == ("not",)
+    # Capitalized only because it starts a sentence
+    assert query_facts("Write a tweet. Draft a reply.") == ((), (), ())
+
+
+def test_memory_mapped_files_are_removed(tmp_path):
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True)
+    stale = tmp_path / f"media_relations-gpt-4-{exited.stdout.strip()}.f32"
+    stale.write_bytes(b"")
+    cache = SemanticCache({**CONFIG, "mmap_dir": str(tmp_path)})
+    assert not stale.exists()
+
+    cache.add("media_relations", "gpt-4", "Draft a media statement", ANSWER, ttl=60)
+    assert os.listdir(tmp_path) == [f"media_relations-gpt-4-{os.getpid()}.f32"]
+    cache.close()
+    assert os.listdir(tmp_path) == []
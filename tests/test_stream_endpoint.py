@@ -0,0 +1,49 @@
+import json
+import uuid
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.utils.failover import AllModelsFailed
+
+
+def events(text):
+    parsed = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+def post_stream(monkeypatch, fake_stream):
+    monkeypatch.setattr(main.failover_handler, "stream_with_fallback", fake_stream)
+    # A fresh query each time, so no cached answer is replayed
+    body = {"query": f"Draft a launch tweet {uuid.uuid4().hex}", "agent_type": "social_media", "model": "gpt-4"}
+    response = TestClient(main.app).post("/api/pr-agent/stream", json=body)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return events(response.text)
+
+
+def test_tokens_then_done(monkeypatch):
+    async def fake_stream(messages, model_config, info):
+        info["model_info"] = {"name": "gpt-4", "provider": "openai"}
+        info["usage"] = {"input_tokens": 12, "output_tokens": 3}
+        for delta in ("Big ", "news ", "today"):
+            yield delta
+
+    stream = post_stream(monkeypatch, fake_stream)
+    assert [data["delta"] for event, data in stream if event == "token"] == ["Big ", "news ", "today"]
+    event, done = stream[-1]
+    assert event == "done" and done["status"] == "success"
+    assert done["model_info"]["name"] == "gpt-4"
+    assert done["usage"] == {"input_tokens": 12, "output_tokens": 3}
+
+
+def test_failure_becomes_an_error_event(monkeypatch):
+    async def fake_stream(messages, model_config, info):
+        raise AllModelsFailed(TimeoutError(), attempts=5)
+        yield
+
+    stream = post_stream(monkeypatch, fake_stream)
+    assert stream == [("error", {**stream[0][1], "status": "error", "error_class": "timeout"})]
@@ -0,0 +1,59 @@
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+
+
+def events(text):
+    parsed = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+@pytest.fixture
+def requested_models(monkeypatch):
+    requested = {}
+
+    async def fake_stream(messages, model_config, info=None):
+        agent = messages[0]["content"]
+        requested[agent] = model_config["name"]
+        info["model_info"] = {"name": model_config["name"], "provider": "mock"}
+        yield "draft"
+
+    monkeypatch.setattr(main.failover_handler, "stream_with_fallback", fake_stream)
+    return requested
+
+
+def war_room(**body):
+    return TestClient(main.app).post("/api/pr-agent/war-room", json={"query": f"Plant fire {uuid.uuid4()}", **body})
+
+
+def test_agent_models_map_to_configured_chat_models(requested_models):
+    response = war_room(agent_types=["content_strategist", "analytics_expert"], synthesize=True)
+    assert response.status_code == 200
+    parsed = events(response.text)
+    assert parsed[-1][0] == "done" and parsed[-1][1]["status"] == "success"
+    # gpt-4-turbo is not configured, so it goes through MODEL_ALIASES; claude-3 is a MODELS key
+    assert sorted(requested_models.values()) == ["claude-3", "gpt-4", "gpt-4"]
+
+
+def test_image_only_agents_are_rejected(requested_models):
+    response = war_room(agent_types=["crisis_manager", "visual_creator"])
+    assert response.status_code == 400
+    assert "visual_creator" in response.json()["detail"]
+    assert requested_models == {}
+
+
+@pytest.mark.parametrize("field", ["model", "synthesis_model"])
+def test_unknown_models_are_rejected(requested_models, field):
+    response = war_room(agent_types=["crisis_manager"], **{field: "dall-e-3"})
+    assert response.status_code == 400
+
+
+def test_unknown_agents_are_rejected():
+    assert war_room(agent_types=["press_secretary"]).status_code == 400
@@ -1 +0,0 @@
-# Empty file - just needs to exist 
\ No newline at end of file
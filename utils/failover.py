@@ -1,8 +0,0 @@
-class FailoverHandler:
-    async def generate_with_fallback(self, messages, model_config):
-        # Basic implementation - you can expand this later
-        try:
-            # Placeholder for actual model interaction
-            return "This is a placeholder response. Implement your model logic here."
-        except Exception as e:
-            raise Exception(f"Failed to generate response: {str(e)}") 
\ No newline at end of file